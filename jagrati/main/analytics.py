@@ -0,0 +1,254 @@
+import datetime
+
+import numpy as np
+
+from .models import Attendance, StudentProfile
+
+LOAD_CHUNK_SIZE = 20000
+AT_RISK_MIN_PERCENTAGE = 60
+AT_RISK_MAX_ABSENCES = 3
+REPORT_DEFAULT_DAYS = 180
+
+
+class AttendanceMatrix(object):
+    """
+    Attendance of students over a date range as boolean student × date matrices.
+    Rows follow `user_ids` (sorted), columns follow `dates` (sorted date ordinals of
+    every day with attendance in the range). `present` holds regular classes, `extra`
+    holds extra classes, `is_active` flags the students who are still active.
+    """
+
+    def __init__(self, user_ids, class_ids, names, dates, present, extra, is_active=None):
+        self.user_ids = user_ids
+        self.class_ids = class_ids
+        self.names = names
+        self.dates = dates
+        self.present = present
+        self.extra = extra
+        self.is_active = np.ones(len(user_ids), dtype=bool) if is_active is None else is_active
+
+
+def load_attendance(start, end, class_id=None, include_inactive=False):
+    """
+    :desc: Loads the students and their attendance between `start` and `end` into an
+           `AttendanceMatrix`. Rows are streamed in chunks straight into fixed-type
+           arrays, no model instance or per-row Python list is built.
+    :param: `start`, `end` dates of the range, both included
+            `class_id` restricts the matrix to the students of one class
+            `include_inactive` keeps the students deactivated for not attending
+    """
+
+    students = StudentProfile.objects.all()
+    attendance = Attendance.objects.filter(
+        class_date__gte=start,
+        class_date__lte=end,
+        user__student_profile__isnull=False
+    )
+    if not include_inactive:
+        students = students.filter(user__is_active=True)
+        attendance = attendance.filter(user__is_active=True)
+    if class_id is not None:
+        students = students.filter(_class_id=class_id)
+        attendance = attendance.filter(user__student_profile___class_id=class_id)
+
+    names = []
+
+    def student_values():
+        rows = students.order_by('user_id').values_list(
+            'user_id', '_class_id', 'user__is_active', 'user__first_name', 'user__last_name'
+        )
+        for user_id, _class_id, is_active, first_name, last_name in rows.iterator():
+            names.append((first_name, last_name))
+            yield user_id
+            yield _class_id
+            yield is_active
+
+    def attendance_values():
+        rows = attendance.order_by().values_list('user_id', 'class_date', 'is_extra_class')
+        for user_id, class_date, is_extra_class in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            yield user_id
+            yield class_date.toordinal()
+            yield is_extra_class
+
+    student_columns = np.fromiter(student_values(), dtype=np.int64).reshape(-1, 3).T
+    attendance_columns = np.fromiter(attendance_values(), dtype=np.int64).reshape(-1, 3).T
+
+    return build_matrix(
+        np.ascontiguousarray(student_columns[0]),
+        np.ascontiguousarray(student_columns[1]),
+        names,
+        np.ascontiguousarray(attendance_columns[0]),
+        np.ascontiguousarray(attendance_columns[1]),
+        attendance_columns[2].astype(bool),
+        student_columns[2].astype(bool)
+    )
+
+
+def build_matrix(user_ids, class_ids, names, attended_user_ids, attended_dates, is_extra,
+                 is_active=None):
+    """
+    :desc: Scatters attendance rows into student × date matrices.
+    :param: `user_ids` sorted array of student user IDs and `class_ids` their classes
+            `attended_user_ids`, `attended_dates`, `is_extra` columns of the attendance rows
+            `is_active` whether each student is active, all of them when `None`
+    """
+
+    dates = np.unique(attended_dates)
+    rows = np.searchsorted(user_ids, attended_user_ids)
+    known = rows < len(user_ids)
+    known[known] = user_ids[rows[known]] == attended_user_ids[known]
+    columns = np.searchsorted(dates, attended_dates)
+
+    present = np.zeros((len(user_ids), len(dates)), dtype=bool)
+    extra = np.zeros((len(user_ids), len(dates)), dtype=bool)
+    regular = known & ~is_extra
+    present[rows[regular], columns[regular]] = True
+    extra[rows[known & is_extra], columns[known & is_extra]] = True
+
+    return AttendanceMatrix(user_ids, class_ids, names, dates, present, extra, is_active)
+
+
+def run_lengths(hits, expected):
+    """
+    :desc: Length of the run of consecutive `hits` ending on every day. Days that are
+           not `expected` neither extend nor break a run.
+    :param: `hits`, `expected` boolean matrices of the same shape
+    :return: integer matrix of run lengths
+    """
+
+    counted = np.cumsum(hits & expected, axis=1)
+    breaks = expected & ~hits
+    last_break = np.maximum.accumulate(np.where(breaks, counted, 0), axis=1)
+    return counted - last_break
+
+
+def one_hot(indices, size):
+    return (indices[None, :] == np.arange(size)[:, None]).astype(np.float64)
+
+
+def compute_metrics(matrix):
+    """
+    :desc: Computes every metric in whole-matrix operations. A student is expected on
+           the days their class was held, i.e. any student of the class attended a
+           regular class that day.
+    :return: `dict` of per-student arrays and per-class arrays
+    """
+
+    classes, class_index = np.unique(matrix.class_ids, return_inverse=True)
+    num_dates = len(matrix.dates)
+    class_matrix = one_hot(class_index, len(classes))
+
+    class_present = class_matrix.dot(matrix.present).astype(np.int64)
+    class_days = class_present > 0
+    expected = class_days[class_index]
+
+    days_present = matrix.present.sum(axis=1)
+    num_class_days = expected.sum(axis=1)
+    percentage = np.where(num_class_days > 0, 100.0 * days_present / np.maximum(num_class_days, 1), 0.0)
+
+    if num_dates:
+        streaks = run_lengths(matrix.present, expected)
+        absences = run_lengths(expected & ~matrix.present, expected)
+        longest_streak = streaks.max(axis=1)
+        current_streak = streaks[:, -1]
+        current_absences = absences[:, -1]
+    else:
+        longest_streak = current_streak = current_absences = np.zeros(len(matrix.user_ids), dtype=np.int64)
+
+    num_students = np.bincount(class_index, minlength=len(classes))
+    class_percentage = np.bincount(class_index, weights=percentage, minlength=len(classes))
+    dates = [datetime.date.fromordinal(int(ordinal)) for ordinal in matrix.dates]
+    months, month_index = np.unique(
+        np.array([date.year * 12 + date.month - 1 for date in dates], dtype=np.int64),
+        return_inverse=True
+    )
+    month_matrix = one_hot(month_index, len(months)).T
+    monthly_present = class_present.dot(month_matrix)
+    monthly_days = class_days.astype(np.float64).dot(month_matrix)
+    monthly_expected = monthly_days * num_students[:, None]
+
+    return {
+        'days_present': days_present,
+        'num_class_days': num_class_days,
+        'percentage': percentage,
+        'extra_days': matrix.extra.sum(axis=1),
+        'longest_streak': longest_streak,
+        'current_streak': current_streak,
+        'current_absences': current_absences,
+        'classes': classes,
+        'num_students': num_students,
+        'class_num_days': class_days.sum(axis=1),
+        'class_percentage': class_percentage / np.maximum(num_students, 1),
+        'months': months,
+        'monthly_percentage': np.where(
+            monthly_expected > 0,
+            100.0 * monthly_present / np.maximum(monthly_expected, 1),
+            0.0
+        ),
+    }
+
+
+def get_student_report(matrix, metrics, indices=None):
+    """
+    :desc: Per-student metrics, for the rows in `indices` or every student.
+    :return: list of `dict`
+    """
+
+    if indices is None:
+        indices = np.arange(len(matrix.user_ids))
+
+    columns = {
+        'user_id': matrix.user_ids[indices].tolist(),
+        'class_id': matrix.class_ids[indices].tolist(),
+        'is_active': matrix.is_active[indices].tolist(),
+        'days_present': metrics['days_present'][indices].tolist(),
+        'num_class_days': metrics['num_class_days'][indices].tolist(),
+        'percentage': np.round(metrics['percentage'][indices], 2).tolist(),
+        'extra_days': metrics['extra_days'][indices].tolist(),
+        'longest_streak': metrics['longest_streak'][indices].tolist(),
+        'current_streak': metrics['current_streak'][indices].tolist(),
+        'current_absences': metrics['current_absences'][indices].tolist(),
+    }
+
+    report = []
+    for position, index in enumerate(np.asarray(indices).tolist()):
+        row = {name: values[position] for name, values in columns.items()}
+        row['first_name'], row['last_name'] = matrix.names[index]
+        report.append(row)
+
+    return report
+
+
+def get_class_report(metrics):
+    """
+    :desc: Per-class metrics with the attendance percentage of every month.
+    :return: list of `dict`
+    """
+
+    months = ['{:04d}-{:02d}'.format(month // 12, month % 12 + 1) for month in metrics['months'].tolist()]
+    monthly = np.round(metrics['monthly_percentage'], 2).tolist()
+    percentage = np.round(metrics['class_percentage'], 2).tolist()
+    num_students = metrics['num_students'].tolist()
+    num_days = metrics['class_num_days'].tolist()
+
+    return [{
+        'class_id': class_id,
+        'num_students': num_students[index],
+        'num_class_days': num_days[index],
+        'percentage': percentage[index],
+        'monthly': [{'month': month, 'percentage': value} for month, value in zip(months, monthly[index])],
+    } for index, class_id in enumerate(metrics['classes'].tolist())]
+
+
+def get_at_risk_indices(metrics, min_percentage=AT_RISK_MIN_PERCENTAGE, max_absences=AT_RISK_MAX_ABSENCES):
+    """
+    :desc: Students below `min_percentage`, or absent from the last `max_absences` or
+           more classes, lowest percentage first.
+    :return: array of row indices
+    """
+
+    at_risk = (metrics['num_class_days'] > 0) & (
+        (metrics['percentage'] < min_percentage) | (metrics['current_absences'] >= max_absences)
+    )
+    indices = np.flatnonzero(at_risk)
+    return indices[np.argsort(metrics['percentage'][indices], kind='mergesort')]
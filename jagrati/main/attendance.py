@@ -0,0 +1,219 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import bump_model_version
+from .models import Attendance, AttendanceSummary, ClassDay
+
+# keeps IN lists and multi-row INSERTs below backend parameter limits
+IN_QUERY_CHUNK_SIZE = 500
+BULK_CREATE_BATCH_SIZE = 500
+
+
+def chunks(items, size=IN_QUERY_CHUNK_SIZE):
+    items = list(items)
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def _summary_counts():
+    """
+    :desc: Aggregates used to compute `AttendanceSummary` fields from `Attendance` rows.
+    """
+
+    return {
+        'num_days': Count('class_date', distinct=True),
+        'num_class_days': Count('class_date', distinct=True, filter=Q(is_extra_class=False)),
+        'num_extra_class_days': Count('class_date', distinct=True, filter=Q(is_extra_class=True)),
+        'last_attended_date': Max('class_date'),
+    }
+
+
+def get_attendance_summary(user):
+    """
+    :desc: Returns the attendance summary of `user`, `None` if the user never attended.
+    :param: `user` User instance
+    """
+
+    try:
+        return user.attendance_summary
+    except AttendanceSummary.DoesNotExist:
+        return None
+
+
+def get_total_classes(context):
+    """
+    :desc: Number of distinct class days, counted once per serializer context.
+    :param: `context` serializer context `dict`
+    """
+
+    if 'total_classes' not in context:
+        context['total_classes'] = ClassDay.objects.count()
+
+    return context['total_classes']
+
+
+def get_attendees(user_ids):
+    """
+    :desc: Loads the users who can be marked present, with one IN query per chunk.
+    :param: `user_ids` iterable of user IDs
+    :return: `dict` of user ID to a tuple of (is volunteer, class ID of the student)
+    """
+
+    attendees = {}
+
+    for chunk in chunks(set(user_ids)):
+        rows = User.objects.filter(id__in=chunk).values_list(
+            'id', 'is_staff', 'is_superuser', 'student_profile___class_id'
+        )
+        for user_id, is_staff, is_superuser, class_id in rows:
+            attendees[user_id] = (is_staff or is_superuser, class_id)
+
+    return attendees
+
+
+def record_attendance(class_date, user_ids, extra_user_ids):
+    """
+    :desc: Inserts the attendance of `class_date` which is not already stored and
+           incrementally updates the summaries of the attending users. Submitting
+           the same attendance again creates nothing.
+    :param: `class_date` date of the class
+            `user_ids` list of user IDs present in the class
+            `extra_user_ids` list of user IDs present in the extra class
+    :return: list of created `Attendance` objects
+    """
+
+    user_ids = set(user_ids)
+    extra_user_ids = set(extra_user_ids)
+
+    try:
+        return _record_attendance(class_date, user_ids, extra_user_ids)
+    except IntegrityError:
+        # a concurrent submission stored some of the same rows, the retry skips them
+        return _record_attendance(class_date, user_ids, extra_user_ids)
+
+
+def _record_attendance(class_date, user_ids, extra_user_ids):
+    with transaction.atomic():
+        # locks the users in ID order, so of two submissions for the same user the
+        # second reads the rows of the first one below and counts its day only once.
+        # Locking the summaries would miss users who have none yet.
+        for chunk in chunks(sorted(user_ids | extra_user_ids)):
+            list(User.objects.select_for_update().filter(id__in=chunk).order_by('id').values_list('id'))
+
+        existing = set()
+        for chunk in chunks(user_ids | extra_user_ids):
+            existing.update(Attendance.objects.filter(
+                class_date=class_date,
+                user_id__in=chunk
+            ).values_list('user_id', 'is_extra_class'))
+
+        attendance_objs = [
+            Attendance(user_id=user_id, class_date=class_date)
+            for user_id in sorted(user_ids) if (user_id, False) not in existing
+        ]
+        attendance_objs += [
+            Attendance(user_id=user_id, class_date=class_date, is_extra_class=True)
+            for user_id in sorted(extra_user_ids) if (user_id, True) not in existing
+        ]
+
+        Attendance.objects.bulk_create(attendance_objs, batch_size=BULK_CREATE_BATCH_SIZE)
+        _update_summaries(class_date, existing, user_ids, extra_user_ids)
+
+        if attendance_objs:
+            ClassDay.objects.get_or_create(date=class_date)
+            transaction.on_commit(lambda: bump_model_version(Attendance))
+
+    return attendance_objs
+
+
+def _update_summaries(class_date, existing, user_ids, extra_user_ids):
+    """
+    :desc: Increments the summary counters of users who had no attendance of the
+           same kind on `class_date` before this insert.
+    :param: `existing` set of `(user_id, is_extra_class)` already stored for `class_date`
+    """
+
+    attended_before = {user_id for user_id, _ in existing}
+    increments = defaultdict(list)
+
+    for user_id in user_ids | extra_user_ids:
+        key = (
+            int(user_id not in attended_before),
+            int(user_id in user_ids and (user_id, False) not in existing),
+            int(user_id in extra_user_ids and (user_id, True) not in existing),
+        )
+        if any(key):
+            increments[key].append(user_id)
+
+    if not increments:
+        return
+
+    changed_user_ids = [user_id for group in increments.values() for user_id in group]
+    summarised = set()
+    for chunk in chunks(changed_user_ids):
+        summarised.update(AttendanceSummary.objects.filter(
+            user_id__in=chunk
+        ).values_list('user_id', flat=True))
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(user_id=user_id)
+        for user_id in changed_user_ids if user_id not in summarised
+    ], batch_size=BULK_CREATE_BATCH_SIZE)
+
+    date_value = Value(class_date, output_field=DateField())
+    for (num_days, num_class_days, num_extra_class_days), group in increments.items():
+        for chunk in chunks(group):
+            AttendanceSummary.objects.filter(user_id__in=chunk).update(
+                num_days=F('num_days') + num_days,
+                num_class_days=F('num_class_days') + num_class_days,
+                num_extra_class_days=F('num_extra_class_days') + num_extra_class_days,
+                last_attended_date=Greatest(Coalesce('last_attended_date', date_value), date_value)
+            )
+
+
+def refresh_attendance_summary(user_id, class_date):
+    """
+    :desc: Recomputes the summary of one user, creating it on the first attendance,
+           and drops `class_date` from the class days if no attendance is left on it.
+    """
+
+    counts = Attendance.objects.filter(user_id=user_id).aggregate(**_summary_counts())
+    if not AttendanceSummary.objects.filter(user_id=user_id).update(**counts) and counts['num_days']:
+        AttendanceSummary.objects.create(user_id=user_id, **counts)
+
+    if not Attendance.objects.filter(class_date=class_date).exists():
+        ClassDay.objects.filter(date=class_date).delete()
+
+
+def rebuild_attendance_summaries(chunk_size=1000):
+    """
+    :desc: Rebuilds all summaries and class days from the `Attendance` table.
+    :return: tuple of number of summaries and class days written
+    """
+
+    num_summaries = 0
+
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        ClassDay.objects.all().delete()
+
+        rows = Attendance.objects.order_by().values('user_id').annotate(**_summary_counts())
+        batch = []
+        for row in rows.iterator():
+            batch.append(AttendanceSummary(**row))
+            if len(batch) >= chunk_size:
+                AttendanceSummary.objects.bulk_create(batch)
+                num_summaries += len(batch)
+                batch = []
+
+        AttendanceSummary.objects.bulk_create(batch)
+        num_summaries += len(batch)
+
+        dates = Attendance.objects.order_by().values_list('class_date', flat=True).distinct()
+        class_days = [ClassDay(date=date) for date in dates]
+        ClassDay.objects.bulk_create(class_days, batch_size=chunk_size)
+
+    return num_summaries, len(class_days)
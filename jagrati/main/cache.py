@@ -0,0 +1,210 @@
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import FileField
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .models import (Attendance, Class, ClassFeedback, Config, Event, Hobby, JoinRequest,
+                     Notification, Skill, StudentFeedback, StudentProfile, Subject, Syllabus,
+                     UserHobby, UserProfile, UserSkill, VolunteerClass, VolunteerSubject, )
+from .routers import reads_from_replica
+from .storage import get_signature_timestamp
+
+VERSION_KEY = 'version:{}'
+CHANGED_AT_KEY = 'changed_at:{}'
+RESPONSE_KEY = 'response:{}:{}:{}'
+
+# Models whose versions are tracked, i.e. the ones served or nested by the viewsets
+VERSIONED_MODELS = (Attendance, Class, ClassFeedback, Config, Event, Hobby, JoinRequest,
+                    Notification, Skill, StudentFeedback, StudentProfile, Subject, Syllabus,
+                    User, UserHobby, UserProfile, UserSkill, VolunteerClass, VolunteerSubject, )
+
+
+def get_model_version(model):
+    """
+    :desc: Version number of `model`, bumped on every change to its rows. A missing
+           version starts from the current time in milliseconds rather than 1, so a
+           cleared cache cannot hand out a version seen before the clear.
+    :param: `model` Model class
+    """
+
+    key = VERSION_KEY.format(model._meta.label_lower)
+    version = cache.get(key)
+
+    if version is None:
+        initial = int(time.time() * 1000)
+        cache.add(key, initial, None)
+        version = cache.get(key, initial)
+
+    return version
+
+
+def get_model_changed_at(model):
+    """
+    :desc: Time of the last change to `model`, the time it was first asked for if no
+           change was recorded since the cache was cleared.
+    """
+
+    key = CHANGED_AT_KEY.format(model._meta.label_lower)
+    changed_at = cache.get(key)
+
+    if changed_at is None:
+        changed_at = timezone.now()
+        cache.add(key, changed_at, None)
+
+    return changed_at
+
+
+def bump_model_version(model):
+    """
+    :desc: Invalidates every cached response and validator built from `model`. Called
+           by the post_save / post_delete receiver in `models.py`, and explicitly after
+           `QuerySet.update` or `bulk_create`, which send no signals.
+    :param: `model` Model class
+    """
+
+    key = VERSION_KEY.format(model._meta.label_lower)
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, get_model_version(model) + 1, None)
+
+    cache.set(CHANGED_AT_KEY.format(model._meta.label_lower), timezone.now(), None)
+
+
+def get_media_window(models):
+    """
+    :desc: Signing time of the media URLs in responses built from `models`, 0 when
+           they have no file field. Responses are cached and validated under it, so
+           none outlives the signatures of its URLs.
+    """
+
+    if any(isinstance(field, FileField) for model in models for field in model._meta.get_fields()):
+        return get_signature_timestamp()
+    return 0
+
+
+def may_be_stale(models):
+    """
+    :desc: Whether a response built from `models` was read from a replica which may not
+           have caught up with a recent change to one of them. Such a response is not
+           cached, nor validated, under the new versions.
+    """
+
+    if not models or not reads_from_replica():
+        return False
+
+    window = datetime.timedelta(seconds=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+    changed_at = max(get_model_changed_at(model) for model in models)
+    return timezone.now() - changed_at < window
+
+
+class ConditionalGetMixin(object):
+    """
+    Adds `ETag` and `Last-Modified` to `list` and `retrieve` responses and answers
+    `If-None-Match` / `If-Modified-Since` with 304 before anything is serialized.
+    The validators come from the versions and change times of the viewset model and
+    of `cache_models`, the models nested in its responses, read from the cache
+    without a query, and change with the signing time of the media URLs.
+    """
+
+    cache_models = ()
+
+    def get_validator_models(self):
+        model = self.get_queryset().model
+        return [model] + [dependency for dependency in self.cache_models if dependency is not model]
+
+    def get_validators(self, request, models):
+        """
+        :return: tuple of ETag and Last-Modified timestamp
+        """
+
+        media_window = get_media_window(models)
+        state = '{}|{}|{}|{}'.format(
+            request.get_full_path(),
+            request.user.pk,
+            '.'.join(str(get_model_version(model)) for model in models),
+            media_window
+        )
+        etag = hashlib.md5(state.encode('utf-8')).hexdigest()
+        changed_at = max(get_model_changed_at(model) for model in models)
+
+        return quote_etag(etag), max(int(changed_at.timestamp()), media_window)
+
+    def get_conditional_response(self, request, get_response):
+        models = self.get_validator_models()
+        if may_be_stale(models):
+            return get_response()
+
+        etag, last_modified = self.get_validators(request, models)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+        if response is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+class CachedResponseMixin(object):
+    """
+    Caches `list` and `retrieve` responses of a viewset. The cache key holds the
+    versions of `cache_models`, the models the response is built from, so a change to
+    any of them makes the next request miss instead of serving stale data.
+    """
+
+    cache_models = ()
+
+    def get_response_cache_key(self, request):
+        versions = '.'.join(str(get_model_version(model)) for model in self.cache_models)
+        versions = '{}.{}'.format(versions, get_media_window(self.cache_models))
+        return RESPONSE_KEY.format(self.basename, request.get_full_path(), versions)
+
+    def get_cached_response(self, request, get_response):
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+
+        if data is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+            data = response.data
+            if not may_be_stale(self.cache_models):
+                cache.set(key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 86400))
+
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request,
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request,
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_MEMORY_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    :desc: Warns when the default cache is local to each process. Model versions, cached
+           responses, replica pins and token revocations would then not reach the other
+           workers, which keep serving stale data.
+    """
+
+    if getattr(settings, 'TESTING', False):
+        return []
+
+    if settings.CACHES.get('default', {}).get('BACKEND') != LOCAL_MEMORY_CACHE:
+        return []
+
+    return [Warning(
+        'The default cache is local to each process.',
+        hint='Set CACHE_URL to a cache shared by every worker, e.g. filecache:// or memcache://.',
+        id='main.W001',
+    )]
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.generic.http import AsyncHttpConsumer
+from channels.http import AsgiHandler, AsgiRequest
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signals
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponseBadRequest, QueryDict
+from django.urls import set_script_prefix
+
+from .cache import get_model_version
+from .models import Attendance, Class, Event, Notification, StudentProfile, VolunteerClass
+
+logger = logging.getLogger(__name__)
+
+VERSION_HEADER = 'X-Feed-Version'
+
+_executor = None
+_executor_lock = threading.Lock()
+_handler = None
+_handler_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASGI_THREADS', 8))
+        return _executor
+
+
+def get_handler():
+    """
+    :desc: Django request handler of this process with the middleware loaded once,
+           shared by the threads of the executor.
+    """
+
+    global _handler
+
+    with _handler_lock:
+        if _handler is None:
+            handler = BaseHandler()
+            handler.load_middleware()
+            _handler = handler
+        return _handler
+
+
+def run_blocking(func, *args):
+    """
+    :desc: Runs `func` in the bounded executor, so no more than `ASGI_THREADS` ORM
+           queries, SMTP calls or file reads of a process block at the same time.
+           Connections the call opened are closed (or returned to the pool) after it.
+    :return: awaitable of the result of `func`
+    """
+
+    def call():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return asyncio.get_event_loop().run_in_executor(get_executor(), call)
+
+
+def get_versions(models):
+    return {model: get_model_version(model) for model in models}
+
+
+def format_version(versions, models):
+    version = '-'.join(str(versions[model]) for model in models)
+    if len(models) > 1:
+        version = hashlib.sha1(version.encode('ascii')).hexdigest()[:16]
+    return version
+
+
+class VersionWatcher(object):
+    """
+    Wakes long-polling requests when a model they watch changes. A single task per
+    process reads the versions of the watched models every `LONG_POLL_INTERVAL`
+    seconds while requests are waiting, so an idle client holds no thread, no
+    database connection and causes no query of its own.
+    """
+
+    def __init__(self):
+        self.models = set()
+        self.versions = {}
+        self.num_waiting = 0
+        self.condition = None
+        self.task = None
+
+    def get_version(self, models):
+        if any(model not in self.versions for model in models):
+            return None
+
+        return format_version(self.versions, models)
+
+    async def wait(self, models, version, timeout):
+        """
+        :desc: Waits up to `timeout` seconds for the versions of `models` to differ
+               from `version`.
+        :return: the new version, or `None` when nothing changed in time
+        """
+
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+
+        self.models.update(models)
+        self.num_waiting += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.poll())
+
+        if self.get_version(models) != version:
+            # versions read before this request started may be older than `version`
+            versions = await run_blocking(get_versions, list(models))
+            self.versions = dict(self.versions)
+            self.versions.update(versions)
+
+        def changed():
+            current = self.get_version(models)
+            return current is not None and current != version
+
+        try:
+            async with self.condition:
+                await asyncio.wait_for(self.condition.wait_for(changed), timeout)
+                return self.get_version(models)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.num_waiting -= 1
+
+    async def poll(self):
+        interval = getattr(settings, 'LONG_POLL_INTERVAL', 1)
+
+        while self.num_waiting:
+            try:
+                versions = await run_blocking(get_versions, list(self.models))
+            except Exception:
+                logger.exception('Could not read the model versions')
+            else:
+                if versions != self.versions:
+                    self.versions = versions
+                    async with self.condition:
+                        self.condition.notify_all()
+
+            await asyncio.sleep(interval)
+
+        # read again by the next waiter, nothing tracks the changes meanwhile
+        self.versions = {}
+
+
+watcher = VersionWatcher()
+
+
+class DjangoConsumer(AsyncHttpConsumer):
+    """
+    Serves a request with the regular Django handler, URL resolution and middleware
+    included, in the bounded executor instead of the unbounded thread pool of
+    `channels.http.AsgiHandler`.
+    """
+
+    async def handle(self, body):
+        await run_blocking(self.respond, body, asyncio.get_event_loop(), {})
+
+    def get_response(self, body):
+        set_script_prefix(self.scope.get('root_path', '') or '')
+        signals.request_started.send(sender=self.__class__, scope=self.scope)
+
+        try:
+            request = AsgiRequest(self.scope, body)
+        except UnicodeDecodeError:
+            logger.warning('Bad Request (UnicodeDecodeError)', exc_info=sys.exc_info(),
+                           extra={'status_code': 400})
+            return HttpResponseBadRequest()
+
+        response = get_handler().get_response(request)
+        if isinstance(response, FileResponse):
+            response.block_size = AsgiHandler.chunk_size
+        return response
+
+    def respond(self, body, loop, headers):
+        """
+        :desc: Runs in an executor thread, from the request to the last message sent,
+               as streaming responses (media, exports) read while they are sent.
+        :param: `headers` extra response headers
+        """
+
+        response = self.get_response(body)
+        try:
+            for key, value in headers.items():
+                response[key] = value
+            for message in AsgiHandler.encode_response(response):
+                asyncio.run_coroutine_threadsafe(self.send(message), loop).result()
+        finally:
+            # sends request_finished, closing the connections of this thread
+            response.close()
+
+
+class FeedConsumer(DjangoConsumer):
+    """
+    Read endpoint polled by the apps, answered like any other request with the
+    version of `watch_models` in the `X-Feed-Version` header. A GET with
+    `?wait=<seconds>&version=<X-Feed-Version>` is held until one of them changes, at
+    most `LONG_POLL_MAX_WAIT` seconds, so clients poll once a minute rather than
+    every few seconds without seeing updates later.
+    """
+
+    watch_models = ()
+
+    def get_wait(self):
+        if self.scope['method'] not in ('GET', 'HEAD'):
+            return 0, None
+
+        query = QueryDict(self.scope.get('query_string', b''))
+        try:
+            wait = int(query.get('wait', 0))
+        except ValueError:
+            wait = 0
+
+        return min(max(wait, 0), getattr(settings, 'LONG_POLL_MAX_WAIT', 60)), query.get('version')
+
+    async def handle(self, body):
+        loop = asyncio.get_event_loop()
+        version = format_version(await run_blocking(get_versions, self.watch_models),
+                                 self.watch_models)
+
+        wait, known = self.get_wait()
+        if wait and known == version:
+            version = await watcher.wait(self.watch_models, version, wait) or version
+
+        await run_blocking(self.respond, body, loop, {VERSION_HEADER: version})
+
+
+class NotificationFeedConsumer(FeedConsumer):
+    watch_models = (Notification, )
+
+
+class EventFeedConsumer(FeedConsumer):
+    watch_models = (Event, )
+
+
+class ClassFeedConsumer(FeedConsumer):
+    # the models ClassViewSet caches its responses by
+    watch_models = (Class, StudentProfile, User, VolunteerClass, Attendance, )
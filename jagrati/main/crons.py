@@ -1,29 +1,78 @@
-from datetime import datetime, timedelta
+import logging
+import time
+from datetime import date, timedelta
 
-from main.models import Attendance, Config
+from django.contrib.auth.models import User
+from django.db import transaction
 
+from main.authentication import revoke_users
+from main.cache import bump_model_version
+from main.models import Attendance, Config, StudentProfile
 
-def update_inactive_students():
-    today = datetime.now()
-    students = User.objects.filter(is_staff=False, is_superuser=False)
+logger = logging.getLogger(__name__)
+
+
+def update_inactive_students(dry_run=False):
+    """
+    :desc: Deactivates students with no attendance in the last `num_inactive_student_days`
+           days and reactivates the students it deactivated once they attend again
+           within that window. Accounts deactivated by an admin stay inactive.
+    :param: `dry_run` only computes the changes, without updating any user
+    :return: report `dict` with the window, row counts and time taken
+    """
+
+    started_at = time.time()
     config = Config.objects.all().first()
 
     if config is None:
         config = Config.objects.create()
 
     num_days_of_inactivity = config.num_inactive_student_days
-    attend_dict = {}
-
-    for i in range(num_days_of_inactivity):
-        date = today - timedelta(i)
-        for student in students:
-            today_attendance = Attendance.objects.filter(class_date=date)
-            for attend in today_attendance:
-                if attend.user == student:
-                    attend_dict[student.id] = attend_dict.get(student.id, 0) + 1
-                    break
-
-    for student in students:
-        if attend_dict.get(student.id, 0) == 0:
-            student.is_active = False
-            student.save()
+    window_end = date.today()
+    window_start = window_end - timedelta(max(num_days_of_inactivity, 1) - 1)
+
+    attended_user_ids = Attendance.objects.filter(
+        class_date__gte=window_start,
+        class_date__lte=window_end
+    ).values('user_id')
+
+    students = User.objects.filter(is_staff=False, is_superuser=False)
+    inactive_students = students.filter(is_active=True).exclude(id__in=attended_user_ids)
+    returning_students = students.filter(
+        is_active=False,
+        student_profile__deactivated_for_absence=True,
+        id__in=attended_user_ids
+    )
+
+    if dry_run:
+        num_deactivated = inactive_students.count()
+        num_reactivated = returning_students.count()
+    else:
+        with transaction.atomic():
+            # students an admin reactivated meanwhile are no longer this job's to reactivate
+            StudentProfile.objects.filter(
+                deactivated_for_absence=True, user__is_active=True
+            ).update(deactivated_for_absence=False)
+
+            deactivated_ids = list(inactive_students.values_list('id', flat=True))
+            reactivated_ids = list(returning_students.values_list('id', flat=True))
+            num_deactivated = User.objects.filter(id__in=deactivated_ids).update(is_active=False)
+            num_reactivated = User.objects.filter(id__in=reactivated_ids).update(is_active=True)
+            StudentProfile.objects.filter(user_id__in=deactivated_ids).update(deactivated_for_absence=True)
+            StudentProfile.objects.filter(user_id__in=reactivated_ids).update(deactivated_for_absence=False)
+
+        if num_deactivated or num_reactivated:
+            bump_model_version(User)
+            revoke_users(deactivated_ids + reactivated_ids)
+
+    report = {
+        'window_start': window_start,
+        'window_end': window_end,
+        'deactivated': num_deactivated,
+        'reactivated': num_reactivated,
+        'dry_run': dry_run,
+        'seconds': round(time.time() - started_at, 3),
+    }
+    logger.info('update_inactive_students: %s', report)
+
+    return report
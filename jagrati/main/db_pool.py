@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of raw database connections of one alias, shared by the threads of
+    a process. At most `size` connections are open, a checkout waits up to `timeout`
+    seconds for one to be returned. Idle connections are pinged before reuse and
+    replaced once older than `max_lifetime` seconds.
+    """
+
+    def __init__(self, alias, size, max_lifetime, timeout):
+        self.alias = alias
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.idle = []
+        self.created_at = {}
+        self.num_open = 0
+        self.condition = threading.Condition()
+        self.metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'reconnects': 0,
+            'recycled': 0,
+            'discarded': 0,
+        }
+
+    def _count(self, **increments):
+        with self.condition:
+            for key, value in increments.items():
+                self.metrics[key] += value
+
+    def get_metrics(self):
+        with self.condition:
+            return dict(self.metrics, size=self.size, open=self.num_open, idle=len(self.idle))
+
+    def _reserve(self):
+        """
+        :return: an idle connection, or `None` after reserving room for a new one
+        """
+
+        started_at = time.monotonic()
+        waited = False
+
+        with self.condition:
+            while not self.idle and self.num_open >= self.size:
+                remaining = self.timeout - (time.monotonic() - started_at)
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout('No connection of {} was returned within {}s ({} open).'.format(
+                        self.alias, self.timeout, self.num_open))
+                waited = True
+                self.condition.wait(remaining)
+
+            self.metrics['checkouts'] += 1
+            if waited:
+                self.metrics['waits'] += 1
+                self.metrics['wait_seconds'] += time.monotonic() - started_at
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.num_open += 1
+            return None
+
+    def _release(self):
+        with self.condition:
+            self.num_open -= 1
+            self.condition.notify()
+
+    def close_connection(self, conn):
+        self.created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            logger.debug('Could not close a pooled connection of %s', self.alias, exc_info=True)
+
+    def is_expired(self, conn):
+        return time.time() - self.created_at.get(id(conn), 0) > self.max_lifetime
+
+    def checkout(self, connect, is_alive):
+        """
+        :desc: Takes a connection from the pool, opening one if none is idle.
+        :param: `connect` opens a new raw connection
+                `is_alive` liveness check of an idle connection
+        """
+
+        conn = self._reserve()
+
+        if conn is not None and self.is_expired(conn):
+            self.close_connection(conn)
+            self._count(recycled=1)
+            conn = None
+        elif conn is not None and not is_alive(conn):
+            self.close_connection(conn)
+            self._count(reconnects=1)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = connect()
+            except Exception:
+                self._release()
+                raise
+            self.created_at[id(conn)] = time.time()
+            self._count(connects=1)
+
+        return conn
+
+    def checkin(self, conn, discard=False):
+        """
+        :desc: Returns a connection to the pool, closing it if `discard` or expired.
+        """
+
+        if discard or self.is_expired(conn):
+            self.close_connection(conn)
+            self._count(**{'discarded' if discard else 'recycled': 1})
+            self._release()
+            return
+
+        with self.condition:
+            self.idle.append(conn)
+            self.condition.notify()
+
+
+def get_pool(alias, options):
+    """
+    :desc: Pool of `alias` in this process, created from the `POOL` options of its
+           `DATABASES` entry (`SIZE`, `MAX_LIFETIME`, `TIMEOUT`). A forked process
+           starts with fresh pools, the parent's sockets can't be shared.
+    """
+
+    key = (os.getpid(), alias)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                alias,
+                options.get('SIZE', 10),
+                options.get('MAX_LIFETIME', 60 * 30),
+                options.get('TIMEOUT', 10)
+            )
+        return pool
+
+
+def get_metrics():
+    """
+    :desc: Counters of the pools of this process since it started.
+    """
+
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for (pool_pid, _), pool in _pools.items() if pool_pid == pid]
+
+    return {pool.alias: pool.get_metrics() for pool in pools}
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+from django.db.models import Count
+
+from .models import Subject, UserProfile, VolunteerSubject
+
+
+def get_volunteer_counts(context):
+    """
+    :desc: Number of volunteers of every subject, from one grouped query run once per
+           serializer context.
+    :param: `context` serializer context `dict`
+    :return: `dict` of subject ID to count of volunteers
+    """
+
+    if 'volunteer_counts' not in context:
+        rows = VolunteerSubject.objects.order_by().values_list('subject_id').annotate(count=Count('id'))
+        context['volunteer_counts'] = dict(rows)
+
+    return context['volunteer_counts']
+
+
+def get_department_directory():
+    """
+    :desc: Volunteers grouped by subject with their discipline and picture, read with
+           one query joining subjects to their volunteers and profiles. Subjects
+           without volunteers are listed with an empty group.
+    :return: list of `dict`
+    """
+
+    picture_storage = UserProfile._meta.get_field('display_picture').storage
+    subjects = OrderedDict()
+
+    rows = Subject.objects.order_by(
+        'name', 'id', 'subject_volunteer__volunteer__first_name', 'subject_volunteer__volunteer_id'
+    ).values_list(
+        'id',
+        'name',
+        'subject_volunteer__volunteer_id',
+        'subject_volunteer__volunteer__first_name',
+        'subject_volunteer__volunteer__last_name',
+        'subject_volunteer__volunteer__email',
+        'subject_volunteer__volunteer__user_profile__discipline',
+        'subject_volunteer__volunteer__user_profile__display_picture',
+        'subject_volunteer__volunteer__user_profile__display_picture_thumbnail',
+    )
+
+    for row in rows:
+        subject_id, name, volunteer_id, first_name, last_name, email, discipline, picture, thumbnail = row
+        if subject_id not in subjects:
+            subjects[subject_id] = {
+                'id': subject_id,
+                'name': name,
+                'num_volunteers': 0,
+                'volunteers': [],
+            }
+
+        if volunteer_id is None:
+            continue
+
+        subjects[subject_id]['num_volunteers'] += 1
+        subjects[subject_id]['volunteers'].append({
+            'id': volunteer_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': email,
+            'discipline': discipline or '',
+            'display_picture': picture_storage.url(picture) if picture else '',
+            'display_picture_thumbnail': picture_storage.url(thumbnail) if thumbnail else '',
+        })
+
+    return list(subjects.values())
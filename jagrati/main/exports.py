@@ -0,0 +1,152 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+from .models import Attendance, StudentProfile, UserProfile
+
+EXPORT_CHUNK_SIZE = 2000
+
+ATTENDANCE_COLUMNS = (
+    ('class_date', 'class_date'),
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('first_name', 'user__first_name'),
+    ('last_name', 'user__last_name'),
+    ('class', 'user__student_profile___class__name'),
+    ('is_extra_class', 'is_extra_class'),
+)
+
+STUDENT_COLUMNS = (
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('first_name', 'user__first_name'),
+    ('last_name', 'user__last_name'),
+    ('is_active', 'user__is_active'),
+    ('class', '_class__name'),
+    ('village', 'village'),
+    ('sex', 'sex'),
+    ('dob', 'dob'),
+    ('mother', 'mother'),
+    ('father', 'father'),
+    ('contact', 'contact'),
+    ('emergency_contact', 'emergency_contact'),
+    ('address', 'address'),
+    ('num_days', 'user__attendance_summary__num_days'),
+    ('last_attended_date', 'user__attendance_summary__last_attended_date'),
+)
+
+VOLUNTEER_COLUMNS = (
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('first_name', 'user__first_name'),
+    ('last_name', 'user__last_name'),
+    ('email', 'user__email'),
+    ('is_active', 'user__is_active'),
+    ('programme', 'programme'),
+    ('discipline', 'discipline'),
+    ('batch', 'batch'),
+    ('contact', 'contact'),
+    ('address', 'address'),
+)
+
+
+class Echo(object):
+    """
+    File-like object whose `write` returns the value instead of buffering it, so
+    `csv.writer` can format one row at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iterate_keyset(queryset, lookups, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    :desc: Yields `values_list` rows of `queryset` in primary key order, reading
+           `chunk_size` rows per query with `pk > last seen pk`. Unlike a single cursor
+           this holds one chunk in memory on every backend (MySQLdb buffers whole
+           results client side) and keeps no transaction open between chunks.
+    :param: `lookups` fields of the rows, the primary key is prepended and stripped
+    """
+
+    last_pk = None
+
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list('pk', *lookups)[:chunk_size])
+
+        for row in rows:
+            yield row[1:]
+
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def csv_response(filename, columns, rows):
+    """
+    :desc: Streams `rows` as a CSV attachment, one row per chunk of the response.
+    :param: `columns` tuple of (header, lookup) pairs
+            `rows` iterable of row tuples
+    """
+
+    writer = csv.writer(Echo())
+
+    def generate():
+        yield writer.writerow([header for header, _ in columns])
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+def get_lookups(columns):
+    return [lookup for _, lookup in columns]
+
+
+def export_attendance(start, end, class_id=None):
+    """
+    :desc: Attendance register between `start` and `end`, ordered by date. Each class
+           date is read separately through the (class_date, user) index.
+    """
+
+    attendance = Attendance.objects.filter(class_date__gte=start, class_date__lte=end)
+    if class_id is not None:
+        attendance = attendance.filter(user__student_profile___class_id=class_id)
+
+    def rows():
+        lookups = get_lookups(ATTENDANCE_COLUMNS)
+        dates = attendance.order_by('class_date').values_list('class_date', flat=True).distinct()
+        for class_date in list(dates):
+            for row in iterate_keyset(attendance.filter(class_date=class_date), lookups):
+                yield row
+
+    return csv_response(
+        'attendance_{}_{}.csv'.format(start, end),
+        ATTENDANCE_COLUMNS,
+        rows()
+    )
+
+
+def export_students(class_id=None):
+    students = StudentProfile.objects.all()
+    if class_id is not None:
+        students = students.filter(_class_id=class_id)
+
+    return csv_response(
+        'students.csv',
+        STUDENT_COLUMNS,
+        iterate_keyset(students, get_lookups(STUDENT_COLUMNS))
+    )
+
+
+def export_volunteers():
+    return csv_response(
+        'volunteers.csv',
+        VOLUNTEER_COLUMNS,
+        iterate_keyset(UserProfile.objects.filter(user__is_staff=True), get_lookups(VOLUNTEER_COLUMNS))
+    )
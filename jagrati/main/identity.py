@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+
+from .cache import get_model_version
+
+logger = logging.getLogger(__name__)
+
+FILTER_ERROR_RATE = 0.01
+FILTER_MIN_CAPACITY = 1024
+FILTER_CHUNK_SIZE = 5000
+
+
+class BloomFilter(object):
+    """
+    Set membership in a fixed bit array: `in` is `False` only for values never added,
+    and `True` for added values and, at about `error_rate`, for others.
+    """
+
+    def __init__(self, capacity, error_rate=FILTER_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def get_positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.num_bits for index in range(self.num_hashes))
+
+    def add(self, value):
+        for position in self.get_positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) for position in self.get_positions(value)
+        )
+
+
+class UsernameFilter(object):
+    """
+    Bloom filter of every username, used to answer "no such user" without a query.
+    It is only trusted while the `User` model version (`cache.get_model_version`) is
+    the one it was built at. Versions live in the default cache shared by the
+    processes, so users created by any of them make it stale; a user is missed only
+    between its commit and the version bump, and approving its join request checks
+    the database again. A stale filter is rebuilt in a background thread at most
+    once per `IDENTITY_FILTER_REBUILD_INTERVAL` seconds, lookups meanwhile go to the
+    database.
+    """
+
+    def __init__(self):
+        self.bloom = None
+        self.version = None
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        # the version is read first, so users committed after it bump it again
+        version = get_model_version(User)
+        usernames = User.objects.order_by().values_list('username', flat=True)
+        bloom = BloomFilter(max(User.objects.count() * 2, FILTER_MIN_CAPACITY))
+
+        for username in usernames.iterator(chunk_size=FILTER_CHUNK_SIZE):
+            bloom.add(normalize_username(username))
+
+        self.bloom, self.version = bloom, version
+
+    def run_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Could not rebuild the username filter')
+        finally:
+            self.lock.release()
+            close_old_connections()
+
+    def get_bloom(self):
+        """
+        :desc: Starts a rebuild in the background when the filter is stale.
+        :return: the filter if it is current, otherwise `None`
+        """
+
+        if self.bloom is not None and self.version == get_model_version(User):
+            return self.bloom
+
+        interval = getattr(settings, 'IDENTITY_FILTER_REBUILD_INTERVAL', 60)
+        if time.time() - self.built_at < interval or not self.lock.acquire(blocking=False):
+            return None
+
+        self.built_at = time.time()
+        threading.Thread(target=self.run_rebuild, name='username-filter', daemon=True).start()
+        return None
+
+    def may_exist(self, username):
+        bloom = self.get_bloom()
+        return bloom is None or normalize_username(username) in bloom
+
+
+username_filter = UsernameFilter()
+
+
+def normalize_username(username):
+    # MySQL compares usernames case insensitively, the filter must not tell them apart
+    return username.lower()
+
+
+def username_exists(username):
+    """
+    :desc: Indexed existence check of a username, always hits the database.
+    """
+
+    return User.objects.filter(username=username).exists()
+
+
+def user_exists(username, request=None):
+    """
+    :desc: Existence check for the public signup path. Usernames absent from the
+           in-process filter are answered without a query, others, and all of them
+           while the filter is stale, with an indexed `exists()`. The answer is
+           remembered on `request`, so the checks of the view and its serializer
+           cost one lookup.
+    :param: `request` the current request, if any
+    """
+
+    if not username:
+        return False
+
+    checked = getattr(request, '_checked_usernames', None) if request is not None else None
+    if checked is not None and username in checked:
+        return checked[username]
+
+    exists = username_filter.may_exist(username) and username_exists(username)
+
+    if request is not None:
+        if checked is None:
+            checked = request._checked_usernames = {}
+        checked[username] = exists
+
+    return exists
@@ -0,0 +1,180 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image
+
+from .cache import bump_model_version
+from .models import Event, StudentProfile, UserProfile
+from .storage import strip_content_hash
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'uploads/thumbs'
+
+# variant: (bounding box, JPEG quality)
+IMAGE_VARIANTS = {
+    'thumbnail': ((200, 200), 80),
+    'compressed': ((1280, 1280), 75),
+}
+
+# model: source image fields, each with a `<field>_<variant>` field per variant
+IMAGE_FIELDS = {
+    UserProfile: ('display_picture', ),
+    StudentProfile: ('display_picture', ),
+    Event: ('image', ),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_name(source_name, variant):
+    """
+    :desc: Storage name of a variant, derived from its source so a stale variant is
+           recognised by name without reading any file. A hashing storage stores it
+           with its content hash added, see `storage.strip_content_hash`.
+    """
+
+    root = os.path.basename(source_name).replace('.', '_')
+    return '{}/{}_{}.jpg'.format(VARIANTS_DIR, root, variant)
+
+
+def needs_processing(instance, field_name):
+    source_name = getattr(instance, field_name).name or ''
+
+    return any(
+        strip_content_hash(getattr(instance, '{}_{}'.format(field_name, variant)).name or '') !=
+        (get_variant_name(source_name, variant) if source_name else '')
+        for variant in IMAGE_VARIANTS
+    )
+
+
+def render_variant(source, size, quality):
+    """
+    :desc: Shrinks `source` to fit in `size` and encodes it as a progressive JPEG.
+           Transparent images are flattened on white.
+    :param: `source` open file of the original image
+    :return: JPEG bytes
+    """
+
+    image = Image.open(source)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image.thumbnail(size, Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def delete_unused_variants(storage, names):
+    """
+    :desc: Deletes the variant files in `names` which no row refers to. The hashing
+           storage gives rows with the same image the same variant files, so a file
+           is only deleted once the last of them moved to another image.
+    """
+
+    fields = [
+        (model, '{}_{}'.format(field_name, variant))
+        for model, field_names in IMAGE_FIELDS.items()
+        for field_name in field_names
+        for variant in IMAGE_VARIANTS
+    ]
+
+    for name in names:
+        if name and not any(model.objects.filter(**{field: name}).exists() for model, field in fields):
+            storage.delete(name)
+
+
+def process_image(model, pk, field_name):
+    """
+    :desc: Writes the variants of one image and stores their names. The names are
+           written with `QuerySet.update` on the unchanged source, so a newer upload
+           is never overwritten and no save signal fires again. The variants of the
+           replaced upload are deleted.
+    :return: `True` if the variants were stored
+    """
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_processing(instance, field_name):
+        return False
+
+    source = getattr(instance, field_name)
+    storage = source.storage
+    updates = {}
+
+    if source.name:
+        for variant, (size, quality) in IMAGE_VARIANTS.items():
+            name = get_variant_name(source.name, variant)
+            source.open('rb')
+            try:
+                content = render_variant(source, size, quality)
+            finally:
+                source.close()
+            updates['{}_{}'.format(field_name, variant)] = storage.save(name, ContentFile(content))
+    else:
+        updates = {'{}_{}'.format(field_name, variant): None for variant in IMAGE_VARIANTS}
+
+    if source.name:
+        unchanged = Q(**{field_name: source.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{'{}__isnull'.format(field_name): True})
+    stored = model.objects.filter(unchanged, pk=pk).update(**updates)
+
+    # a newer upload replaced the source meanwhile, its own processing takes over
+    obsolete = set(updates.values()) if not stored else {
+        getattr(instance, field).name for field in updates
+    } - set(updates.values())
+    delete_unused_variants(storage, obsolete)
+
+    if stored:
+        bump_model_version(model)
+    return bool(stored)
+
+
+def _run(model, pk, field_name):
+    try:
+        process_image(model, pk, field_name)
+    except Exception:
+        logger.exception('Could not process %s %s of %s', field_name, pk, model.__name__)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_WORKERS', 2))
+        return _executor
+
+
+def schedule_processing(instance):
+    """
+    :desc: Queues the variants of every image of `instance` which changed, once the
+           saving transaction commits. Runs in the image worker pool, or right away
+           when `IMAGE_WORKERS` is 0.
+    """
+
+    for field_name in IMAGE_FIELDS.get(type(instance), ()):
+        if not needs_processing(instance, field_name):
+            continue
+
+        args = (type(instance), instance.pk, field_name)
+        if getattr(settings, 'IMAGE_WORKERS', 2) > 0:
+            transaction.on_commit(lambda args=args: get_executor().submit(_run, *args))
+        else:
+            transaction.on_commit(lambda args=args: _run(*args))
@@ -0,0 +1,205 @@
+import csv
+import io
+
+from django.contrib.auth.models import User
+from django.db import DataError, IntegrityError, transaction
+from rest_framework import serializers
+
+from .attendance import chunks
+from .cache import bump_model_version
+from .models import Class, StudentProfile
+
+IMPORT_CHUNK_SIZE = 200
+PROFILE_FIELDS = ('village', 'sex', 'dob', 'mother', 'father', 'contact', 'emergency_contact', 'address', )
+
+
+class StudentImportRowSerializer(serializers.Serializer):
+    """
+    Validates one CSV row without touching the database, the class is resolved
+    against the classes loaded once per import.
+    """
+
+    first_name = serializers.CharField(max_length=30)
+    last_name = serializers.CharField(max_length=150, required=False, allow_null=True, default='')
+    class_num = serializers.CharField(max_length=10)
+    village = serializers.CharField(max_length=50, required=False, allow_null=True)
+    sex = serializers.CharField(max_length=10, required=False, allow_null=True)
+    dob = serializers.DateField(required=False, allow_null=True)
+    mother = serializers.CharField(max_length=50, required=False, allow_null=True)
+    father = serializers.CharField(max_length=50, required=False, allow_null=True)
+    contact = serializers.IntegerField(required=False, allow_null=True)
+    emergency_contact = serializers.IntegerField(required=False, allow_null=True)
+    address = serializers.CharField(max_length=50, required=False, allow_null=True)
+
+
+def read_csv(csv_file):
+    """
+    :desc: Rows of an uploaded or opened CSV file as dicts keyed by the header, with
+           surrounding spaces stripped and empty cells as `None`.
+    :return: list of tuples of line number and row `dict`
+    """
+
+    content = csv_file.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    reader = csv.DictReader(io.StringIO(content))
+    rows = []
+    for row in reader:
+        rows.append((reader.line_num, {
+            key.strip(): (value.strip() or None) if value is not None else None
+            for key, value in row.items() if key
+        }))
+
+    return rows
+
+
+def validate_rows(rows, class_ids):
+    """
+    :param: `rows` list of tuples of line number and row `dict`
+            `class_ids` `dict` of class name to class ID
+    :return: tuple of valid rows (line number, validated data) and errors
+    """
+
+    valid, errors = [], []
+
+    for line, row in rows:
+        serializer = StudentImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': line, 'errors': serializer.errors})
+            continue
+
+        data = serializer.validated_data
+        if data['class_num'] not in class_ids:
+            errors.append({'row': line, 'errors': {'class_num': ['Class does not exist.']}})
+            continue
+
+        valid.append((line, data))
+
+    return valid, errors
+
+
+def assign_usernames(names):
+    """
+    :desc: Unique usernames for `names`, the first name as for single students, with
+           `-2`, `-3`... appended while it is taken. Taken names are looked up once per
+           round for the whole chunk instead of once per student.
+    :param: `names` list of first names
+    :return: list of usernames in the same order
+    """
+
+    usernames = list(names)
+    suffixes = [1] * len(names)
+    pending = list(range(len(names)))
+
+    while pending:
+        taken = set(User.objects.filter(
+            username__in={usernames[index] for index in pending}
+        ).values_list('username', flat=True))
+
+        seen = set(username for index, username in enumerate(usernames) if index not in pending)
+        conflicts = []
+        for index in pending:
+            if usernames[index] in taken or usernames[index] in seen:
+                conflicts.append(index)
+            else:
+                seen.add(usernames[index])
+
+        for index in conflicts:
+            suffixes[index] += 1
+            usernames[index] = '{}-{}'.format(names[index], suffixes[index])
+        pending = conflicts
+
+    return usernames
+
+
+def create_students(rows, class_ids):
+    """
+    :desc: Inserts the users and profiles of one chunk with two bulk inserts.
+    :param: `rows` list of validated data
+    :return: number of students created
+    """
+
+    usernames = assign_usernames([data['first_name'] for data in rows])
+
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=username, first_name=data['first_name'], last_name=data['last_name'] or '')
+            for username, data in zip(usernames, rows)
+        ])
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        StudentProfile.objects.bulk_create([
+            StudentProfile(
+                user_id=user_ids[username],
+                _class_id=class_ids[data['class_num']],
+                **{field: data.get(field) for field in PROFILE_FIELDS}
+            )
+            for username, data in zip(usernames, rows)
+        ])
+
+    return len(rows)
+
+
+def create_chunk(chunk, class_ids, errors):
+    """
+    :desc: Creates the students of one chunk, retried once as a concurrent import can
+           take a username between its lookup and the insert. A chunk that still fails
+           is inserted row by row, so only the offending rows are reported as errors.
+    :param: `chunk` list of tuples of line number and validated data
+    :return: number of students created
+    """
+
+    rows = [data for _, data in chunk]
+
+    for _ in range(2):
+        try:
+            return create_students(rows, class_ids)
+        except (IntegrityError, DataError):
+            pass
+
+    num_created = 0
+    for line, data in chunk:
+        try:
+            num_created += create_students([data], class_ids)
+        except (IntegrityError, DataError) as e:
+            errors.append({'row': line, 'errors': {'non_field_errors': [str(e)]}})
+
+    return num_created
+
+
+def bump_student_versions():
+    bump_model_version(User)
+    bump_model_version(StudentProfile)
+
+
+def import_students(csv_file, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """
+    :desc: Imports students from a CSV file with the `first_name`, `last_name`,
+           `class_num` and student profile columns. Classes are resolved once, valid
+           rows are inserted in chunked transactions and invalid rows are reported.
+    :param: `csv_file` file object opened in text or binary mode
+            `dry_run` only validates the rows
+    :return: report `dict` with the number of rows, students created and row errors
+    """
+
+    rows = read_csv(csv_file)
+    class_ids = dict(Class.objects.values_list('name', 'id'))
+    valid, errors = validate_rows(rows, class_ids)
+    num_created = 0
+
+    if not dry_run:
+        for chunk in chunks(valid, chunk_size):
+            num_created += create_chunk(chunk, class_ids, errors)
+
+        if num_created:
+            transaction.on_commit(bump_student_versions)
+
+    errors.sort(key=lambda error: error['row'])
+
+    return {
+        'num_rows': len(rows),
+        'created': num_created,
+        'errors': errors,
+        'dry_run': dry_run,
+    }
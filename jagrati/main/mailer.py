@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import OutgoingMail
+
+logger = logging.getLogger(__name__)
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'queued': 0,
+    'sent': 0,
+    'retried': 0,
+    'failed': 0,
+    'batches': 0,
+    'connections_opened': 0,
+    'send_seconds': 0.0,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _count(**increments):
+    with _metrics_lock:
+        for key, value in increments.items():
+            _metrics[key] += value
+
+
+def get_metrics():
+    """
+    :desc: Counters of this process since it started.
+    """
+
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """
+    :desc: Stores a mail in the outbox. It is handed to the worker pool once the
+           current transaction commits, so a rolled back request sends nothing.
+    :return: OutgoingMail instance
+    """
+
+    mail = OutgoingMail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        to=','.join(recipient_list)
+    )
+    _count(queued=1)
+    transaction.on_commit(wake_workers)
+
+    return mail
+
+
+def claim_batch(batch_size):
+    """
+    :desc: Marks up to `batch_size` due mails as being sent by the caller. Mails left
+           in `SENDING` by a dead worker are released after `MAIL_CLAIM_TIMEOUT` seconds.
+    :return: list of claimed OutgoingMail instances
+    """
+
+    now = timezone.now()
+    OutgoingMail.objects.filter(
+        status='SENDING',
+        updated_at__lt=now - timedelta(seconds=_setting('MAIL_CLAIM_TIMEOUT', 300))
+    ).update(status='PENDING', claim=None)
+
+    mail_ids = list(OutgoingMail.objects.filter(
+        status='PENDING',
+        next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not mail_ids:
+        return []
+
+    claim = uuid.uuid4().hex
+    OutgoingMail.objects.filter(id__in=mail_ids, status='PENDING').update(
+        status='SENDING',
+        claim=claim,
+        updated_at=now
+    )
+
+    return list(OutgoingMail.objects.filter(claim=claim, status='SENDING').order_by('id'))
+
+
+def send_batch(mails, connection=None):
+    """
+    :desc: Sends `mails` over one connection to the mail server, scheduling failed
+           mails for a retry with exponential backoff.
+    :return: the connection, still open for the next batch (or `None`)
+    """
+
+    for mail in mails:
+        started_at = time.perf_counter()
+        try:
+            if connection is None:
+                connection = get_connection(fail_silently=False)
+                connection.open()
+                _count(connections_opened=1)
+
+            EmailMessage(
+                mail.subject,
+                mail.message,
+                mail.from_email,
+                mail.to.split(','),
+                connection=connection
+            ).send()
+        except Exception as e:
+            logger.warning('Sending mail %s failed: %s', mail.id, e)
+            _retry_later(mail, e)
+            if connection is not None:
+                connection.close()
+                connection = None
+        else:
+            OutgoingMail.objects.filter(id=mail.id).update(
+                status='SENT',
+                message='',
+                claim=None,
+                attempts=mail.attempts + 1,
+                sent_at=timezone.now()
+            )
+            _count(sent=1)
+        finally:
+            _count(send_seconds=time.perf_counter() - started_at)
+
+    _count(batches=1)
+    return connection
+
+
+def _retry_later(mail, error):
+    attempts = mail.attempts + 1
+    updates = {'attempts': attempts, 'claim': None, 'last_error': str(error)}
+
+    if attempts >= _setting('MAIL_MAX_ATTEMPTS', 5):
+        # given up, the body (e.g. a generated password) is not kept around
+        updates['status'] = 'FAILED'
+        updates['message'] = ''
+        _count(failed=1)
+    else:
+        delay = min(_setting('MAIL_RETRY_BACKOFF', 30) * 2 ** (attempts - 1), 3600)
+        updates['status'] = 'PENDING'
+        updates['next_attempt_at'] = timezone.now() + timedelta(seconds=delay)
+        _count(retried=1)
+
+    OutgoingMail.objects.filter(id=mail.id).update(**updates)
+
+
+def drain(batch_size=None):
+    """
+    :desc: Sends every due mail of the outbox, reusing one connection across batches.
+    :return: number of mails processed
+    """
+
+    batch_size = batch_size or _setting('MAIL_BATCH_SIZE', 50)
+    connection = None
+    num_processed = 0
+
+    try:
+        while True:
+            mails = claim_batch(batch_size)
+            if not mails:
+                break
+            connection = send_batch(mails, connection)
+            num_processed += len(mails)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return num_processed
+
+
+class MailWorkerPool(object):
+    """
+    Background threads draining the outbox. Workers sleep until woken by a commit
+    which queued mail, or until `MAIL_POLL_INTERVAL` seconds pass so retries go out.
+    """
+
+    def __init__(self, num_workers, poll_interval):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+
+            for index in range(self.num_workers):
+                thread = threading.Thread(target=self.run, name='mail-worker-{}'.format(index))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def wake(self):
+        self.start()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                drain()
+            except Exception:
+                logger.exception('Mail worker failed to drain the outbox')
+            finally:
+                close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = MailWorkerPool(
+                _setting('MAIL_WORKERS', 2),
+                _setting('MAIL_POLL_INTERVAL', 60)
+            )
+        return _pool
+
+
+def wake_workers():
+    """
+    :desc: Hands queued mail to the worker pool, or sends it right away when
+           `MAIL_WORKERS` is 0 (e.g. with the locmem backend in tests).
+    """
+
+    if _setting('MAIL_WORKERS', 2) > 0:
+        get_pool().wake()
+    else:
+        drain()
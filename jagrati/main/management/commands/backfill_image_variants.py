@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.images import IMAGE_FIELDS, process_image
+
+
+class Command(BaseCommand):
+    help = ('Renders the missing or stale thumbnails and compressed copies of every '
+            'uploaded picture and event image.')
+
+    def handle(self, *args, **options):
+        for model, field_names in IMAGE_FIELDS.items():
+            for field_name in field_names:
+                started_at = time.time()
+                pks = model.objects.exclude(
+                    **{field_name: ''}
+                ).exclude(
+                    **{'{}__isnull'.format(field_name): True}
+                ).order_by('pk').values_list('pk', flat=True)
+
+                num_processed = num_failed = 0
+                for pk in list(pks):
+                    try:
+                        num_processed += process_image(model, pk, field_name)
+                    except Exception as e:
+                        num_failed += 1
+                        self.stderr.write('{} {} {}: {}'.format(model.__name__, pk, field_name, e))
+
+                self.stdout.write('{}.{}: {} processed, {} failed in {:.1f}s'.format(
+                    model.__name__, field_name, num_processed, num_failed, time.time() - started_at
+                ))
@@ -0,0 +1,108 @@
+import datetime
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from main.analytics import (build_matrix, compute_metrics, get_at_risk_indices, get_class_report,
+                            get_student_report, load_attendance, )
+
+
+class Command(BaseCommand):
+    help = ('Times the attendance analytics on synthetic arrays (default, e.g. --rows 5000000) '
+            'or on the current database (--database), against a per-row Python loop.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000000)
+        parser.add_argument('--students', type=int, default=50000)
+        parser.add_argument('--classes', type=int, default=100)
+        parser.add_argument('--attendance-rate', type=float, default=0.7)
+        parser.add_argument('--database', action='store_true', default=False,
+                            help='Load the attendance of the last --days days from the database.')
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--no-baseline', action='store_true', default=False,
+                            help='Skip the per-row Python loop.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['database']:
+            end = datetime.date.today()
+            matrix = self.step('load from database', load_attendance,
+                               end - datetime.timedelta(days=options['days']), end)
+            rows = int(matrix.present.sum() + matrix.extra.sum())
+            columns = None
+        else:
+            columns = self.generate(options)
+            rows = len(columns[3])
+            matrix = self.step('build matrix', build_matrix, *columns)
+
+        self.stdout.write('{} rows, {} students x {} dates'.format(rows, *matrix.present.shape))
+
+        metrics = self.step('compute metrics', compute_metrics, matrix)
+        self.step('student report', get_student_report, matrix, metrics)
+        self.step('class report', get_class_report, metrics)
+        self.step('at-risk report', get_student_report, matrix, metrics, get_at_risk_indices(metrics))
+
+        if columns is not None and not options['no_baseline']:
+            self.step('per-row python baseline', self.baseline, *columns)
+
+    def step(self, name, func, *args):
+        started_at = time.perf_counter()
+        result = func(*args)
+        self.stdout.write('{:<28} {:>9.3f}s'.format(name, time.perf_counter() - started_at))
+        return result
+
+    def generate(self, options):
+        """
+        :desc: Synthetic attendance: every class day a random share of the students is
+               present, until `--rows` rows exist.
+        :return: tuple of arguments of `build_matrix`
+        """
+
+        random = np.random.RandomState(options['seed'])
+        num_students = options['students']
+        user_ids = np.arange(1, num_students + 1, dtype=np.int64)
+        class_ids = random.randint(1, options['classes'] + 1, size=num_students).astype(np.int64)
+        names = [('student', str(user_id)) for user_id in user_ids.tolist()]
+
+        per_day = max(int(num_students * options['attendance_rate']), 1)
+        num_days = -(-options['rows'] // per_day)
+        first_day = datetime.date.today().toordinal() - num_days
+
+        attended_user_ids = np.concatenate([
+            random.choice(user_ids, per_day, replace=False) for _ in range(num_days)
+        ])[:options['rows']]
+        attended_dates = (first_day + np.arange(len(attended_user_ids)) // per_day).astype(np.int64)
+        is_extra = random.random_sample(len(attended_user_ids)) < 0.05
+
+        return user_ids, class_ids, names, attended_user_ids, attended_dates, is_extra
+
+    def baseline(self, user_ids, class_ids, names, attended_user_ids, attended_dates, is_extra):
+        """
+        :desc: Percentage and streaks per student computed row by row, the way the
+               serializers walk attendance, for comparison.
+        """
+
+        class_of = dict(zip(user_ids.tolist(), class_ids.tolist()))
+        attended = defaultdict(set)
+        class_days = defaultdict(set)
+
+        for user_id, date, extra in zip(attended_user_ids.tolist(), attended_dates.tolist(), is_extra.tolist()):
+            if extra:
+                continue
+            attended[user_id].add(date)
+            class_days[class_of[user_id]].add(date)
+
+        sorted_days = {class_id: sorted(days) for class_id, days in class_days.items()}
+        results = {}
+        for user_id, class_id in class_of.items():
+            days = sorted_days.get(class_id, [])
+            present = attended[user_id]
+            streak = longest = 0
+            for date in days:
+                streak = streak + 1 if date in present else 0
+                longest = max(longest, streak)
+            results[user_id] = (100.0 * len(present) / len(days) if days else 0.0, streak, longest)
+
+        return results
@@ -0,0 +1,67 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from rest_framework.test import APIClient
+
+from main import db_pool
+from main.management.commands.bench_endpoints import percentile
+
+POOL_ENGINE = 'main.mysql_pool'
+
+
+class Command(BaseCommand):
+    help = ('Times --requests GETs of --path with a new database connection per request, '
+            'then with the connection pool of the main.mysql_pool engine.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', default='/config/')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.settings_dict['ENGINE'] != POOL_ENGINE:
+            raise CommandError('The {} database does not use the {} engine.'.format(
+                options['database'], POOL_ENGINE))
+
+        user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Benchmarks run as a superuser, create one first.')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        configured = connection.settings_dict.get('POOL')
+
+        try:
+            for name, pool_options in (('without pool', None), ('with pool', configured or {'SIZE': 10})):
+                connection.close()
+                connection.settings_dict['POOL'] = pool_options
+                self.measure(name, client, options['path'], options['requests'])
+        finally:
+            connection.close()
+            connection.settings_dict['POOL'] = configured
+
+        self.stdout.write('pool counters: {}'.format(db_pool.get_metrics()))
+
+    def measure(self, name, client, path, num_requests):
+        """
+        :desc: Times requests the way a worker serves them, the connection is closed
+               (or returned to the pool) when each one finishes.
+        """
+
+        timings = []
+        for _ in range(num_requests):
+            started_at = time.perf_counter()
+            client.get(path)
+            # the test client doesn't close connections at the end of a request
+            close_old_connections()
+            timings.append(time.perf_counter() - started_at)
+
+        self.stdout.write('{:<14} p50 {:>8.2f} ms  p95 {:>8.2f} ms  mean {:>8.2f} ms'.format(
+            name,
+            percentile(timings, 0.5) * 1000,
+            percentile(timings, 0.95) * 1000,
+            sum(timings) / len(timings) * 1000
+        ))
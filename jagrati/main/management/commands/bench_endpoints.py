@@ -0,0 +1,134 @@
+import json
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from main.urls import router
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Times every GET route of main/urls.py on the current database and writes '
+            'p50/p95 latency, query count and peak memory to a JSON baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', default='bench_baseline.json',
+                            help='File the results are written to.')
+        parser.add_argument('--compare', default=None,
+                            help='Baseline file to compare against, exits with an error on regression.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 slowdown when comparing.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Benchmarks run as a superuser, create one first.')
+
+        client = APIClient()
+        client.force_authenticate(user)
+
+        results = {}
+        for name, path in self.get_routes():
+            results[name] = self.measure(client, path, options['repeat'])
+            self.stdout.write('{:<40} p50 {p50_ms:>9.2f} ms  p95 {p95_ms:>9.2f} ms  '
+                              'queries {queries:>5}  peak {peak_kb:>9.1f} KiB  status {status}'.format(
+                                  name, **results[name]))
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def get_routes(self):
+        """
+        :desc: GET routes of the router, detail routes are requested for the first row.
+        :return: list of tuples of route name and path
+        """
+
+        routes = []
+
+        for prefix, viewset, basename in router.registry:
+            for route in router.get_routes(viewset):
+                if 'get' not in route.mapping:
+                    continue
+
+                path = '/' + route.url.format(
+                    prefix=prefix,
+                    lookup='{lookup}',
+                    trailing_slash=router.trailing_slash
+                ).lstrip('^').rstrip('$')
+
+                if '{lookup}' in path:
+                    lookup_value = self.get_lookup_value(viewset)
+                    if lookup_value is None:
+                        continue
+                    path = path.replace('{lookup}', str(lookup_value))
+
+                routes.append((route.name.format(basename=basename), path))
+
+        return routes
+
+    def get_lookup_value(self, viewset):
+        lookup_field = getattr(viewset, 'lookup_field', 'pk')
+        queryset = viewset.queryset.order_by('pk').values_list(lookup_field, flat=True)
+        return queryset.first()
+
+    def measure(self, client, path, repeat):
+        """
+        :desc: Times `repeat` requests, then traces one more for its queries and peak
+               memory, as tracing slows the request down.
+        """
+
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            client.get(path)
+            timings.append(time.perf_counter() - started_at)
+
+        tracemalloc.start()
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connection))
+                        for connection in connections.all()]
+            response = client.get(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'queries': sum(len(queries) for queries in captured),
+            'peak_kb': round(peak / 1024.0, 1),
+        }
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, result in sorted(results.items()):
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append('{}: p95 {} ms -> {} ms'.format(name, previous['p95_ms'], result['p95_ms']))
+            if result['queries'] > previous['queries']:
+                regressions.append('{}: queries {} -> {}'.format(name, previous['queries'], result['queries']))
+
+        if regressions:
+            raise CommandError('Regressions against {}:\n{}'.format(baseline_path, '\n'.join(regressions)))
+        self.stdout.write(self.style.SUCCESS('No regressions against {}.'.format(baseline_path)))
@@ -0,0 +1,80 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from main.cache import bump_model_version
+from main.identity import user_exists, username_exists, username_filter
+
+BENCH_PREFIX = 'bench-identity-'
+
+
+class Command(BaseCommand):
+    help = ('Times the signup existence check of unknown emails as the number of users grows '
+            '(e.g. --sizes 1000 10000 100000): the former in-memory username list, an indexed '
+            'exists() and the filtered lookup. Bench users are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--lookups', type=int, default=1000)
+        parser.add_argument('--legacy-lookups', type=int, default=5,
+                            help='Lookups through the full username list, which is slow.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep', action='store_true', default=False,
+                            help='Keep the bench users.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{:>8} {:>16} {:>16} {:>16} {:>14} {:>8}'.format(
+            'users', 'full list (ms)', 'exists() (ms)', 'filtered (ms)', 'filter build', 'queries'
+        ))
+
+        try:
+            for size in sorted(options['sizes']):
+                self.grow_to(size, options['batch_size'])
+                self.measure(options)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def grow_to(self, size, batch_size):
+        missing = size - User.objects.count()
+        if missing <= 0:
+            return
+
+        offset = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username='{}{}@example.com'.format(BENCH_PREFIX, offset + index))
+                for index in range(missing)
+            ], batch_size=batch_size)
+        bump_model_version(User)
+
+    def measure(self, options):
+        emails = ['{}@example.com'.format(uuid.uuid4().hex) for _ in range(options['lookups'])]
+
+        # rebuild now, as the background thread started by the first request after a change would
+        started_at = time.perf_counter()
+        username_filter.rebuild()
+        build_time = time.perf_counter() - started_at
+
+        legacy = self.time_per_lookup(
+            lambda email: email in User.objects.all().values_list('username', flat=True),
+            emails[:options['legacy_lookups']]
+        )
+        indexed = self.time_per_lookup(username_exists, emails)
+
+        with CaptureQueriesContext(connection) as queries:
+            filtered = self.time_per_lookup(user_exists, emails)
+
+        self.stdout.write('{:>8} {:>16.3f} {:>16.3f} {:>16.4f} {:>13.3f}s {:>8}'.format(
+            User.objects.count(), legacy, indexed, filtered, build_time, len(queries)
+        ))
+
+    def time_per_lookup(self, check, emails):
+        started_at = time.perf_counter()
+        for email in emails:
+            check(email)
+        return (time.perf_counter() - started_at) * 1000 / max(len(emails), 1)
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_jwt.settings import api_settings
+
+from main.management.commands.bench_endpoints import percentile
+
+
+class Command(BaseCommand):
+    help = ('Simulates --clients mostly idle mobile clients polling --url of a running server, '
+            'every --interval seconds, or with long polls of --wait seconds, and reports the '
+            'request rate the server has to sustain and the latency of the answers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/notifications/')
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=60)
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between the polls of a client without --wait.')
+        parser.add_argument('--wait', type=int, default=0,
+                            help='Long poll of up to this many seconds (ASGI deployment only).')
+        parser.add_argument('--token', default=None,
+                            help='JWT sent by every client, defaults to one of the first superuser.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only plain http URLs are supported.')
+
+        token = options['token'] or self.get_token()
+        stats = {'timings': [], 'errors': 0, 'updates': 0}
+
+        loop = asyncio.get_event_loop()
+        deadline = time.monotonic() + options['duration']
+        started_at = time.monotonic()
+        loop.run_until_complete(asyncio.gather(*[
+            self.poll(url, token, options, stats, deadline) for _ in range(options['clients'])
+        ]))
+        elapsed = time.monotonic() - started_at
+
+        timings = stats['timings'] or [0]
+        self.stdout.write(
+            '{} clients, {}: {} requests ({:.1f}/s), p50 {:.1f} ms, p95 {:.1f} ms, '
+            '{} version changes seen, {} errors'.format(
+                options['clients'],
+                'long poll {}s'.format(options['wait']) if options['wait'] else
+                'poll every {}s'.format(options['interval']),
+                len(stats['timings']),
+                len(stats['timings']) / elapsed,
+                percentile(timings, 0.5) * 1000,
+                percentile(timings, 0.95) * 1000,
+                stats['updates'],
+                stats['errors']
+            ))
+
+    def get_token(self):
+        user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Benchmarks run as a superuser, create one first or pass --token.')
+
+        return api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user))
+
+    async def poll(self, url, token, options, stats, deadline):
+        """
+        :desc: One client, starting at a random point of the first interval so the
+               requests spread like the ones of real devices.
+        """
+
+        await asyncio.sleep(random.uniform(0, options['interval']))
+        version = None
+
+        while time.monotonic() < deadline:
+            query = url.query
+            if options['wait'] and version:
+                query = '&'.join(filter(None, [query, urlencode({'wait': options['wait'],
+                                                                 'version': version})]))
+
+            started_at = time.monotonic()
+            try:
+                status, headers = await asyncio.wait_for(
+                    self.request(url, query, token), options['wait'] + 30)
+            except (OSError, asyncio.TimeoutError):
+                status, headers = None, {}
+
+            if status != 200:
+                stats['errors'] += 1
+                await asyncio.sleep(options['interval'])
+                continue
+
+            stats['timings'].append(time.monotonic() - started_at)
+            latest = headers.get('x-feed-version')
+            if version is not None and latest != version:
+                stats['updates'] += 1
+            version = latest
+
+            if not options['wait']:
+                await asyncio.sleep(options['interval'])
+
+    async def request(self, url, query, token):
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            writer.write(
+                'GET {}{} HTTP/1.1\r\nHost: {}\r\nAuthorization: JWT {}\r\n'
+                'Connection: close\r\n\r\n'.format(
+                    url.path or '/', '?' + query if query else '', url.netloc, token
+                ).encode('latin1'))
+            response = await reader.read()
+        finally:
+            writer.close()
+
+        head = response.split(b'\r\n\r\n', 1)[0].decode('latin1').split('\r\n')
+        headers = dict(
+            (name.strip().lower(), value.strip())
+            for name, value in (line.split(':', 1) for line in head[1:] if ':' in line)
+        )
+        return int(head[0].split()[1]), headers
@@ -0,0 +1,76 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Notification, UserNotification
+from main.notifications import (FANOUT_BULK, FANOUT_PULL, fan_out_notification, get_feed,
+                                get_read_position)
+from main.serializers import NotificationFeedSerializer, UserNotificationSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compares bulk and pull notification fan-out on synthetic volunteers. '
+            'Everything runs in a transaction which is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--volunteers', type=int, default=10000)
+        parser.add_argument('--notifications', type=int, default=10)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username='bench-volunteer-{}'.format(index), is_staff=True)
+                for index in range(options['volunteers'])
+            ], batch_size=500)
+            reader = User.objects.filter(username='bench-volunteer-0').first()
+
+            for mode in (FANOUT_BULK, FANOUT_PULL):
+                self.report(mode, *self.run(mode, reader, options))
+
+            transaction.set_rollback(True)
+
+    def run(self, mode, reader, options):
+        """
+        :return: tuple of seconds per fan-out, rows written, seconds per serialized feed
+                 page and its number of notifications
+        """
+
+        rows_before = UserNotification.objects.count()
+        write_seconds = 0.0
+
+        for index in range(options['notifications']):
+            notification = Notification.objects.create(
+                _type='event',
+                content='bench {} {}'.format(mode, index),
+                to_only_admin=False
+            )
+            started_at = time.perf_counter()
+            fan_out_notification(notification, mode)
+            write_seconds += time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        if mode == FANOUT_BULK:
+            page = UserNotification.objects.filter(user=reader).select_related(
+                'user', 'notification'
+            ).order_by('-id')[:options['page_size']]
+            data = UserNotificationSerializer(page, many=True).data
+        else:
+            page = get_feed(reader)[:options['page_size']]
+            last_seen_id, seen_ids = get_read_position(reader)
+            data = NotificationFeedSerializer(page, many=True, context={
+                'last_seen_id': last_seen_id,
+                'seen_ids': seen_ids
+            }).data
+        read_seconds = time.perf_counter() - started_at
+
+        rows_written = UserNotification.objects.count() - rows_before
+        return write_seconds / options['notifications'], rows_written, read_seconds, len(data)
+
+    def report(self, mode, write_seconds, rows_written, read_seconds, page_size):
+        self.stdout.write('{:<5} fan-out {:>9.2f} ms/notification  rows {:>9}  '
+                          'feed page of {} {:>7.2f} ms'.format(
+                              mode, write_seconds * 1000, rows_written, page_size, read_seconds * 1000
+                          ))
@@ -0,0 +1,86 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+
+from main.attendance import chunks
+from main.models import Attendance
+
+
+class Command(BaseCommand):
+    help = ('Removes duplicate attendance rows, keeping the oldest row of every '
+            '(user, class_date, is_extra_class). Run before migrating the unique constraint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=31,
+                            help='Number of class days scanned per transaction.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only report how many rows would be removed.')
+
+    def handle(self, *args, **options):
+        bounds = Attendance.objects.aggregate(first=Min('class_date'), last=Max('class_date'))
+        if bounds['first'] is None:
+            self.stdout.write('No attendance rows.')
+            return
+
+        window = datetime.timedelta(days=max(options['days'], 1))
+        start = bounds['first']
+        num_removed = 0
+
+        while start <= bounds['last']:
+            end = start + window - datetime.timedelta(days=1)
+            with transaction.atomic():
+                duplicate_ids = self.get_duplicate_ids(start, end)
+                if not options['dry_run']:
+                    self.delete_rows(duplicate_ids)
+
+            num_removed += len(duplicate_ids)
+            start = end + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS('{} {} duplicate attendance rows.'.format(
+            'Found' if options['dry_run'] else 'Removed', num_removed
+        )))
+
+    def get_duplicate_ids(self, start, end):
+        """
+        :desc: IDs of the rows between `start` and `end` that repeat an older row.
+        """
+
+        window_rows = Attendance.objects.filter(class_date__range=(start, end)).order_by()
+        groups = window_rows.values('user_id', 'class_date', 'is_extra_class').annotate(
+            keep_id=Min('id'),
+            num_rows=Count('id')
+        ).filter(num_rows__gt=1)
+
+        keep_ids = {(group['user_id'], group['class_date'], group['is_extra_class']): group['keep_id']
+                    for group in groups}
+        if not keep_ids:
+            return []
+
+        duplicate_ids = []
+        user_ids = {user_id for user_id, _, _ in keep_ids}
+        for chunk in chunks(user_ids):
+            rows = window_rows.filter(user_id__in=chunk).values_list(
+                'id', 'user_id', 'class_date', 'is_extra_class'
+            )
+            for row_id, user_id, class_date, is_extra_class in rows:
+                keep_id = keep_ids.get((user_id, class_date, is_extra_class))
+                if keep_id is not None and row_id != keep_id:
+                    duplicate_ids.append(row_id)
+
+        return duplicate_ids
+
+    def delete_rows(self, row_ids):
+        """
+        :desc: Deletes rows by id without `post_delete` signals, duplicates do not
+               change the attendance summaries.
+        """
+
+        table = connection.ops.quote_name(Attendance._meta.db_table)
+        with connection.cursor() as cursor:
+            for chunk in chunks(row_ids):
+                cursor.execute(
+                    'DELETE FROM {} WHERE id IN ({})'.format(table, ', '.join(['%s'] * len(chunk))),
+                    chunk
+                )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main.imports import IMPORT_CHUNK_SIZE, import_students
+
+
+class Command(BaseCommand):
+    help = ('Imports students from a CSV file with first_name, last_name, class_num and '
+            'student profile columns, reporting the rows which could not be imported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help='Number of students inserted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only validate the rows.')
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as csv_file:
+            report = import_students(csv_file, options['chunk_size'], options['dry_run'])
+
+        for error in report['errors']:
+            self.stderr.write('row {}: {}'.format(error['row'], error['errors']))
+
+        self.stdout.write('{}{} rows, {} students created, {} errors'.format(
+            '[dry run] ' if report['dry_run'] else '',
+            report['num_rows'],
+            report['created'],
+            len(report['errors'])
+        ))
@@ -0,0 +1,149 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from main.models import Attendance
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = ('Partitions the attendance table by month on MySQL (RANGE COLUMNS on class_date), '
+            'or adds the partitions of the coming months to an already partitioned table. '
+            'The rows are copied in batches into a partitioned copy of the table while it stays '
+            'in use, then the tables are swapped under a write lock held for the rows changed '
+            'meanwhile and a primary key scan for the deleted ones (MySQL 8.0.13 or later). '
+            'The partitioned table has no foreign key to the user table and its primary key '
+            'becomes (id, class_date); the old table is kept as <table>_unpartitioned.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of future months to create partitions for.')
+        parser.add_argument('--extend', action='store_true', default=False,
+                            help='Only add the coming months to a partitioned table (run monthly).')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Range of ids copied per statement.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Print the statements without running them.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('Partitioning is only supported on MySQL.')
+
+        self.table = Attendance._meta.db_table
+        self.dry_run = options['dry_run']
+        next_month = add_months(datetime.date.today(), 1)
+        last_month = add_months(next_month, options['months_ahead'])
+
+        if options['extend']:
+            for statement in self.get_extend_statements(next_month, last_month):
+                self.run(statement)
+        else:
+            self.partition(last_month, options['batch_size'])
+
+    def run(self, statement, params=None):
+        self.stdout.write(statement + ';')
+        if not self.dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute(statement, params)
+
+    def get_partitions(self, start, end):
+        """
+        :desc: One partition per month from `start` up to (excluding) `end`.
+        """
+
+        partitions = []
+        month = datetime.date(start.year, start.month, 1)
+
+        while month < end:
+            upper = add_months(month, 1)
+            partitions.append("PARTITION p{:%Y%m} VALUES LESS THAN ('{:%Y-%m-%d}')".format(month, upper))
+            month = upper
+
+        return partitions
+
+    def partition(self, end, batch_size):
+        """
+        :desc: MySQL requires the partitioning column in every unique key and does not
+               allow foreign keys on partitioned tables, so the copy gets the primary key
+               (id, class_date) and, as `CREATE TABLE ... LIKE` leaves them out, no foreign
+               key. The unique (user, class_date, is_extra_class) key already contains
+               class_date. Rows deleted, changed or added during the copy are applied
+               under the lock before the swap, changed ones deleted and copied again.
+        """
+
+        if self.get_partition_names():
+            raise CommandError('{} is already partitioned, run with --extend.'.format(self.table))
+
+        shadow = '{}_partitioned'.format(self.table)
+        old = '{}_unpartitioned'.format(self.table)
+        first_date = Attendance.objects.aggregate(first=Min('class_date'))['first'] or datetime.date.today()
+        started_at = timezone.now()
+
+        self.run('CREATE TABLE `{}` LIKE `{}`'.format(shadow, self.table))
+        self.run('ALTER TABLE `{}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `class_date`)'.format(shadow))
+        self.run('ALTER TABLE `{}` PARTITION BY RANGE COLUMNS(`class_date`) ({})'.format(
+            shadow,
+            ', '.join(self.get_partitions(first_date, end) + ['PARTITION pmax VALUES LESS THAN (MAXVALUE)'])
+        ))
+
+        copy = 'INSERT INTO `{}` SELECT * FROM `{}` WHERE `id` > %s AND `id` <= %s'.format(shadow, self.table)
+        last_id = Attendance.objects.aggregate(last=Max('id'))['last'] or 0
+        if self.dry_run:
+            self.stdout.write('{}; -- per {} ids up to {}'.format(copy, batch_size, last_id))
+        else:
+            for lower in range(0, last_id, batch_size):
+                upper = min(lower + batch_size, last_id)
+                with connection.cursor() as cursor:
+                    cursor.execute(copy, [lower, upper])
+                self.stderr.write('Copied ids up to {} of {}'.format(upper, last_id))
+
+        self.run('LOCK TABLES `{}` WRITE, `{}` WRITE'.format(self.table, shadow))
+        try:
+            self.run('DELETE FROM `{}` WHERE `id` NOT IN (SELECT `id` FROM `{}`)'.format(
+                shadow, self.table))
+            # changed rows are deleted and copied again rather than replaced, as a changed
+            # class_date is another primary key in the copy and would leave the old row
+            changed = 'FROM `{}` WHERE `id` <= %s AND `updated_at` >= %s'.format(self.table)
+            self.run('DELETE FROM `{}` WHERE `id` IN (SELECT `id` {})'.format(shadow, changed),
+                     [last_id, started_at])
+            self.run('INSERT INTO `{}` SELECT * {}'.format(shadow, changed), [last_id, started_at])
+            self.run('INSERT INTO `{}` SELECT * FROM `{}` WHERE `id` > %s'.format(shadow, self.table),
+                     [last_id])
+            self.run('RENAME TABLE `{}` TO `{}`, `{}` TO `{}`'.format(
+                self.table, old, shadow, self.table))
+        finally:
+            self.run('UNLOCK TABLES')
+
+        self.stdout.write('Kept the previous table as {}, drop it once the partitioned one is checked.'
+                          .format(old))
+
+    def get_extend_statements(self, start, end):
+        existing = set(self.get_partition_names())
+        if not existing:
+            raise CommandError('{} is not partitioned yet, run without --extend first.'.format(self.table))
+
+        partitions = [partition for partition in self.get_partitions(start, end)
+                      if partition.split()[1] not in existing]
+        if not partitions:
+            return []
+
+        return ['ALTER TABLE `{}` REORGANIZE PARTITION pmax INTO ({})'.format(
+            self.table,
+            ', '.join(partitions + ['PARTITION pmax VALUES LESS THAN (MAXVALUE)'])
+        )]
+
+    def get_partition_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL',
+                [self.table]
+            )
+            return [row[0] for row in cursor.fetchall()]
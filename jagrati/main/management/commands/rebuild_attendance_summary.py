@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.attendance import rebuild_attendance_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds per-user attendance summaries and class days from the attendance table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of summaries inserted per query.')
+
+    def handle(self, *args, **options):
+        num_summaries, num_class_days = rebuild_attendance_summaries(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt {} attendance summaries over {} class days.'.format(num_summaries, num_class_days)
+        ))
@@ -0,0 +1,162 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main.attendance import rebuild_attendance_summaries
+from main.models import (Attendance, Class, Event, Notification, StudentProfile, Subject,
+                         UserNotification, UserProfile, VolunteerSubject, )
+
+SEED_PREFIX = 'seed-'
+
+
+class Command(BaseCommand):
+    help = ('Seeds a synthetic dataset with bulk inserts for benchmarking, '
+            'e.g. --students 50000 --volunteers 5000 --attendance 5000000.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=100)
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--volunteers', type=int, default=500)
+        parser.add_argument('--subjects', type=int, default=10)
+        parser.add_argument('--events', type=int, default=500)
+        parser.add_argument('--attendance', type=int, default=100000,
+                            help='Number of attendance rows.')
+        parser.add_argument('--user-notifications', type=int, default=100000,
+                            help='Number of user notification rows.')
+        parser.add_argument('--attendance-rate', type=float, default=0.7,
+                            help='Share of users present on a class day.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if User.objects.filter(username__startswith=SEED_PREFIX).exists():
+            self.stderr.write('A seeded dataset already exists, use a fresh database.')
+            return
+
+        self.step('classes and subjects', self.seed_reference_data, options)
+        student_ids = self.step('students', self.seed_students, options)
+        volunteer_ids = self.step('volunteers', self.seed_volunteers, options)
+        self.step('events', self.seed_events, options)
+        self.step('attendance', self.seed_attendance, student_ids + volunteer_ids, options)
+        self.step('notifications', self.seed_notifications, volunteer_ids, options)
+        self.step('attendance summaries', rebuild_attendance_summaries)
+
+    def step(self, name, func, *args):
+        started_at = time.time()
+        result = func(*args)
+        self.stdout.write('Seeded {} in {:.1f}s'.format(name, time.time() - started_at))
+        return result
+
+    def bulk_create(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def create_users(self, kind, count, **fields):
+        """
+        :return: list of IDs of the created users
+        """
+
+        usernames = ['{}{}-{}'.format(SEED_PREFIX, kind, index) for index in range(count)]
+        with transaction.atomic():
+            self.bulk_create(User, [
+                User(username=username, first_name=kind, last_name=username, **fields)
+                for username in usernames
+            ])
+
+        return list(User.objects.filter(
+            username__startswith='{}{}-'.format(SEED_PREFIX, kind)
+        ).values_list('id', flat=True))
+
+    def seed_reference_data(self, options):
+        self.bulk_create(Class, [Class(name=str(index + 1)) for index in range(options['classes'])])
+        self.bulk_create(Subject, [Subject(name='subject {}'.format(index))
+                                   for index in range(options['subjects'])])
+
+    def seed_students(self, options):
+        class_ids = list(Class.objects.values_list('id', flat=True))
+        student_ids = self.create_users('student', options['students'])
+
+        with transaction.atomic():
+            self.bulk_create(StudentProfile, [
+                StudentProfile(user_id=user_id, _class_id=random.choice(class_ids), village='village')
+                for user_id in student_ids
+            ])
+
+        return student_ids
+
+    def seed_volunteers(self, options):
+        subject_ids = list(Subject.objects.values_list('id', flat=True))
+        volunteer_ids = self.create_users('volunteer', options['volunteers'], is_staff=True)
+        programmes = [choice for choice, _ in UserProfile.PROGRAMME_CHOICES]
+        disciplines = [choice for choice, _ in UserProfile.DEPARTMENT_CHOICES]
+
+        with transaction.atomic():
+            self.bulk_create(UserProfile, [
+                UserProfile(user_id=user_id, programme=random.choice(programmes),
+                            discipline=random.choice(disciplines))
+                for user_id in volunteer_ids
+            ])
+            self.bulk_create(VolunteerSubject, [
+                VolunteerSubject(volunteer_id=user_id, subject_id=random.choice(subject_ids))
+                for user_id in volunteer_ids
+            ])
+
+        return volunteer_ids
+
+    def seed_events(self, options):
+        now = timezone.now()
+        self.bulk_create(Event, [
+            Event(time=now + datetime.timedelta(days=index), _type='EVENT',
+                  title='event {}'.format(index), description='seeded event')
+            for index in range(options['events'])
+        ])
+
+    def seed_attendance(self, user_ids, options):
+        """
+        :desc: Walks back one class day at a time, marking a random share of the users
+               present, until `--attendance` rows exist.
+        """
+
+        remaining = options['attendance']
+        per_day = max(int(len(user_ids) * options['attendance_rate']), 1)
+        class_date = datetime.date.today()
+
+        while remaining > 0 and user_ids:
+            present = random.sample(user_ids, min(per_day, remaining, len(user_ids)))
+            with transaction.atomic():
+                self.bulk_create(Attendance, [Attendance(user_id=user_id, class_date=class_date)
+                                              for user_id in present])
+            remaining -= len(present)
+            class_date -= datetime.timedelta(days=1)
+
+    def seed_notifications(self, user_ids, options):
+        if not user_ids:
+            return
+
+        num_notifications = -(-options['user_notifications'] // len(user_ids))
+        self.bulk_create(Notification, [
+            Notification(to_only_admin=False, _type='event', content='seeded {}'.format(index))
+            for index in range(num_notifications)
+        ])
+
+        remaining = options['user_notifications']
+        notification_ids = Notification.objects.filter(
+            content__startswith='seeded '
+        ).values_list('id', flat=True)
+        for notification_id in notification_ids:
+            batch = user_ids[:remaining]
+            with transaction.atomic():
+                self.bulk_create(UserNotification, [
+                    UserNotification(user_id=user_id, notification_id=notification_id)
+                    for user_id in batch
+                ])
+            remaining -= len(batch)
+            if remaining <= 0:
+                break
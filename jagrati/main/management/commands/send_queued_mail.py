@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.mailer import drain, get_metrics
+
+
+class Command(BaseCommand):
+    help = 'Sends queued mails from the outbox, once or continuously.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Drain the outbox once and exit.')
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_BATCH_SIZE)
+        parser.add_argument('--interval', type=int, default=settings.MAIL_POLL_INTERVAL,
+                            help='Seconds to sleep when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            num_processed = drain(options['batch_size'])
+            if num_processed:
+                self.stdout.write('Processed {} mails. {}'.format(num_processed, get_metrics()))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
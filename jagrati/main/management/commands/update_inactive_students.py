@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main.crons import update_inactive_students
+
+
+class Command(BaseCommand):
+    help = 'Deactivates students absent for `Config.num_inactive_student_days` days and reactivates returning ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only report how many students would change.')
+
+    def handle(self, *args, **options):
+        report = update_inactive_students(dry_run=options['dry_run'])
+
+        self.stdout.write(
+            '{prefix}window {window_start} to {window_end}: '
+            '{deactivated} deactivated, {reactivated} reactivated in {seconds}s'.format(
+                prefix='[dry run] ' if report['dry_run'] else '',
+                **report
+            )
+        )
@@ -0,0 +1,177 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlquote
+from rest_framework.permissions import BasePermission
+from rest_framework.views import APIView
+
+from .storage import check_signature, get_name_hash
+
+# MEDIA_ROOT is the project directory, only uploads are served from it
+MEDIA_PREFIXES = ('uploads/', )
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_BLOCK_SIZE = 64 * 1024
+
+
+class HasMediaAccess(BasePermission):
+    def has_permission(self, request, view):
+        """
+        Permission check for media: authenticated users, or anyone with a URL signed
+        for the file by the storage.
+        """
+
+        if request.user and request.user.is_authenticated:
+            return True
+
+        return view.is_signed(request)
+
+
+def parse_range(header, size):
+    """
+    :desc: Parses a single byte range of a `Range` header. Other units and multiple
+           ranges are ignored, and the whole file is sent.
+    :param: `size` size of the file in bytes
+    :return: tuple of the first and last byte (both included), `None` to send the
+             whole file, raises `ValueError` if the range is past the end of the file
+    """
+
+    match = RANGE_RE.match(header.strip())
+    if match is None or not any(match.groups()):
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size - 1
+        if not int(last):
+            raise ValueError('Empty suffix range.')
+
+    if start >= size:
+        raise ValueError('Range starts past the end of the file.')
+
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(RANGE_BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+class MediaView(APIView):
+    """
+    Serves uploaded files after the permission check. With `MEDIA_SENDFILE` set to
+    `nginx` or `apache`, the transfer is handed to the web server through an
+    `X-Accel-Redirect` or `X-Sendfile` header and no worker streams the bytes.
+    Otherwise the file is sent from here, honouring single byte `Range` requests.
+    Content-hashed names are cached for `MEDIA_CACHE_MAX_AGE`.
+    """
+
+    permission_classes = (HasMediaAccess, )
+    schema = None
+
+    def is_signed(self, request):
+        return check_signature(self.kwargs.get('path', ''), request.query_params.get('sig', ''))
+
+    def get_file_path(self, name):
+        if posixpath.normpath(name) != name or not name.startswith(MEDIA_PREFIXES):
+            raise Http404
+
+        try:
+            path = safe_join(settings.MEDIA_ROOT, name)
+        except SuspiciousFileOperation:
+            raise Http404
+
+        if not os.path.isfile(path):
+            raise Http404
+
+        return path
+
+    def get_cache_control(self, request, name):
+        if get_name_hash(name) is None:
+            return 'private, no-cache'
+
+        # uploads are not public, shared caches would serve them past the signature expiry
+        return 'private, max-age={}, immutable'.format(
+            getattr(settings, 'MEDIA_CACHE_MAX_AGE', 60 * 60 * 24 * 365)
+        )
+
+    def get(self, request, path):
+        """
+        :desc: Sends the uploaded file at `path`, relative to `MEDIA_ROOT`.
+        """
+
+        file_path = self.get_file_path(path)
+        stat = os.stat(file_path)
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        version = get_name_hash(path) or '{:x}-{:x}'.format(int(stat.st_mtime), stat.st_size)
+        etag = '"{}"'.format(version)
+        last_modified = http_date(stat.st_mtime)
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self.get_file_response(request, file_path, stat.st_size, content_type, etag)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Cache-Control'] = self.get_cache_control(request, path)
+        return response
+
+    def get_file_response(self, request, file_path, size, content_type, etag):
+        sendfile = getattr(settings, 'MEDIA_SENDFILE', '')
+
+        if sendfile == 'nginx':
+            # nginx answers `Range` and keeps `Content-Type`/`Cache-Control` of this response
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = urlquote('{}{}'.format(
+                settings.MEDIA_ACCEL_PREFIX,
+                os.path.relpath(file_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            ))
+            return response
+
+        if sendfile == 'apache':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = file_path
+            return response
+
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(size)
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(file_path, start, end - start + 1),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+            response['Content-Length'] = end - start + 1
+
+        response['Accept-Ranges'] = 'bytes'
+        return response
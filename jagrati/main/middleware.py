@@ -0,0 +1,88 @@
+import logging
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .routers import get_pin_key, is_pinned, pin_to_primary, routing
+
+logger = logging.getLogger(__name__)
+
+
+class NPlusOneGuardMiddleware(object):
+    """
+    Counts how often each SQL statement runs during a request. A statement repeated
+    more than `NPLUSONE_THRESHOLD` times usually means a relation is loaded once per
+    serialized row, so the query count grows with the number of rows. Enabled by
+    `NPLUSONE_GUARD`, in development only, and logs a warning.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'NPLUSONE_GUARD', False):
+            return self.get_response(request)
+
+        statements = Counter()
+
+        def count_statement(execute, sql, params, many, context):
+            statements[sql] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_statement))
+            response = self.get_response(request)
+
+        threshold = getattr(settings, 'NPLUSONE_THRESHOLD', 10)
+        repeated = [(sql, count) for sql, count in statements.most_common() if count > threshold]
+        if repeated:
+            message = '{} {} ran {} queries, repeated statements: {}'.format(
+                request.method,
+                request.path,
+                sum(statements.values()),
+                '; '.join('{}x {}'.format(count, sql) for sql, count in repeated)
+            )
+            logger.warning(message)
+
+        return response
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Lets `main.routers.ReplicaRouter` read from replicas during safe requests (GET,
+    HEAD, OPTIONS). A request which wrote pins its client to the primary for
+    `REPLICA_PIN_SECONDS`, so the client reads its own writes while the replicas
+    catch up. Streamed responses keep the routing of their request.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = get_pin_key(request)
+        use_replica = request.method in self.SAFE_METHODS and not is_pinned(pin_key)
+
+        with routing(use_replica) as state:
+            response = self.get_response(request)
+
+        if state.wrote:
+            pin_to_primary(pin_key)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, use_replica and not state.wrote, pin_key
+            )
+
+        return response
+
+    def stream(self, content, use_replica, pin_key):
+        with routing(use_replica) as state:
+            for chunk in content:
+                yield chunk
+
+        if state.wrote:
+            pin_to_primary(pin_key)
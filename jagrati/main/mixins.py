@@ -0,0 +1,71 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+_eager_loading_cache = {}
+
+
+def get_eager_loading(serializer_class):
+    """
+    :desc: Relations a serializer walks for every row. Nested model serializers over a
+           foreign key or one-to-one are joined with `select_related`, nested lists are
+           prefetched. Relations walked by method fields are declared on the serializer
+           `Meta` as `select_related` / `prefetch_related`.
+    :param: `serializer_class` ModelSerializer class
+    :return: tuple of `select_related` and `prefetch_related` lookups
+    """
+
+    if serializer_class not in _eager_loading_cache:
+        select_related, prefetch_related = set(), set()
+        _collect_relations(serializer_class(), '', select_related, prefetch_related)
+        _eager_loading_cache[serializer_class] = (sorted(select_related), sorted(prefetch_related))
+
+    return _eager_loading_cache[serializer_class]
+
+
+def _collect_relations(serializer, prefix, select_related, prefetch_related):
+    meta = getattr(serializer, 'Meta', None)
+    model = getattr(meta, 'model', None)
+    if model is None:
+        return
+
+    select_related.update(prefix + lookup for lookup in getattr(meta, 'select_related', ()))
+    prefetch_related.update(prefix + lookup for lookup in getattr(meta, 'prefetch_related', ()))
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.ModelSerializer):
+            continue
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+
+        lookup = prefix + field.source
+        if model_field.is_relation and not many and (model_field.many_to_one or model_field.one_to_one):
+            select_related.add(lookup)
+            _collect_relations(nested, lookup + '__', select_related, prefetch_related)
+        elif model_field.is_relation:
+            prefetch_related.add(lookup)
+
+
+class EagerLoadingMixin(object):
+    """
+    Applies the eager loading of the viewset serializer to the querysets it lists
+    and retrieves, so serializing `n` rows does not run `n` extra queries.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        select_related, prefetch_related = get_eager_loading(self.get_serializer_class())
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        return queryset
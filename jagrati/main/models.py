@@ -2,12 +2,12 @@ from __future__ import unicode_literals
 
 import datetime
 
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 class UserProfile(models.Model):
@@ -36,6 +36,12 @@ class UserProfile(models.Model):
     status = models.CharField(max_length=128, blank=True, null=True)
     is_contact_hidden = models.BooleanField(default=False)
     display_picture = models.ImageField(upload_to='uploads/', blank=True, null=True)
+    display_picture_thumbnail = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
+    display_picture_compressed = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -63,7 +69,15 @@ class StudentProfile(models.Model):
     contact = models.BigIntegerField(blank=True, null=True)
     emergency_contact = models.BigIntegerField(blank=True, null=True)
     display_picture = models.ImageField(upload_to='uploads/', blank=True, null=True)
+    display_picture_thumbnail = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
+    display_picture_compressed = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
     address = models.CharField(max_length=50, blank=True, null=True)
+    # set by `update_inactive_students`, which only reactivates the students it deactivated
+    deactivated_for_absence = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -78,10 +92,47 @@ class Attendance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # the unique index also serves per-user lookups, the second one serves date
+        # filters and window scans without reading the table rows
+        unique_together = ('user', 'class_date', 'is_extra_class')
+        indexes = [
+            models.Index(fields=['class_date', 'user'], name='attendance_date_user_idx'),
+        ]
+
     def __str__(self):
         return '{} - {}'.format(self.user, self.class_date)
 
 
+class AttendanceSummary(models.Model):
+    """
+    Per-user attendance counters maintained alongside `Attendance` rows.
+    Rebuild with `python manage.py rebuild_attendance_summary`.
+    """
+
+    user = models.OneToOneField(User, related_name='attendance_summary', on_delete=models.CASCADE)
+    num_days = models.IntegerField(default=0)
+    num_class_days = models.IntegerField(default=0)
+    num_extra_class_days = models.IntegerField(default=0)
+    last_attended_date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} - {} - {}'.format(self.user, self.num_class_days, self.num_extra_class_days)
+
+
+class ClassDay(models.Model):
+    """
+    One row per distinct `Attendance.class_date`, so the total number of
+    classes held is a count over a small table.
+    """
+
+    date = models.DateField(unique=True)
+
+    def __str__(self):
+        return '{}'.format(self.date)
+
+
 class Hobby(models.Model):
     name = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -167,7 +218,7 @@ class ClassFeedback(models.Model):
     _class = models.ForeignKey(Class, related_name='class_feedback', on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, related_name='subject_feedback', on_delete=models.CASCADE)
     feedback = models.CharField(max_length=100)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -185,7 +236,13 @@ class Event(models.Model):
     title = models.CharField(max_length=30)
     description = models.CharField(max_length=200)
     image = models.ImageField(upload_to='uploads', blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    image_thumbnail = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
+    image_compressed = models.ImageField(
+        upload_to='uploads/thumbs/', blank=True, null=True, editable=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -215,7 +272,7 @@ class JoinRequest(models.Model):
     email = models.EmailField(max_length=50, unique=True)
     name = models.CharField(max_length=50)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -234,6 +291,9 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        index_together = ('to_only_admin', 'created_at')
+
     def __str__(self):
         return '{} - {} - {}'.format(self._type, self.content, self.created_at)
 
@@ -243,10 +303,63 @@ class UserNotification(models.Model):
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE)
     is_seen = models.BooleanField(default=False)
 
+    class Meta:
+        index_together = ('user', 'is_seen')
+
     def __str__(self):
         return '{} - {} - {}'.format(self.user, self.notification, self.is_seen)
 
 
+class NotificationCursor(models.Model):
+    """
+    Read position of a user in the notification feed, used when notifications
+    are pulled by audience instead of fanned out to `UserNotification` rows. Every
+    notification up to `last_seen_id` is seen, as are the ones in `seen_ids`
+    (comma separated), read on pages above an older unseen notification.
+    """
+
+    user = models.OneToOneField(User, related_name='notification_cursor', on_delete=models.CASCADE)
+    last_seen_id = models.IntegerField(default=0)
+    seen_ids = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} - {}'.format(self.user, self.last_seen_id)
+
+
+class OutgoingMail(models.Model):
+    """
+    Outbox of mails, sent after the queuing transaction commits by `main.mailer`.
+    The body is cleared once sent or failed for good, as it may carry credentials.
+    """
+
+    STATUS_CHOICES = (
+        ('PENDING', 'PENDING'),
+        ('SENDING', 'SENDING'),
+        ('SENT', 'SENT'),
+        ('FAILED', 'FAILED'),
+    )
+
+    subject = models.CharField(max_length=200)
+    message = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = ('status', 'next_attempt_at')
+
+    def __str__(self):
+        return '{} - {} - {}'.format(self.to, self.subject, self.status)
+
+
 class Config(models.Model):
     num_inactive_student_days = models.IntegerField(default=7)
 
@@ -271,14 +384,9 @@ def create_notification(obj, _type, content, to_only_admin, instance_id):
         instance_id=instance_id
     )
 
-    if to_only_admin:
-        filters = {'is_superuser': True}
-    else:
-        filters = {'is_staff': True}
+    from .notifications import fan_out_notification
 
-    users = User.objects.filter(**filters)
-    user_notifications = [UserNotification.objects.create(user=user, notification=notification)
-                          for user in users]
+    fan_out_notification(notification)
 
 
 @receiver(post_save, sender=JoinRequest)
@@ -292,7 +400,75 @@ def send_join_request_mail(sender, instance, **kwargs):
         from_email = 'support@jagrati.com'
         to_email = [settings.EMAIL_HOST_USER]
 
-        send_mail(subject, message, from_email, to_email, fail_silently=False)
+        from .mailer import queue_mail
+
+        queue_mail(subject, message, from_email, to_email)
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_saved_attendance(sender, instance, raw=False, **kwargs):
+    instance._saved_attendance = None
+
+    if instance.pk and not raw:
+        instance._saved_attendance = Attendance.objects.filter(
+            pk=instance.pk
+        ).values_list('user_id', 'class_date').first()
+
+
+@receiver(post_save, sender=Attendance)
+def refresh_saved_attendance_summary(sender, instance, raw=False, **kwargs):
+    """
+    :desc: Keeps the summaries and class days of rows saved one at a time, e.g. from
+           the admin or a PUT on `/attendance/<id>/`. Rows of `record_attendance` are
+           bulk inserted, send no signal and are counted there.
+    """
+
+    if raw:
+        return
+
+    from .attendance import refresh_attendance_summary
+
+    ClassDay.objects.get_or_create(date=instance.class_date)
+    refresh_attendance_summary(instance.user_id, instance.class_date)
+
+    saved = getattr(instance, '_saved_attendance', None)
+    if saved and saved != (instance.user_id, instance.class_date):
+        refresh_attendance_summary(*saved)
+
+
+@receiver(post_delete, sender=Attendance)
+def refresh_user_attendance_summary(sender, instance, **kwargs):
+    from .attendance import refresh_attendance_summary
+
+    refresh_attendance_summary(instance.user_id, instance.class_date)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_cached_model_version(sender, **kwargs):
+    from .cache import VERSIONED_MODELS, bump_model_version
+
+    if sender in VERSIONED_MODELS:
+        # after commit, so a concurrent read cannot cache rows of the old version
+        # under the new one
+        transaction.on_commit(lambda: bump_model_version(sender))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_cached_user_claims(sender, instance, **kwargs):
+    from .authentication import revoke_users
+
+    transaction.on_commit(lambda: revoke_users([instance.pk]))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=Event)
+def process_uploaded_images(sender, instance, **kwargs):
+    from .images import schedule_processing
+
+    schedule_processing(instance)
 
 
 @receiver(post_save, sender=Event)
@@ -0,0 +1,51 @@
+from django.db.backends.mysql.base import Database, DatabaseWrapper as MySQLDatabaseWrapper
+
+from main.db_pool import get_pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    """
+    MySQL backend taking its connections from a per-process `main.db_pool` pool
+    configured by the `POOL` options of the database. Closing the connection at the
+    end of a request (`CONN_MAX_AGE` 0) hands it back to the pool instead of ending
+    the session. Without `POOL` it behaves as the MySQL backend.
+    """
+
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return super().get_new_connection(conn_params)
+
+        pool = get_pool(self.alias, options)
+        conn = pool.checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            self.is_alive
+        )
+        self.pool = pool
+        return conn
+
+    def is_alive(self, conn):
+        try:
+            conn.ping()
+        except Database.Error:
+            return False
+        else:
+            return True
+
+    def _close(self):
+        pool, self.pool = self.pool, None
+        if pool is None:
+            return super()._close()
+
+        # a connection closed inside a transaction stays referenced by this wrapper
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_alive(self.connection))
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+                self.connection.autocommit(True)
+            except Database.Error:
+                discard = True
+
+        pool.checkin(self.connection, discard=discard)
@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Min, Q
+
+from .models import Notification, NotificationCursor, UserNotification
+
+FANOUT_BULK = 'bulk'
+FANOUT_PULL = 'pull'
+FANOUT_BATCH_SIZE = 1000
+# ids kept above the read cursor, low enough for an IN list on every backend
+SEEN_IDS_LIMIT = 500
+
+
+def get_fanout_mode():
+    return getattr(settings, 'NOTIFICATION_FANOUT', FANOUT_BULK)
+
+
+def get_recipients(notification):
+    """
+    :desc: Users a notification is meant for.
+    :param: `notification` Notification instance
+    """
+
+    if notification.to_only_admin:
+        return User.objects.filter(is_superuser=True)
+    return User.objects.filter(is_staff=True)
+
+
+def fan_out_notification(notification, mode=None):
+    """
+    :desc: Delivers `notification` to its recipients. In bulk mode one `UserNotification`
+           row per recipient is inserted in batches, in pull mode nothing is written and
+           recipients read the notification through `get_feed`.
+    :param: `notification` Notification instance
+            `mode` fan-out mode, defaults to `settings.NOTIFICATION_FANOUT`
+    :return: number of `UserNotification` rows created
+    """
+
+    if (mode or get_fanout_mode()) == FANOUT_PULL:
+        return 0
+
+    user_ids = get_recipients(notification).values_list('id', flat=True)
+    num_created = 0
+    batch = []
+
+    for user_id in user_ids.iterator():
+        batch.append(UserNotification(user_id=user_id, notification=notification))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            UserNotification.objects.bulk_create(batch)
+            num_created += len(batch)
+            batch = []
+
+    UserNotification.objects.bulk_create(batch)
+    return num_created + len(batch)
+
+
+def get_audience_filter(user):
+    """
+    :desc: Filter for the notifications addressed to `user`, mirroring `get_recipients`.
+    """
+
+    audience = Q(pk__in=[])
+
+    if user.is_superuser:
+        audience |= Q(to_only_admin=True)
+    if user.is_staff:
+        audience |= Q(to_only_admin=False)
+
+    return audience
+
+
+def get_feed(user):
+    """
+    :desc: Notifications of `user` in pull mode, newest first. Notifications created
+           before the user joined are left out, as they were never fanned out to them.
+    """
+
+    return Notification.objects.filter(
+        get_audience_filter(user),
+        created_at__gte=user.date_joined
+    ).order_by('-created_at', '-id')
+
+
+def get_read_position(user):
+    """
+    :desc: Read position of `user`, nothing seen until a page of the feed was read.
+           Reading never creates the cursor, so a feed read stays a read.
+    :return: tuple of `last_seen_id` and the `frozenset` of ids seen above it
+    """
+
+    position = NotificationCursor.objects.filter(user=user).values_list('last_seen_id', 'seen_ids').first()
+    if position is None:
+        return 0, frozenset()
+
+    last_seen_id, seen_ids = position
+    return last_seen_id, frozenset(int(seen_id) for seen_id in seen_ids.split(',') if seen_id)
+
+
+def save_read_position(user, last_seen_id, seen_ids):
+    """
+    :desc: Stores the read position of `user`, creating the cursor on the first page
+           read. The cursor never moves backwards, so concurrent polls cannot unmark
+           notifications.
+    """
+
+    seen_ids = ','.join(str(seen_id) for seen_id in sorted(seen_ids))
+    cursor, created = NotificationCursor.objects.get_or_create(
+        user=user,
+        defaults={'last_seen_id': last_seen_id, 'seen_ids': seen_ids}
+    )
+    if not created:
+        NotificationCursor.objects.filter(
+            id=cursor.id,
+            last_seen_id__lte=last_seen_id
+        ).update(last_seen_id=last_seen_id, seen_ids=seen_ids)
+
+
+def mark_page_seen(user, notifications, last_seen_id, seen_ids):
+    """
+    :desc: Marks a returned page of the feed as seen. The cursor moves up to the
+           first unseen notification left out of the pages read so far, the ids of
+           the page above it are kept in `seen_ids`. Past `SEEN_IDS_LIMIT` of them
+           the cursor skips the oldest unseen notifications instead.
+    :param: `notifications` the page, `last_seen_id` and `seen_ids` the read position
+            it was read with
+    """
+
+    page_seen_ids = seen_ids.union(
+        notification.id for notification in notifications if notification.id > last_seen_id
+    )
+    if page_seen_ids == seen_ids:
+        return
+
+    first_unseen_id = get_feed(user).filter(
+        id__gt=last_seen_id,
+        id__lt=max(page_seen_ids)
+    ).exclude(id__in=page_seen_ids).order_by().aggregate(first=Min('id'))['first']
+
+    if first_unseen_id is None:
+        last_seen_id = max(page_seen_ids)
+    else:
+        last_seen_id = first_unseen_id - 1
+    page_seen_ids = sorted(seen_id for seen_id in page_seen_ids if seen_id > last_seen_id)
+
+    if len(page_seen_ids) > SEEN_IDS_LIMIT:
+        page_seen_ids = page_seen_ids[-SEEN_IDS_LIMIT:]
+        last_seen_id = page_seen_ids[0] - 1
+
+    save_read_position(user, last_seen_id, page_seen_ids)
+
+
+def get_unread_count(user):
+    """
+    :desc: Number of unseen notifications of `user`, read from the (user, is_seen)
+           index in bulk mode or counted past the read position in pull mode.
+    """
+
+    if get_fanout_mode() == FANOUT_PULL:
+        last_seen_id, seen_ids = get_read_position(user)
+        return get_feed(user).filter(id__gt=last_seen_id).exclude(id__in=seen_ids).count()
+
+    return UserNotification.objects.filter(user=user, is_seen=False).count()
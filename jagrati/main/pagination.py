@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    OFFSET-free pagination: the cursor carries the position of the last row, so deep
+    pages cost the same as the first one. Views pick a stable, indexed ordering with
+    `cursor_ordering` (defaults to `id`), clients pick `page_size` up to `max_page_size`.
+    """
+
+    ordering = ('id', )
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', self.ordering))
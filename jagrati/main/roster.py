@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+from django.db.models import Count, Max, Q
+
+from .models import Class, StudentProfile, VolunteerClass
+
+
+def get_active_student_counts(context):
+    """
+    :desc: Number of active students of every class, from one grouped query run once
+           per serializer context, which nested serializers share with their parent.
+    :param: `context` serializer context `dict`
+    :return: `dict` of class ID to count of active students
+    """
+
+    if 'active_student_counts' not in context:
+        rows = StudentProfile.objects.filter(
+            user__is_active=True
+        ).order_by().values_list('_class_id').annotate(count=Count('id'))
+        context['active_student_counts'] = dict(rows)
+
+    return context['active_student_counts']
+
+
+def get_class_dashboard():
+    """
+    :desc: Roster summary of every class: student counts by state, assigned volunteers
+           and the last date any of its students attended. Classes come from one
+           annotated query and volunteers from one join, whatever the number of classes.
+    :return: list of `dict`
+    """
+
+    volunteers = defaultdict(list)
+    rows = VolunteerClass.objects.order_by('volunteer__first_name', 'volunteer_id').values_list(
+        '_class_id', 'volunteer_id', 'volunteer__first_name', 'volunteer__last_name'
+    )
+    for class_id, volunteer_id, first_name, last_name in rows:
+        volunteers[class_id].append({
+            'id': volunteer_id,
+            'first_name': first_name,
+            'last_name': last_name,
+        })
+
+    classes = Class.objects.annotate(
+        num_active_students=Count('student_class', filter=Q(student_class__user__is_active=True)),
+        num_inactive_students=Count('student_class', filter=Q(student_class__user__is_active=False)),
+        last_attendance_date=Max('student_class__user__attendance_summary__last_attended_date')
+    ).order_by('id')
+
+    return [{
+        'id': _class.id,
+        'name': _class.name,
+        'num_active_students': _class.num_active_students,
+        'num_inactive_students': _class.num_inactive_students,
+        'volunteers': volunteers[_class.id],
+        'last_attendance_date': _class.last_attendance_date,
+    } for _class in classes]
@@ -0,0 +1,108 @@
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = 'db:pinned:{}'
+
+_state = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+@contextmanager
+def routing(use_replica):
+    """
+    :desc: Routes the reads of the current thread to a replica while the block runs,
+           e.g. for one safe request. The yielded state records whether it wrote.
+    """
+
+    previous = getattr(_state, 'current', None)
+    state = _state.current = RoutingState(use_replica)
+    try:
+        yield state
+    finally:
+        _state.current = previous
+
+
+class RoutingState(object):
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def get_state():
+    return getattr(_state, 'current', None)
+
+
+def reads_from_replica():
+    state = get_state()
+    return bool(state is not None and state.use_replica and not state.wrote and get_replicas())
+
+
+def get_pin_key(request):
+    """
+    :desc: Identifies the client of `request` for read-after-write pinning, by its
+           token as the API authenticates with JWT, or by address for anonymous ones.
+    """
+
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR') or ''
+    return PIN_KEY.format(hashlib.sha1(credentials.encode('utf-8')).hexdigest())
+
+
+def is_pinned(pin_key):
+    return cache.get(pin_key) is not None
+
+
+def pin_to_primary(pin_key):
+    """
+    :desc: Pins the client of `pin_key` to the primary. The pin lives in the default
+           cache, shared by the worker processes, so the next request of the client
+           honours it whichever process answers.
+    """
+
+    cache.set(pin_key, 1, timeout=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+class ReplicaRouter(object):
+    """
+    Sends reads to a random `DATABASE_REPLICAS` alias inside `routing(use_replica=True)`,
+    set by `ReplicaPinningMiddleware` for safe requests of clients that did not write
+    recently. Everything else, writes, reads after a write in the same request and
+    reads inside a transaction of the primary, goes to `default`. Commands, crons and
+    worker threads run outside `routing` and always use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = get_state()
+        replicas = get_replicas()
+
+        if (state is None or not state.use_replica or state.wrote or not replicas or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = get_state()
+        if state is not None:
+            state.wrote = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS, ) + tuple(get_replicas())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
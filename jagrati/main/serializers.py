@@ -1,13 +1,21 @@
 from __future__ import unicode_literals
 
+import datetime
+
 from django.contrib.auth.models import User
 from django.db.models import Q
 from rest_framework import serializers
 
+from .analytics import AT_RISK_MAX_ABSENCES, AT_RISK_MIN_PERCENTAGE, REPORT_DEFAULT_DAYS
+from .attendance import (get_attendance_summary, get_attendees, get_total_classes,
+                         record_attendance, )
+from .directory import get_volunteer_counts
+from .identity import user_exists
 from .models import (Attendance, Class, ClassFeedback, Config, Event, Hobby, JoinRequest,
                      Notification, Skill, StudentFeedback, StudentProfile, Subject,
                      Syllabus, UserHobby, UserNotification, UserProfile, UserSkill,
                      VolunteerSubject, )
+from .roster import get_active_student_counts
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -32,14 +40,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
         :return: attendance information `dict`
         """
 
-        user_attendance = obj.user.user_attendance.filter(
-            is_extra_class=False
-        ).values('class_date').distinct().count()
-        total_classes = Attendance.objects.values('class_date').distinct().count()
+        summary = get_attendance_summary(obj.user)
 
         return {
-            'attendance': user_attendance,
-            'total_classes': total_classes
+            'attendance': summary.num_class_days if summary else 0,
+            'total_classes': get_total_classes(self.context)
         }
 
     attendance = serializers.SerializerMethodField(read_only=True)
@@ -51,9 +56,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
         :return: `int` number of extra classes
         """
 
-        return obj.user.user_attendance.filter(
-            is_extra_class=True
-        ).values('class_date').distinct().count()
+        summary = get_attendance_summary(obj.user)
+        return summary.num_extra_class_days if summary else 0
 
     extra_classes = serializers.SerializerMethodField(read_only=True)
 
@@ -86,8 +90,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ('user', 'user_id', 'programme', 'discipline', 'dob', 'batch', 'contact',
-                  'address', 'status', 'is_contact_hidden', 'display_picture', 'attendance',
+                  'address', 'status', 'is_contact_hidden', 'display_picture',
+                  'display_picture_thumbnail', 'display_picture_compressed', 'attendance',
                   'hobbies', 'skills', 'extra_classes', )
+        select_related = ('user__attendance_summary', )
+        prefetch_related = ('user__hobby_user__hobby', 'user__skill_user__skill', )
 
 
 class ClassSerializer(serializers.ModelSerializer):
@@ -98,10 +105,7 @@ class ClassSerializer(serializers.ModelSerializer):
         :return: Count of active students
         """
 
-        return StudentProfile.objects.filter(
-            user__is_active=True,
-            _class=obj
-        ).count()
+        return get_active_student_counts(self.context).get(obj.id, 0)
 
     num_active_students = serializers.SerializerMethodField(read_only=True)
 
@@ -131,12 +135,11 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         :return: attendance information `dict`
         """
 
-        user_attendance = obj.user.user_attendance.values('class_date').distinct().count()
-        total_classes = Attendance.objects.values('class_date').distinct().count()
+        summary = get_attendance_summary(obj.user)
 
         return {
-            'attendance': user_attendance,
-            'total_classes': total_classes
+            'attendance': summary.num_days if summary else 0,
+            'total_classes': get_total_classes(self.context)
         }
 
     attendance = serializers.SerializerMethodField(read_only=True)
@@ -144,39 +147,63 @@ class StudentProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentProfile
         fields = ('user', 'user_id', '_class', '_class_id', 'village', 'sex', 'dob', 'mother', 'father',
-                  'contact', 'emergency_contact', 'display_picture', 'attendance', 'address', )
+                  'contact', 'emergency_contact', 'display_picture', 'display_picture_thumbnail',
+                  'display_picture_compressed', 'attendance', 'address', )
+        select_related = ('user__attendance_summary', )
+
+
+def validate_attendee_ids(data, _class=None):
+    """
+    :desc: Checks `user_ids` and `extra_user_ids` of `data` with a single IN query.
+    :param: `data` validated data `dict`
+            `_class` Class instance the students must belong to
+    """
+
+    attendees = get_attendees(data['user_ids'] + data['extra_user_ids'])
+    errors = {}
+
+    for field in ('user_ids', 'extra_user_ids'):
+        invalid_ids = [user_id for user_id in data[field] if user_id not in attendees]
+        if invalid_ids:
+            errors[field] = ['Invalid pk {} - object does not exist.'.format(invalid_ids)]
+            continue
+
+        if _class is not None:
+            outside_ids = [user_id for user_id in data[field]
+                           if not attendees[user_id][0] and attendees[user_id][1] != _class.id]
+            if outside_ids:
+                errors[field] = ['Students {} are not in class {}.'.format(outside_ids, _class.name)]
+
+    if errors:
+        raise serializers.ValidationError(errors)
 
 
 class AttendanceSerializer(serializers.ModelSerializer):
     user = UserSerializer(User.objects.all(), read_only=True)
     user_ids = serializers.ListField(
-        child = serializers.PrimaryKeyRelatedField(
-            queryset=User.objects.all(),
-            write_only=True
-        ),
+        child=serializers.IntegerField(),
         write_only=True
     )
     extra_user_ids = serializers.ListField(
-        child = serializers.PrimaryKeyRelatedField(
-            queryset=User.objects.all(),
-            write_only=True
-        ),
+        child=serializers.IntegerField(),
         write_only=True
     )
 
-    def create(self, validated_data):
-        users = validated_data['user_ids']
-        extra_users = validated_data['extra_user_ids']
-        attendance_objs = []
-
-        for user in users:
-            attendance_objs.append(self.Meta.model(user=user))
+    def validate(self, data):
+        validate_attendee_ids(data)
+        return data
 
-        for user in extra_users:
-            attendance_objs.append(self.Meta.model(user=user, is_extra_class=True))
+    def create(self, validated_data):
+        class_date = datetime.date.today()
+        attendance_objs = record_attendance(
+            class_date,
+            validated_data['user_ids'],
+            validated_data['extra_user_ids']
+        )
 
-        self.Meta.model.objects.bulk_create(attendance_objs)
-        return attendance_objs[0]
+        if attendance_objs:
+            return attendance_objs[0]
+        return self.Meta.model(class_date=class_date)
 
     class Meta:
         model = Attendance
@@ -184,6 +211,43 @@ class AttendanceSerializer(serializers.ModelSerializer):
         read_only_fields = ('user', 'class_date', )
 
 
+class MarkAttendanceSerializer(serializers.Serializer):
+    class_id = serializers.PrimaryKeyRelatedField(
+        queryset=Class.objects.all(),
+        required=False
+    )
+    class_date = serializers.DateField(default=datetime.date.today)
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        default=list
+    )
+    extra_user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        default=list
+    )
+
+    def validate(self, data):
+        validate_attendee_ids(data, data.get('class_id'))
+        return data
+
+
+class AttendanceReportSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(default=datetime.date.today)
+    class_id = serializers.IntegerField(required=False)
+    min_percentage = serializers.FloatField(default=AT_RISK_MIN_PERCENTAGE, min_value=0, max_value=100)
+    max_absences = serializers.IntegerField(default=AT_RISK_MAX_ABSENCES, min_value=1)
+
+    def validate(self, data):
+        if 'start' not in data:
+            data['start'] = data['end'] - datetime.timedelta(days=REPORT_DEFAULT_DAYS)
+
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'start': 'Start date must not be after end date.'})
+
+        return data
+
+
 class HobbySerializer(serializers.ModelSerializer):
     class Meta:
         model = Hobby
@@ -240,7 +304,7 @@ class SubjectSerializer(serializers.ModelSerializer):
         :desc: Computes number of volunteers teaching a subject.
         """
 
-        return VolunteerSubject.objects.filter(subject=obj).count()
+        return get_volunteer_counts(self.context).get(obj.id, 0)
 
     num_volunteers = serializers.SerializerMethodField(read_only=True)
 
@@ -321,29 +385,48 @@ class VolunteerSubjectSerializer(serializers.ModelSerializer):
         write_only=True
     )
 
+    def get_user_profile(self, obj):
+        try:
+            return obj.volunteer.user_profile
+        except UserProfile.DoesNotExist:
+            return None
+
     def get_discipline(self, obj):
-        if obj.volunteer.user_profile:
-            return obj.volunteer.user_profile.discipline
+        user_profile = self.get_user_profile(obj)
+        if user_profile:
+            return user_profile.discipline
         return ''
 
     discipline = serializers.SerializerMethodField(read_only=True)
 
     def get_display_picture(self, obj):
-        if obj.volunteer.user_profile and obj.volunteer.user_profile.display_picture:
-            return obj.volunteer.user_profile.display_picture.url
+        user_profile = self.get_user_profile(obj)
+        if user_profile and user_profile.display_picture:
+            return user_profile.display_picture.url
         return ''
 
     display_picture = serializers.SerializerMethodField(read_only=True)
 
+    def get_display_picture_thumbnail(self, obj):
+        user_profile = self.get_user_profile(obj)
+        if user_profile and user_profile.display_picture_thumbnail:
+            return user_profile.display_picture_thumbnail.url
+        return ''
+
+    display_picture_thumbnail = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = VolunteerSubject
-        fields = ('volunteer', 'volunteer_id', 'subject', 'subject_id', 'discipline', 'display_picture', )
+        fields = ('volunteer', 'volunteer_id', 'subject', 'subject_id', 'discipline', 'display_picture',
+                  'display_picture_thumbnail', )
+        select_related = ('volunteer__user_profile', )
 
 
 class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
-        fields = ('id', 'time', '_type', 'title', 'description', 'image', 'created_at', )
+        fields = ('id', 'time', '_type', 'title', 'description', 'image', 'image_thumbnail',
+                  'image_compressed', 'created_at', )
 
 
 class JoinRequestSerializer(serializers.ModelSerializer):
@@ -351,11 +434,10 @@ class JoinRequestSerializer(serializers.ModelSerializer):
         super().validate(data)
         email = data['email']
 
-        try:
-            user = User.objects.get(username=email)
+        if user_exists(email, self.context.get('request')):
             raise serializers.ValidationError("User with {} already exists".format(email))
-        except User.DoesNotExist:
-            return data
+
+        return data
 
     class Meta:
         model = JoinRequest
@@ -369,6 +451,16 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = ('id', '_type', 'content', 'instance_id', 'display_date', )
 
 
+class NotificationFeedSerializer(NotificationSerializer):
+    def get_is_seen(self, obj):
+        return obj.id <= self.context.get('last_seen_id', 0) or obj.id in self.context.get('seen_ids', ())
+
+    is_seen = serializers.SerializerMethodField(read_only=True)
+
+    class Meta(NotificationSerializer.Meta):
+        fields = NotificationSerializer.Meta.fields + ('is_seen', )
+
+
 class UserNotificationSerializer(serializers.ModelSerializer):
     user = UserSerializer(User.objects.all(), read_only=True)
     notification = NotificationSerializer(Notification.objects.all(), read_only=True)
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import baseconv
+from django.utils.http import urlencode
+
+HASH_LENGTH = 12
+HASHED_NAME_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^.]*)?$' % HASH_LENGTH)
+SIGNATURE_SALT = 'main.storage.media'
+
+
+def get_content_hash(content):
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+
+    return hasher.hexdigest()[:HASH_LENGTH]
+
+
+def get_name_hash(name):
+    """
+    :return: the content hash embedded in a stored name, `None` for other names
+    """
+
+    match = HASHED_NAME_RE.match(os.path.basename(name))
+    return match.group('hash') if match else None
+
+
+def strip_content_hash(name):
+    """
+    :desc: Name as it was before `HashedFileSystemStorage` stored it,
+           e.g. `uploads/pic.3fa9c1e07b2d.png` -> `uploads/pic.png`.
+    """
+
+    directory, basename = os.path.split(name)
+    match = HASHED_NAME_RE.match(basename)
+    if match is None:
+        return name
+
+    return os.path.join(directory, match.group('stem') + (match.group('ext') or ''))
+
+
+def get_signature_max_age():
+    return getattr(settings, 'MEDIA_SIGNATURE_MAX_AGE', 60 * 60 * 24 * 2)
+
+
+def get_signature_timestamp():
+    """
+    :desc: Signing time of media URLs, rounded down to half of `MEDIA_SIGNATURE_MAX_AGE`
+           so URLs stay the same, and cacheable, for that long and are valid at least
+           as long after they were handed out.
+    """
+
+    window = max(get_signature_max_age() // 2, 1)
+    return int(time.time()) // window * window
+
+
+def get_signature(name):
+    """
+    :return: `<timestamp>:<signature>` of `name`, in the format of `TimestampSigner`
+    """
+
+    timestamp = baseconv.base62.encode(get_signature_timestamp())
+    signer = signing.TimestampSigner(salt=SIGNATURE_SALT)
+    return '{}:{}'.format(timestamp, signer.signature('{}:{}'.format(name, timestamp)))
+
+
+def check_signature(name, signature):
+    if not signature:
+        return False
+
+    try:
+        signing.TimestampSigner(salt=SIGNATURE_SALT).unsign(
+            '{}:{}'.format(name, signature),
+            max_age=get_signature_max_age()
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Stores every file under a name carrying a hash of its content, so a name never
+    points to other bytes and responses can be cached for good. Saving content that
+    is already stored returns the existing name. URLs are signed, giving clients
+    which can't send the JWT header (e.g. `<img>` tags) access to the file for
+    `MEDIA_SIGNATURE_MAX_AGE` seconds.
+    """
+
+    def get_hashed_name(self, name, content, max_length=None):
+        root, ext = os.path.splitext(strip_content_hash(name))
+        suffix = '.{}{}'.format(get_content_hash(content), ext)
+
+        if max_length and len(root) + len(suffix) > max_length:
+            root = root[:max_length - len(suffix)]
+
+        return root + suffix
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.get_hashed_name(name, content, max_length=max_length)
+        if self.exists(name):
+            return name
+
+        return super().save(name, content, max_length=max_length)
+
+    def url(self, name):
+        return '{}?{}'.format(super().url(name), urlencode({'sig': get_signature(name)}))
@@ -1,3 +1,1319 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail.backends.base import BaseEmailBackend
+from channels.testing import HttpCommunicator
+from django.db import connections, router as db_router, transaction
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_jwt.settings import api_settings as jwt_settings
+
+from .attendance import rebuild_attendance_summaries, record_attendance
+from .authentication import CachedJSONWebTokenAuthentication, revoke_users, token_cache
+from .crons import update_inactive_students
+from . import consumers
+from .cache import VERSIONED_MODELS, ConditionalGetMixin, bump_model_version, get_model_version
+from .db_pool import ConnectionPool, PoolTimeout
+from .exports import STUDENT_COLUMNS, get_lookups, iterate_keyset
+from .identity import UsernameFilter
+from .images import process_image
+from .imports import assign_usernames, import_students
+from .mailer import drain, queue_mail
+from .models import (Attendance, AttendanceSummary, Class, ClassDay, ClassFeedback, Config, Event,
+                     Hobby, JoinRequest, Notification, NotificationCursor, OutgoingMail, Skill,
+                     StudentFeedback, StudentProfile, Subject, Syllabus, UserHobby,
+                     UserNotification, UserProfile, UserSkill, VolunteerClass, VolunteerSubject, )
+from .pagination import KeysetCursorPagination
+from .routers import routing
+from .throttling import SharedBucketStore, SharedTokenBucketThrottle
+from .urls import router
+
+
+def create_student(username, _class):
+    user = User.objects.create_user(username=username, email=username)
+    StudentProfile.objects.create(user=user, _class=_class)
+    return user
+
+
+def get_counts(user):
+    summary = AttendanceSummary.objects.get(user=user)
+    return (summary.num_days, summary.num_class_days, summary.num_extra_class_days,
+            summary.last_attended_date)
+
+
+class AttendanceSummaryTests(TestCase):
+    def setUp(self):
+        self._class = Class.objects.create(name='1')
+        self.students = [
+            create_student('student{}@example.com'.format(index), self._class) for index in range(3)
+        ]
+        self.first_day = datetime.date(2018, 3, 1)
+        self.second_day = datetime.date(2018, 3, 2)
+
+    def test_recording_increments_summaries(self):
+        first, second, third = self.students
+
+        record_attendance(self.first_day, [first.id, second.id], [first.id])
+        record_attendance(self.second_day, [first.id], [])
+
+        self.assertEqual(get_counts(first), (2, 2, 1, self.second_day))
+        self.assertEqual(get_counts(second), (1, 1, 0, self.first_day))
+        self.assertFalse(AttendanceSummary.objects.filter(user=third).exists())
+        self.assertEqual(ClassDay.objects.count(), 2)
+
+    def test_recording_again_changes_nothing(self):
+        first, second, _ = self.students
+
+        record_attendance(self.first_day, [first.id, second.id], [])
+        created = record_attendance(self.first_day, [first.id, second.id], [])
+
+        self.assertEqual(created, [])
+        self.assertEqual(get_counts(first), (1, 1, 0, self.first_day))
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    def test_extra_class_on_an_attended_day_counts_the_day_once(self):
+        first = self.students[0]
+
+        record_attendance(self.first_day, [first.id], [])
+        record_attendance(self.first_day, [], [first.id])
+
+        self.assertEqual(get_counts(first), (1, 1, 1, self.first_day))
+
+    def test_deleting_attendance_refreshes_summary_and_class_days(self):
+        first = self.students[0]
+
+        record_attendance(self.first_day, [first.id], [])
+        record_attendance(self.second_day, [first.id], [])
+        Attendance.objects.get(user=first, class_date=self.second_day).delete()
+
+        self.assertEqual(get_counts(first), (1, 1, 0, self.first_day))
+        self.assertEqual(list(ClassDay.objects.values_list('date', flat=True)), [self.first_day])
+
+    def test_saving_a_single_row_refreshes_summary_and_class_days(self):
+        first = self.students[0]
+
+        attendance = Attendance.objects.create(user=first, class_date=self.first_day)
+        self.assertEqual(get_counts(first), (1, 1, 0, self.first_day))
+        self.assertEqual(list(ClassDay.objects.values_list('date', flat=True)), [self.first_day])
+
+        attendance.class_date = self.second_day
+        attendance.save()
+        self.assertEqual(get_counts(first), (1, 1, 0, self.second_day))
+        self.assertEqual(list(ClassDay.objects.values_list('date', flat=True)), [self.second_day])
+
+    def test_moving_a_row_to_another_user_refreshes_both(self):
+        first, second, _ = self.students
+
+        record_attendance(self.first_day, [first.id], [])
+        attendance = Attendance.objects.get(user=first)
+        attendance.user = second
+        attendance.save()
+
+        self.assertEqual(get_counts(first), (0, 0, 0, None))
+        self.assertEqual(get_counts(second), (1, 1, 0, self.first_day))
+
+    def test_rebuild_matches_incremental_upkeep(self):
+        first, second, third = self.students
+
+        record_attendance(self.first_day, [first.id, second.id], [third.id])
+        record_attendance(self.second_day, [first.id], [first.id, second.id])
+        incremental = {user.id: get_counts(user) for user in self.students}
+
+        self.assertEqual(rebuild_attendance_summaries(), (3, 2))
+        self.assertEqual({user.id: get_counts(user) for user in self.students}, incremental)
+
+
+class InactiveStudentTests(TestCase):
+    def setUp(self):
+        Config.objects.create(num_inactive_student_days=7)
+        self._class = Class.objects.create(name='1')
+        self.today = datetime.date.today()
+
+    def attend(self, user, days_ago):
+        Attendance.objects.create(user=user, class_date=self.today - datetime.timedelta(days_ago))
+
+    def is_active(self, user):
+        return User.objects.get(id=user.id).is_active
+
+    def test_students_absent_for_the_whole_window_are_deactivated(self):
+        present, absent = create_student('present', self._class), create_student('absent', self._class)
+        volunteer = User.objects.create_user('volunteer', is_staff=True)
+        self.attend(present, 6)
+        self.attend(absent, 7)
+
+        report = update_inactive_students()
+
+        self.assertEqual((report['deactivated'], report['reactivated']), (1, 0))
+        self.assertEqual(report['window_start'], self.today - datetime.timedelta(6))
+        self.assertTrue(self.is_active(present))
+        self.assertFalse(self.is_active(absent))
+        self.assertTrue(self.is_active(volunteer))
+
+    def test_only_students_it_deactivated_are_reactivated(self):
+        returning = create_student('returning', self._class)
+        blocked = create_student('blocked', self._class)
+        account = User.objects.create_user('account')
+        self.attend(blocked, 1)
+        update_inactive_students()
+        # deactivated by an admin
+        User.objects.filter(id=blocked.id).update(is_active=False)
+        for user in (returning, blocked, account):
+            self.attend(user, 0)
+
+        report = update_inactive_students()
+
+        self.assertEqual((report['deactivated'], report['reactivated']), (0, 1))
+        self.assertTrue(self.is_active(returning))
+        self.assertFalse(self.is_active(blocked))
+        self.assertFalse(self.is_active(account))
+        self.assertFalse(StudentProfile.objects.filter(deactivated_for_absence=True).exists())
+
+    def test_a_dry_run_writes_nothing(self):
+        absent = create_student('absent', self._class)
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            report = update_inactive_students(dry_run=True)
+
+        self.assertEqual((report['deactivated'], report['dry_run']), (1, True))
+        self.assertTrue(self.is_active(absent))
+        self.assertFalse([query for query in queries.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+
+
+class MarkAttendanceTests(TestCase):
+    def setUp(self):
+        self._class = Class.objects.create(name='1')
+        self.other_class = Class.objects.create(name='2')
+        self.students = [
+            create_student('student{}@example.com'.format(index), self._class) for index in range(2)
+        ]
+        self.outsider = create_student('outsider@example.com', self.other_class)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def mark(self, **data):
+        data.setdefault('class_date', '2018-03-01')
+        return self.client.post('/attendance/mark/', data, format='json')
+
+    def test_resubmission_is_idempotent(self):
+        user_ids = [student.id for student in self.students]
+
+        response = self.mark(user_ids=user_ids)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['existing']), (2, 0))
+
+        response = self.mark(user_ids=user_ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['existing']), (0, 2))
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    def test_partial_resubmission_creates_the_missing_rows(self):
+        first, second = self.students
+
+        self.mark(user_ids=[first.id])
+        response = self.mark(user_ids=[first.id, second.id], extra_user_ids=[first.id])
+
+        self.assertEqual((response.data['created'], response.data['existing']), (2, 1))
+        self.assertEqual(Attendance.objects.filter(user=first).count(), 2)
+
+    def test_unknown_users_are_rejected(self):
+        response = self.mark(user_ids=[self.students[0].id, 999999])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user_ids', response.data)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_students_of_another_class_are_rejected(self):
+        response = self.mark(class_id=self._class.id, user_ids=[self.students[0].id, self.outsider.id])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class AttendanceReportTests(TestCase):
+    def setUp(self):
+        self._class = Class.objects.create(name='1')
+        self.regular = create_student('regular@example.com', self._class)
+        self.dropped = create_student('dropped@example.com', self._class)
+        self.days = [datetime.date(2018, 3, day) for day in range(1, 5)]
+        record_attendance(self.days[0], [self.regular.id, self.dropped.id], [])
+        for day in self.days[1:]:
+            record_attendance(day, [self.regular.id], [])
+        User.objects.filter(id=self.dropped.id).update(is_active=False)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        cache.clear()
+
+    def get_results(self, report):
+        response = self.client.get('/attendance_reports/{}/'.format(report),
+                                   {'start': '2018-03-01', 'end': '2018-03-04'})
+        self.assertEqual(response.status_code, 200)
+        return {row['user_id']: row for row in response.data['results']}
+
+    def test_students_report_leaves_out_inactive_students(self):
+        results = self.get_results('students')
+
+        self.assertEqual(list(results), [self.regular.id])
+        self.assertEqual(results[self.regular.id]['percentage'], 100.0)
+        self.assertEqual(results[self.regular.id]['longest_streak'], 4)
+
+    def test_at_risk_report_keeps_inactive_students(self):
+        results = self.get_results('at_risk')
+
+        self.assertEqual(list(results), [self.dropped.id])
+        self.assertEqual(results[self.dropped.id]['is_active'], False)
+        self.assertEqual(results[self.dropped.id]['current_absences'], 3)
+
+    def test_list_names_the_reports(self):
+        response = self.client.get('/attendance_reports/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('at_risk', response.data['reports'])
+
+
+@override_settings(REPLICA_PIN_SECONDS=0)
+class ClassDashboardTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.day = datetime.date(2018, 3, 1)
+
+    def add_class(self, name):
+        _class = Class.objects.create(name=name)
+        present = create_student('present-{}'.format(name), _class)
+        create_student('absent-{}'.format(name), _class)
+        inactive = create_student('inactive-{}'.format(name), _class)
+        User.objects.filter(id=inactive.id).update(is_active=False)
+        volunteer = User.objects.create_user('volunteer-{}'.format(name), first_name=name, is_staff=True)
+        VolunteerClass.objects.create(volunteer=volunteer, _class=_class)
+        record_attendance(self.day, [present.id], [])
+        return _class, volunteer
+
+    def get(self, path):
+        # responses cached under versions which the rolled back test never bumps
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_dashboard_counts_students_and_lists_volunteers(self):
+        _class, volunteer = self.add_class('1')
+        empty = Class.objects.create(name='2')
+
+        dashboard = {row['id']: row for row in self.get('/classes/dashboard/')[0]}
+
+        self.assertEqual(dashboard[_class.id]['num_active_students'], 2)
+        self.assertEqual(dashboard[_class.id]['num_inactive_students'], 1)
+        self.assertEqual([row['id'] for row in dashboard[_class.id]['volunteers']], [volunteer.id])
+        self.assertEqual(dashboard[_class.id]['last_attendance_date'], self.day)
+        self.assertEqual((dashboard[empty.id]['num_active_students'], dashboard[empty.id]['volunteers'],
+                          dashboard[empty.id]['last_attendance_date']), (0, [], None))
+
+    def test_nested_class_counts_match_the_dashboard(self):
+        self.add_class('1')
+
+        students = self.get('/students/')[0]['results']
+
+        self.assertEqual({student['_class']['num_active_students'] for student in students}, {2})
+
+    def test_query_count_does_not_grow_with_classes(self):
+        paths = ('/classes/dashboard/', '/classes/', '/students/')
+        for index in range(2):
+            self.add_class('a{}'.format(index))
+        counts = {path: self.get(path)[1] for path in paths}
+        for index in range(4):
+            self.add_class('b{}'.format(index))
+
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[1], counts[path])
+
+
+def create_volunteer(username, subject, discipline='CSE', **profile):
+    volunteer = User.objects.create_user(username, first_name=username, is_staff=True)
+    UserProfile.objects.create(user=volunteer, programme='B.Tech.', discipline=discipline, **profile)
+    VolunteerSubject.objects.create(volunteer=volunteer, subject=subject)
+    return volunteer
+
+
+@override_settings(REPLICA_PIN_SECONDS=0)
+class DepartmentDirectoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def get(self):
+        # responses cached under versions which the rolled back test never bumps
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get('/department/directory/')
+        self.assertEqual(response.status_code, 200)
+        return {subject['name']: subject for subject in response.data}, len(queries)
+
+    def test_volunteers_are_grouped_by_subject(self):
+        maths, science = Subject.objects.create(name='maths'), Subject.objects.create(name='science')
+        Subject.objects.create(name='art')
+        create_volunteer('a', maths, display_picture='uploads/a.png')
+        create_volunteer('b', maths, discipline='ME')
+        VolunteerSubject.objects.create(volunteer=User.objects.get(username='a'), subject=science)
+
+        directory = self.get()[0]
+
+        self.assertEqual({name: subject['num_volunteers'] for name, subject in directory.items()},
+                         {'art': 0, 'maths': 2, 'science': 1})
+        self.assertEqual([(volunteer['first_name'], volunteer['discipline'])
+                          for volunteer in directory['maths']['volunteers']], [('a', 'CSE'), ('b', 'ME')])
+        picture = directory['science']['volunteers'][0]['display_picture']
+        self.assertEqual(picture, default_storage.url('uploads/a.png'))
+        self.assertIn('sig=', picture)
+        self.assertEqual(directory['maths']['volunteers'][1]['display_picture'], '')
+
+    def test_query_count_does_not_grow_with_volunteers(self):
+        subject = Subject.objects.create(name='maths')
+        create_volunteer('a', subject)
+        count = self.get()[1]
+
+        for index in range(3):
+            create_volunteer('b{}'.format(index), Subject.objects.create(name='s{}'.format(index)))
+            create_volunteer('c{}'.format(index), subject)
+
+        self.assertEqual(self.get()[1], count)
+
+
+@override_settings(REPLICA_PIN_SECONDS=0)
+class DepartmentDirectoryCacheTests(TransactionTestCase):
+    """
+    Committed changes, whose versions are bumped on commit, invalidate the directory.
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.subject = Subject.objects.create(name='maths')
+        self.volunteer = create_volunteer('a', self.subject)
+        cache.clear()
+
+    def get_volunteers(self):
+        response = self.client.get('/department/directory/')
+        self.assertEqual(response.status_code, 200)
+        return [(volunteer['first_name'], volunteer['discipline'])
+                for volunteer in response.data[0]['volunteers']]
+
+    def test_the_directory_is_served_from_the_cache(self):
+        self.get_volunteers()
+        # sends no signal, bumps no version
+        UserProfile.objects.filter(user=self.volunteer).update(discipline='ME')
+
+        self.assertEqual(self.get_volunteers(), [('a', 'CSE')])
+
+    def test_a_profile_change_invalidates_the_directory(self):
+        self.get_volunteers()
+        profile = UserProfile.objects.get(user=self.volunteer)
+        profile.discipline = 'ME'
+        profile.save()
+
+        self.assertEqual(self.get_volunteers(), [('a', 'ME')])
+
+    def test_a_new_volunteer_subject_invalidates_the_directory(self):
+        self.get_volunteers()
+        create_volunteer('b', self.subject)
+
+        self.assertEqual(self.get_volunteers(), [('a', 'CSE'), ('b', 'CSE')])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.events = [self.create_event(index) for index in range(7)]
+        # rows sharing created_at are told apart by id
+        Event.objects.filter(id__in=[event.id for event in self.events[2:5]]).update(
+            created_at=self.events[2].created_at)
+        cache.clear()
+
+    def create_event(self, index):
+        return Event.objects.create(time=timezone.now(), _type='EVENT', title=str(index),
+                                    description=str(index))
+
+    def get_pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([event['id'] for event in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages = self.get_pages('/events/?page_size=2')
+
+        expected = list(Event.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_rows_added_while_paging_do_not_shift_the_pages(self):
+        response = self.client.get('/events/?page_size=3')
+        first_page = [event['id'] for event in response.data['results']]
+        self.create_event(7)
+
+        rest = sum(self.get_pages(response.data['next']), [])
+
+        self.assertEqual(len(first_page + rest), 7)
+        self.assertFalse(set(first_page) & set(rest))
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetCursorPagination, 'max_page_size', 3):
+            response = self.client.get('/events/?page_size=100')
+
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+        self.assertNotIn('count', response.data)
+
+
+# the cleared cache counts as a change just now, replica reads are not validated for the window
+@override_settings(REPLICA_PIN_SECONDS=0)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        Event.objects.create(time=timezone.now(), _type='EVENT', title='1', description='1')
+        cache.clear()
+
+    def test_unchanged_list_is_answered_without_a_query(self):
+        response = self.client.get('/events/')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_invalidates_the_etag(self):
+        etag = self.client.get('/events/')['ETag']
+        Event.objects.create(time=timezone.now(), _type='EVENT', title='2', description='2')
+        # bumped on commit, which the rolled back test never reaches
+        bump_model_version(Event)
+
+        response = self.client.get('/events/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_replica_read_after_a_recent_change_is_not_validated(self):
+        with self.settings(REPLICA_PIN_SECONDS=60):
+            response = self.client.get('/events/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_validated_models_are_versioned(self):
+        for prefix, viewset, basename in router.registry:
+            if issubclass(viewset, ConditionalGetMixin):
+                with self.subTest(prefix=prefix):
+                    models = set(viewset.get_validator_models(viewset()))
+                    self.assertFalse(models - set(VERSIONED_MODELS))
+
+
+@override_settings(REPLICA_PIN_SECONDS=0)
+class CachedResponseTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        Hobby.objects.create(name='chess')
+        cache.clear()
+
+    def test_a_cached_list_is_served_without_a_query(self):
+        response = self.client.get('/hobbies/')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/hobbies/').data, response.data)
+
+    def test_a_version_bump_invalidates_the_response(self):
+        self.client.get('/hobbies/')
+        Hobby.objects.create(name='music')
+        # bumped on commit, which the rolled back test never reaches
+        bump_model_version(Hobby)
+
+        self.assertEqual(len(self.client.get('/hobbies/').data['results']), 2)
+
+    def test_errors_are_not_cached(self):
+        hobby_id = Hobby.objects.get().id + 1
+        self.assertEqual(self.client.get('/hobbies/{}/'.format(hobby_id)).status_code, 404)
+
+        Hobby.objects.create(id=hobby_id, name='music')
+
+        self.assertEqual(self.client.get('/hobbies/{}/'.format(hobby_id)).status_code, 200)
+
+    def test_model_versions_outlive_the_file_cache_default_timeout(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+                'TIMEOUT': settings.CACHES['default']['TIMEOUT'],
+            }
+            with self.settings(CACHES={'default': shared}):
+                version = get_model_version(Hobby)
+                bump_model_version(Hobby)
+
+                with mock.patch('time.time', return_value=time.time() + 3600):
+                    self.assertEqual(get_model_version(Hobby), version + 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self._class = Class.objects.create(name='1')
+        self.other_class = Class.objects.create(name='2')
+        self.students = [
+            create_student('student{}@example.com'.format(index), self._class) for index in range(3)
+        ]
+        self.outsider = create_student('outsider@example.com', self.other_class)
+        record_attendance(datetime.date(2018, 3, 2), [self.students[0].id, self.outsider.id], [])
+        record_attendance(datetime.date(2018, 3, 1), [student.id for student in self.students], [])
+        record_attendance(datetime.date(2018, 4, 1), [self.students[0].id], [])
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def get_rows(self, path, params=None):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    def test_attendance_export_is_ordered_by_date_and_filtered(self):
+        rows = self.get_rows('/attendance/export/', {'start': '2018-03-01', 'end': '2018-03-31'})
+
+        self.assertEqual([row['class_date'] for row in rows], ['2018-03-01'] * 3 + ['2018-03-02'] * 2)
+        self.assertEqual(rows[0]['class'], '1')
+
+        rows = self.get_rows('/attendance/export/', {'start': '2018-03-01', 'end': '2018-03-31',
+                                                     'class_id': self.other_class.id})
+        self.assertEqual([row['username'] for row in rows], ['outsider@example.com'])
+
+    def test_student_export_includes_the_attendance_summary(self):
+        rows = self.get_rows('/students/export/', {'class_id': self._class.id})
+
+        self.assertEqual([int(row['user_id']) for row in rows], [student.id for student in self.students])
+        self.assertEqual((rows[0]['num_days'], rows[0]['last_attended_date']), ('3', '2018-04-01'))
+
+    def test_export_is_for_staff_only(self):
+        self.client.force_authenticate(self.students[0])
+
+        self.assertEqual(self.client.get('/students/export/').status_code, 403)
+
+    def test_keyset_chunks_read_every_row_once(self):
+        lookups = get_lookups(STUDENT_COLUMNS)
+
+        with self.assertNumQueries(3):
+            rows = list(iterate_keyset(StudentProfile.objects.all(), lookups, chunk_size=2))
+
+        self.assertEqual([row[0] for row in rows],
+                         [student.id for student in self.students + [self.outsider]])
+
+
+class StudentImportTests(TestCase):
+    def setUp(self):
+        Class.objects.create(name='1')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def post(self, content, **data):
+        csv_file = io.BytesIO(content.encode('utf-8'))
+        csv_file.name = 'students.csv'
+        return self.client.post('/students/import_csv/', dict(data, file=csv_file), format='multipart')
+
+    def test_invalid_rows_are_reported_by_line(self):
+        response = self.post(
+            'first_name,class_num,dob\n'
+            'Asha,1,2010-01-01\n'
+            ',1,\n'
+            'Ravi,9,\n'
+            'Meena,1,not a date\n'
+            'Asha,1,\n'
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([(error['row'], list(error['errors'])) for error in response.data['errors']],
+                         [(3, ['first_name']), (4, ['class_num']), (5, ['dob'])])
+        self.assertEqual(sorted(StudentProfile.objects.values_list('user__username', flat=True)),
+                         ['Asha', 'Asha-2'])
+
+    def test_dry_run_creates_nothing(self):
+        response = self.post('first_name,class_num\nAsha,1\n', dry_run='true')
+
+        self.assertEqual((response.status_code, response.data['created']), (200, 0))
+        self.assertFalse(StudentProfile.objects.exists())
+
+    def test_failing_chunk_falls_back_to_single_rows(self):
+        User.objects.create_user('taken')
+
+        def assign_taken_username(names):
+            # a concurrent import took the username after it was looked up
+            return ['taken' if name == 'Ravi' else name for name in assign_usernames(names)]
+
+        with mock.patch('main.imports.assign_usernames', assign_taken_username):
+            report = import_students(io.StringIO('first_name,class_num\nAsha,1\nRavi,1\nMeena,1\n'))
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [3])
+        self.assertEqual(sorted(StudentProfile.objects.values_list('user__username', flat=True)),
+                         ['Asha', 'Meena'])
+
+
+def create_image(color):
+    output = io.BytesIO()
+    Image.new('RGB', (400, 300), color).save(output, 'PNG')
+    return ContentFile(output.getvalue(), name='picture.png')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_event(self, color):
+        event = Event(time=timezone.now(), _type='EVENT', title=color, description=color)
+        event.image.save('picture.png', create_image(color))
+        process_image(Event, event.pk, 'image')
+        event.refresh_from_db()
+        return event
+
+    def replace_image(self, event, color):
+        event.image.save('picture.png', create_image(color))
+        process_image(Event, event.pk, 'image')
+        event.refresh_from_db()
+
+    def test_variants_are_rendered(self):
+        event = self.create_event('red')
+
+        self.assertTrue(event.image_thumbnail.storage.exists(event.image_thumbnail.name))
+        with Image.open(event.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (200, 150))
+
+    def test_replacing_the_upload_deletes_its_variants(self):
+        event = self.create_event('red')
+        old_names = [event.image_thumbnail.name, event.image_compressed.name]
+
+        self.replace_image(event, 'blue')
+
+        storage = event.image.storage
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+        self.assertTrue(storage.exists(event.image_thumbnail.name))
+        self.assertNotIn(event.image_thumbnail.name, old_names)
+
+    def test_variants_shared_with_another_row_are_kept(self):
+        event = self.create_event('red')
+        other = self.create_event('red')
+        self.assertEqual(event.image_thumbnail.name, other.image_thumbnail.name)
+
+        self.replace_image(event, 'blue')
+
+        self.assertTrue(other.image_thumbnail.storage.exists(other.image_thumbnail.name))
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name, MEDIA_SIGNATURE_MAX_AGE=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.name = default_storage.save('uploads/picture.png', create_image('red'))
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_signed_url_is_served_privately(self):
+        response = self.get(default_storage.url(self.name))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('private, '))
+
+    def test_signed_url_expires(self):
+        url = default_storage.url(self.name)
+
+        with mock.patch('time.time', return_value=time.time() + 3 * 3600):
+            response = self.get(url)
+
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_signature_is_bound_to_the_name(self):
+        other = default_storage.save('uploads/other.png', create_image('blue'))
+        signature = default_storage.url(self.name).split('?', 1)[1]
+
+        response = self.get('{}?{}'.format(default_storage.url(other).split('?', 1)[0], signature))
+
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_signed_url_is_stable_within_the_window(self):
+        window_start = int(time.time()) // 1800 * 1800
+
+        with mock.patch('time.time', return_value=window_start + 10):
+            url = default_storage.url(self.name)
+        with mock.patch('time.time', return_value=window_start + 1790):
+            self.assertEqual(default_storage.url(self.name), url)
+        with mock.patch('time.time', return_value=window_start + 1810):
+            self.assertNotEqual(default_storage.url(self.name), url)
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('volunteer', 'volunteer@example.com', 'pw', is_staff=True)
+        self.token = self.create_token(self.user)
+        token_cache.clear()
+        cache.clear()
+
+    def create_token(self, user, **claims):
+        payload = jwt_settings.JWT_PAYLOAD_HANDLER(user)
+        payload.update(claims)
+        return jwt_settings.JWT_ENCODE_HANDLER(payload)
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='JWT {}'.format(token or self.token))
+        return CachedJSONWebTokenAuthentication().authenticate(request)[0]
+
+    def test_cached_claims_are_used_without_a_user_query(self):
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.id, user.username, user.email, user.is_active, user.is_staff),
+                         (self.user.id, 'volunteer', 'volunteer@example.com', True, True))
+
+    def test_revoked_inactive_user_is_rejected_on_the_next_request(self):
+        self.authenticate()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        # revoked on commit, which the rolled back test never reaches
+        revoke_users([self.user.id])
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_revoked_deleted_user_is_rejected_on_the_next_request(self):
+        self.authenticate()
+        user_id = self.user.id
+        self.user.delete()
+        revoke_users([user_id])
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_claims_do_not_outlive_the_token(self):
+        expires_at = int(time.time()) + 5
+        token = self.create_token(self.user, exp=expires_at)
+        self.authenticate(token)
+
+        [(key, (claims, cached_until))] = token_cache.entries.items()
+        self.assertLessEqual(cached_until, expires_at)
+        with mock.patch('time.time', return_value=expires_at + 1):
+            self.assertIsNone(token_cache.get(key))
+
+    def test_password_stays_deferred(self):
+        self.authenticate()
+
+        self.assertIn('password', self.authenticate().get_deferred_fields())
+
+    def test_login_returns_the_expiry_of_the_token(self):
+        response = APIClient().post('/login/', {'username': 'volunteer', 'password': 'pw'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['expires_at'],
+                         jwt_settings.JWT_DECODE_HANDLER(response.data['token'])['exp'])
+        self.assertEqual((response.data['user_id'], response.data['is_staff']), (self.user.id, True))
+
+
+class UsernameFilterTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('Known@example.com')
+        self.filter = UsernameFilter()
+
+    def test_current_filter_answers_without_a_query(self):
+        self.filter.rebuild()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.filter.may_exist('unknown@example.com'))
+        self.assertTrue(self.filter.may_exist('known@example.com'))
+
+    def test_stale_filter_defers_to_the_database_and_rebuilds_in_the_background(self):
+        self.filter.rebuild()
+        bump_model_version(User)
+
+        with mock.patch('main.identity.threading.Thread') as thread:
+            self.assertTrue(self.filter.may_exist('unknown@example.com'))
+            self.assertTrue(self.filter.may_exist('unknown@example.com'))
+
+        thread.assert_called_once_with(target=self.filter.run_rebuild, name='username-filter', daemon=True)
+        self.filter.run_rebuild()
+        self.assertFalse(self.filter.may_exist('unknown@example.com'))
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle', 'buckets')
+
+    def test_bucket_allows_its_capacity_then_waits(self):
+        store = SharedBucketStore(self.path, 16)
+
+        self.assertEqual([store.consume('key', 2, 1)[0] for _ in range(3)], [True, True, False])
+        self.assertGreater(store.consume('key', 2, 1)[1], 0)
+        self.assertTrue(store.consume('other', 2, 1)[0])
+
+    def test_join_requests_are_throttled_per_domain(self):
+        store = SharedBucketStore(self.path, 1024)
+        rates = {'join_request_ip': '100/hour', 'join_request_domain': '2/hour'}
+
+        with mock.patch('main.throttling.get_store', return_value=store), \
+                mock.patch.object(SharedTokenBucketThrottle, 'THROTTLE_RATES', rates):
+            statuses = [
+                APIClient().post('/join_requests/', {'email': 'user{}@example.com'.format(index),
+                                                     'name': 'user'}).status_code
+                for index in range(3)
+            ]
+            other_domain = APIClient().post('/join_requests/', {'email': 'user@example.org', 'name': 'user'})
+
+        self.assertEqual(statuses, [201, 201, 429])
+        self.assertEqual(other_domain.status_code, 201)
+
+    def post_join_requests(self, rates, posts):
+        """
+        :param: `posts` list of tuples of email, client address and X-Forwarded-For
+        :return: list of status codes
+        """
+
+        store = SharedBucketStore(self.path, 1024)
+
+        with mock.patch('main.throttling.get_store', return_value=store), \
+                mock.patch.object(SharedTokenBucketThrottle, 'THROTTLE_RATES', rates):
+            return [
+                APIClient().post('/join_requests/', {'email': email, 'name': 'user'},
+                                 REMOTE_ADDR=address, HTTP_X_FORWARDED_FOR=forwarded_for).status_code
+                for email, address, forwarded_for in posts
+            ]
+
+    def test_forwarded_for_header_does_not_pick_the_ip_bucket(self):
+        rates = {'join_request_ip': '2/hour', 'join_request_domain': '100/hour'}
+        posts = [('user{}@example.com'.format(index), '10.0.1.1', '10.0.0.{}'.format(index))
+                 for index in range(3)]
+
+        self.assertEqual(self.post_join_requests(rates, posts), [201, 201, 429])
+
+    def test_webmail_domains_are_only_throttled_per_ip(self):
+        rates = {'join_request_ip': '100/hour', 'join_request_domain': '2/hour'}
+        posts = [('user{}@gmail.com'.format(index), '10.0.0.1', '') for index in range(3)]
+
+        self.assertEqual(self.post_join_requests(rates, posts), [201, 201, 201])
+
+    def test_requests_refused_per_ip_take_no_domain_token(self):
+        rates = {'join_request_ip': '1/hour', 'join_request_domain': '2/hour'}
+        posts = [('a@example.com', '10.0.0.1', ''), ('b@example.com', '10.0.0.1', ''),
+                 ('c@example.com', '10.0.0.2', ''), ('d@example.com', '10.0.0.3', '')]
+
+        self.assertEqual(self.post_join_requests(rates, posts), [201, 429, 201, 429])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        cache.clear()
+
+    def get_aliases(self, method, path, data=None):
+        """
+        :return: the database aliases which ran queries for the request
+        """
+
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400)
+
+        return {alias for alias, queries in (('default', primary), ('replica', replica)) if len(queries)}
+
+    def create_event(self):
+        return self.get_aliases('post', '/events/', {
+            'time': '2018-03-01T10:00:00Z', '_type': 'EVENT', 'title': 'Event', 'description': 'Event'
+        })
+
+    def test_safe_request_reads_from_the_replica(self):
+        self.assertEqual(self.get_aliases('get', '/events/'), {'replica'})
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        self.assertEqual(self.create_event(), {'default'})
+        self.assertEqual(self.get_aliases('get', '/events/'), {'default'})
+
+    def test_pin_expires(self):
+        self.create_event()
+
+        with mock.patch('time.time', return_value=time.time() + settings.REPLICA_PIN_SECONDS + 1):
+            self.assertEqual(self.get_aliases('get', '/events/'), {'replica'})
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        with routing(use_replica=True):
+            self.assertEqual(db_router.db_for_read(Event), 'replica')
+            with transaction.atomic():
+                self.assertEqual(db_router.db_for_read(Event), 'default')
+
+    def test_reads_after_a_write_use_the_primary(self):
+        with routing(use_replica=True):
+            Event.objects.create(time=timezone.now(), _type='EVENT', title='1', description='1')
+            self.assertEqual(db_router.db_for_read(Event), 'default')
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def create_pool(self, size=1, max_lifetime=60, timeout=0.05):
+        return ConnectionPool('default', size, max_lifetime, timeout)
+
+    def test_checkout_times_out_when_every_connection_is_in_use(self):
+        pool = self.create_pool()
+        pool.checkout(FakeConnection, lambda conn: True)
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection, lambda conn: True)
+        self.assertEqual(pool.get_metrics()['timeouts'], 1)
+
+    def test_waiting_checkout_gets_the_returned_connection(self):
+        pool = self.create_pool(timeout=5)
+        conn = pool.checkout(FakeConnection, lambda conn: True)
+        timer = threading.Timer(0.05, pool.checkin, [conn])
+        timer.start()
+        self.addCleanup(timer.join)
+
+        self.assertIs(pool.checkout(FakeConnection, lambda conn: True), conn)
+        self.assertEqual((pool.get_metrics()['waits'], pool.get_metrics()['connects']), (1, 1))
+
+    def test_idle_connections_are_reused_or_replaced_when_dead(self):
+        pool = self.create_pool()
+        conn = pool.checkout(FakeConnection, lambda conn: True)
+        pool.checkin(conn)
+
+        self.assertIs(pool.checkout(FakeConnection, lambda conn: True), conn)
+        pool.checkin(conn)
+        replacement = pool.checkout(FakeConnection, lambda conn: False)
+
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.get_metrics()['reconnects'], 1)
+
+    def test_expired_connections_are_recycled(self):
+        pool = self.create_pool(max_lifetime=0)
+        conn = pool.checkout(FakeConnection, lambda conn: True)
+        time.sleep(0.01)
+        pool.checkin(conn)
+
+        metrics = pool.get_metrics()
+        self.assertTrue(conn.closed)
+        self.assertEqual((metrics['recycled'], metrics['open'], metrics['idle']), (1, 0, 0))
+
+    def test_discarded_connection_frees_its_slot(self):
+        pool = self.create_pool()
+        conn = pool.checkout(FakeConnection, lambda conn: True)
+        pool.checkin(conn, discard=True)
+
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.checkout(FakeConnection, lambda conn: True), conn)
+        self.assertEqual(pool.get_metrics()['discarded'], 1)
+
+    def test_failed_connect_releases_its_slot(self):
+        pool = self.create_pool()
+
+        def connect():
+            raise ConnectionRefusedError('database unreachable')
+
+        with self.assertRaises(ConnectionRefusedError):
+            pool.checkout(connect, lambda conn: True)
+
+        self.assertEqual(pool.get_metrics()['open'], 0)
+        self.assertIsInstance(pool.checkout(FakeConnection, lambda conn: True), FakeConnection)
+
+
+class EventFeed(consumers.FeedConsumer):
+    watch_models = (Event, )
+
+    def get_response(self, body):
+        return HttpResponse('events')
+
+
+@override_settings(LONG_POLL_INTERVAL=0.05)
+class LongPollTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(consumers, 'watcher', consumers.VersionWatcher())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(self.stop_watcher)
+
+    def stop_watcher(self):
+        if consumers.watcher.task is not None:
+            self.loop.run_until_complete(consumers.watcher.task)
+
+    def get(self, query=b'', timeout=1):
+        communicator = HttpCommunicator(EventFeed, 'GET', '/events/')
+        communicator.scope['query_string'] = query
+        response = self.loop.run_until_complete(communicator.get_response(timeout))
+        self.loop.run_until_complete(communicator.send_input({'type': 'http.disconnect'}))
+        self.loop.run_until_complete(communicator.wait())
+        return dict(response['headers'])[consumers.VERSION_HEADER.encode('ascii')].decode('ascii')
+
+    def test_the_version_answers_at_once_when_it_is_outdated(self):
+        version = self.get()
+        bump_model_version(Event)
+
+        started_at = time.monotonic()
+        latest = self.get('wait=5&version={}'.format(version).encode('ascii'))
+
+        self.assertNotEqual(latest, version)
+        self.assertLess(time.monotonic() - started_at, 1)
+
+    def test_a_wait_returns_when_the_data_changes(self):
+        version = self.get()
+        # versions of an earlier wait, older than the one the client knows
+        consumers.watcher.versions = {Event: 1}
+        self.loop.call_later(0.2, bump_model_version, Event)
+
+        started_at = time.monotonic()
+        latest = self.get('wait=5&version={}'.format(version).encode('ascii'), timeout=5)
+
+        self.assertNotEqual(latest, version)
+        self.assertEqual(latest, self.get())
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.2)
+        self.assertLess(time.monotonic() - started_at, 5)
+
+    def test_a_wait_times_out_with_the_same_version(self):
+        version = self.get()
+
+        started_at = time.monotonic()
+        self.assertEqual(self.get('wait=1&version={}'.format(version).encode('ascii'), timeout=3),
+                         version)
+        self.assertGreaterEqual(time.monotonic() - started_at, 1)
+
+
+@override_settings(NOTIFICATION_FANOUT='pull')
+class NotificationFeedTests(TestCase):
+    def setUp(self):
+        self.volunteer = User.objects.create_user('volunteer', 'volunteer@example.com', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.volunteer)
+
+    def create_notifications(self, count):
+        return [
+            Notification.objects.create(_type='event', content=str(index), to_only_admin=False)
+            for index in range(count)
+        ]
+
+    def test_reading_the_feed_writes_nothing(self):
+        self.client.get('/notifications/unread_count/')
+        self.client.get('/notifications/')
+
+        self.assertFalse(NotificationCursor.objects.exists())
+
+    def test_unread_count_follows_the_cursor(self):
+        self.create_notifications(3)
+
+        response = self.client.get('/notifications/unread_count/')
+        self.assertEqual(response.data['unread_count'], 3)
+
+        self.client.get('/notifications/')
+        response = self.client.get('/notifications/unread_count/')
+        self.assertEqual(response.data['unread_count'], 0)
+
+    def test_a_page_marks_only_its_notifications_seen(self):
+        self.create_notifications(5)
+
+        response = self.client.get('/notifications/', {'page_size': 2})
+        self.assertEqual(self.client.get('/notifications/unread_count/').data['unread_count'], 3)
+
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+        self.assertEqual(self.client.get('/notifications/unread_count/').data['unread_count'], 0)
+
+    def test_cursor_stops_below_the_first_unseen_notification(self):
+        notifications = self.create_notifications(4)
+        NotificationCursor.objects.create(user=self.volunteer, last_seen_id=notifications[0].id)
+        # the second one is left out of the feed page by an older created_at
+        Notification.objects.filter(id=notifications[1].id).update(
+            created_at=notifications[0].created_at)
+
+        self.client.get('/notifications/', {'page_size': 2})
+
+        self.assertEqual(NotificationCursor.objects.get(user=self.volunteer).last_seen_id,
+                         notifications[0].id)
+        self.assertEqual(self.client.get('/notifications/unread_count/').data['unread_count'], 1)
+        response = self.client.get('/notifications/', {'page_size': 3})
+        self.assertEqual([notification['is_seen'] for notification in response.data['results']],
+                         [True, True, False])
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('mail server unreachable')
+
+
+@override_settings(MAIL_WORKERS=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MailOutboxTests(TestCase):
+    def queue(self):
+        return queue_mail('Welcome', 'password: s3cret', 'support@example.com', ['a@example.com'])
+
+    def test_drain_sends_and_clears_the_body(self):
+        queued = self.queue()
+
+        self.assertEqual(drain(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body, 'password: s3cret')
+        self.assertEqual(mail.outbox[0].to, ['a@example.com'])
+
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.message), ('SENT', ''))
+        self.assertEqual(drain(), 0)
+
+    @override_settings(EMAIL_BACKEND='main.tests.FailingEmailBackend', MAIL_MAX_ATTEMPTS=2)
+    def test_failed_mail_is_retried_then_cleared(self):
+        queued = self.queue()
+
+        drain()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('PENDING', 1))
+        self.assertEqual(queued.message, 'password: s3cret')
+
+        OutgoingMail.objects.filter(id=queued.id).update(next_attempt_at=queued.created_at)
+        drain()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.message), ('FAILED', 2, ''))
+        self.assertIn('unreachable', queued.last_error)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as path:
+            with self.settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend',
+                               EMAIL_FILE_PATH=path):
+                self.queue()
+                drain()
+
+            files = os.listdir(path)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(path, files[0])) as f:
+                self.assertIn('Subject: Welcome', f.read())
+
+
+class QueryCountTests(TestCase):
+    """
+    Every list endpoint runs the same number of queries for N and for 2N rows.
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.num_batches = 0
+
+    def add_rows(self, count):
+        self.num_batches += 1
+        for index in range(count):
+            tag = '{}-{}'.format(self.num_batches, index)
+            _class = Class.objects.create(name=tag)
+            subject = Subject.objects.create(name=tag)
+            hobby = Hobby.objects.create(name=tag)
+            skill = Skill.objects.create(name=tag)
+
+            student = create_student('student-{}@example.com'.format(tag), _class)
+            volunteer = User.objects.create_user('volunteer-{}'.format(tag), is_staff=True)
+            UserProfile.objects.create(user=volunteer, programme='B.Tech.', discipline='CSE')
+            VolunteerSubject.objects.create(volunteer=volunteer, subject=subject)
+            VolunteerClass.objects.create(volunteer=volunteer, _class=_class)
+            UserHobby.objects.create(user=volunteer, hobby=hobby)
+            UserSkill.objects.create(user=volunteer, skill=skill)
+            record_attendance(datetime.date.today(), [student.id, volunteer.id], [student.id])
+
+            Syllabus.objects.create(_class=_class, subject=subject, content=tag)
+            StudentFeedback.objects.create(student=student, user=volunteer, title=tag, feedback=tag)
+            ClassFeedback.objects.create(_class=_class, subject=subject, feedback=tag)
+            Event.objects.create(time=timezone.now(), _type='EVENT', title=tag, description=tag)
+            JoinRequest.objects.create(email='join-{}@example.com'.format(tag), name=tag)
+            notification = Notification.objects.create(_type='event', content=tag, to_only_admin=False)
+            UserNotification.objects.create(user=self.admin, notification=notification)
+
+    def get_list_paths(self):
+        paths = []
+        for prefix, viewset, basename in router.registry:
+            for route in router.get_routes(viewset):
+                if 'get' in route.mapping and '{lookup}' not in route.url:
+                    paths.append('/' + route.url.format(
+                        prefix=prefix,
+                        trailing_slash=router.trailing_slash
+                    ).lstrip('^').rstrip('$'))
+        return paths
+
+    def count_queries(self, path):
+        # responses cached under versions which the rolled back test never bumps
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+        return response.status_code, len(primary) + len(replica)
+
+    def count_all_queries(self, paths):
+        # the first read marks the new notifications as seen, the counted one reads the same state
+        for path in paths:
+            self.count_queries(path)
+        return {path: self.count_queries(path) for path in paths}
+
+    def test_query_count_does_not_grow_with_rows(self):
+        paths = self.get_list_paths()
+
+        self.add_rows(3)
+        counts = self.count_all_queries(paths)
+        self.add_rows(3)
+
+        for path, count in self.count_all_queries(paths).items():
+            with self.subTest(path=path):
+                self.assertEqual(count, counts[path])
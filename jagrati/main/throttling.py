@@ -0,0 +1,162 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.throttling import SimpleRateThrottle
+
+# bucket slot: key fingerprint, tokens left, time of the last update
+SLOT = struct.Struct('<Qdd')
+
+
+class SharedBucketStore(object):
+    """
+    Token buckets in a memory-mapped file, shared by every worker process of a host
+    without a cache server. Keys are hashed to one of `num_slots` fixed slots, each
+    locked on its own with a POSIX record lock while it is updated. A slot holding
+    the bucket of another key is taken over once that bucket is full again (idle),
+    until then both keys share it, which errs on the side of throttling.
+    """
+
+    def __init__(self, path, num_slots):
+        self.path = path
+        self.num_slots = num_slots
+        self.pid = None
+        self.fd = None
+        self.map = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        # mapped again after a fork, the descriptor's record locks belong to one process
+        if self.pid == os.getpid():
+            return
+
+        size = SLOT.size * self.num_slots
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+
+        self.fd, self.map, self.pid = fd, mmap.mmap(fd, size), os.getpid()
+
+    def consume(self, key, capacity, rate):
+        """
+        :desc: Takes one token from the bucket of `key`, refilled at `rate` tokens per
+               second up to `capacity`.
+        :return: tuple of whether a token was taken and the seconds until the next one
+        """
+
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        fingerprint = int.from_bytes(digest, 'little')
+        offset = (fingerprint % self.num_slots) * SLOT.size
+
+        with self.lock:
+            self.open()
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                now = time.time()
+                owner, tokens, updated_at = SLOT.unpack_from(self.map, offset)
+                tokens = min(capacity, tokens + max(now - updated_at, 0) * rate)
+                if owner != fingerprint and (not owner or tokens >= capacity):
+                    owner, tokens = fingerprint, capacity
+
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self.map, offset, owner, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+_store = None
+
+
+def get_store():
+    global _store
+
+    if _store is None:
+        _store = SharedBucketStore(
+            getattr(settings, 'THROTTLE_FILE', os.path.join(settings.BASE_DIR, 'cache', 'throttle')),
+            getattr(settings, 'THROTTLE_SLOTS', 65536)
+        )
+    return _store
+
+
+class SharedTokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket throttle on the shared store. The rate `<number>/<period>` of the
+    `scope` in `DEFAULT_THROTTLE_RATES` is both the burst size and the refill rate.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        allowed, self.wait_time = get_store().consume(
+            self.key,
+            self.num_requests,
+            self.num_requests / self.duration
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class AnonymousPOSTThrottle(SharedTokenBucketThrottle):
+    """
+    Throttles anonymous POSTs by the `get_ident_for_post(request)` of the subclass.
+    """
+
+    def get_cache_key(self, request, view):
+        if request.method != 'POST' or request.user.is_authenticated:
+            return None
+
+        ident = self.get_ident_for_post(request)
+        if not ident:
+            return None
+
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class JoinRequestIPThrottle(AnonymousPOSTThrottle):
+    scope = 'join_request_ip'
+
+    def get_ident_for_post(self, request):
+        return self.get_ident(request)
+
+
+class JoinRequestDomainThrottle(AnonymousPOSTThrottle):
+    """
+    Throttles join requests by the domain of their email, after `JoinRequestIPThrottle`
+    in `throttle_classes` so only the requests an IP may send take a domain token.
+    Shared webmail domains (`JOIN_REQUEST_WEBMAIL_DOMAINS`) are left to the IP throttle.
+    """
+
+    scope = 'join_request_domain'
+
+    def get_ident_for_post(self, request):
+        try:
+            email = request.data.get('email')
+        except (AttributeError, ParseError):
+            return None
+
+        if not isinstance(email, str) or '@' not in email:
+            return None
+
+        domain = email.rsplit('@', 1)[1].strip().lower()
+        if domain in getattr(settings, 'JOIN_REQUEST_WEBMAIL_DOMAINS', ()):
+            return None
+
+        return domain
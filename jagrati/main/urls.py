@@ -1,8 +1,9 @@
 from django.conf.urls import url
 from rest_framework.routers import DefaultRouter
 
-from .views import (AttendaceViewSet, ClassViewSet, ClassFeedbackViewSet,
-                    ConfigViewSet, JoinRequestViewSet, EventViewSet,
+from .views import (AttendaceViewSet, AttendanceReportViewSet, ClassViewSet,
+                    ClassFeedbackViewSet, ConfigViewSet, JoinRequestViewSet, EventViewSet,
+                    HobbyViewSet, MetricsViewSet, NotificationViewSet, SkillViewSet,
                     StudentFeedbackViewSet, StudentProfileViewSet, SubjectViewSet,
                     SyllabusViewSet, UserHobbyViewSet, UserNotificationViewSet,
                     UserSkillViewSet, UserViewSet, VolunteerProfileViewSet,
@@ -13,8 +14,11 @@ router.register(r'users', UserViewSet)
 router.register(r'classes', ClassViewSet)
 router.register(r'volunteers', VolunteerProfileViewSet)
 router.register(r'attendance', AttendaceViewSet)
+router.register(r'attendance_reports', AttendanceReportViewSet, base_name='attendance_reports')
 router.register(r'students', StudentProfileViewSet)
 router.register(r'events', EventViewSet)
+router.register(r'hobbies', HobbyViewSet)
+router.register(r'skills', SkillViewSet)
 router.register(r'user_hobbies', UserHobbyViewSet)
 router.register(r'user_skills', UserSkillViewSet)
 router.register(r'syllabus', SyllabusViewSet)
@@ -24,6 +28,8 @@ router.register(r'subjects', SubjectViewSet)
 router.register(r'department', VolunteerSubjectViewSet)
 router.register(r'join_requests', JoinRequestViewSet)
 router.register(r'user_notifications', UserNotificationViewSet)
+router.register(r'notifications', NotificationViewSet)
 router.register(r'config', ConfigViewSet)
+router.register(r'metrics', MetricsViewSet, base_name='metrics')
 
 urlpatterns = router.urls
@@ -1,44 +1,72 @@
+import os
 import random
 import string
 
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.db import transaction
 from django_filters import rest_framework as filters
 from rest_framework import status, viewsets
 from rest_framework.decorators import detail_route, list_route
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import (Attendance, Class, ClassFeedback, Config, Event, JoinRequest,
-                     Notification, StudentFeedback, StudentProfile, Subject,
+from .analytics import (compute_metrics, get_at_risk_indices, get_class_report,
+                        get_student_report, load_attendance, )
+from .attendance import record_attendance
+from . import db_pool, mailer
+from .cache import CachedResponseMixin, ConditionalGetMixin
+from .directory import get_department_directory
+from .exports import export_attendance, export_students, export_volunteers
+from .identity import user_exists, username_exists
+from .imports import import_students
+from .mailer import queue_mail
+from .mixins import EagerLoadingMixin
+from .models import (Attendance, Class, ClassFeedback, Config, Event, Hobby, JoinRequest,
+                     Notification, Skill, StudentFeedback, StudentProfile, Subject,
                      Syllabus, UserHobby, UserNotification, UserProfile,
-                     UserSkill, VolunteerSubject, )
+                     UserSkill, VolunteerClass, VolunteerSubject, )
+from .notifications import get_feed, get_read_position, get_unread_count, mark_page_seen
 from .permissions import IsAnonymousUserForPOST, IsOwner
-from .serializers import (AttendanceSerializer, ClassSerializer,
-                          ClassFeedbackSerializer, ConfigSerializer, EventSerializer,
-                          JoinRequestSerializer, NotificationSerializer,
-                          StudentFeedbackSerializer, StudentProfileSerializer,
+from .roster import get_class_dashboard
+from .serializers import (AttendanceReportSerializer, AttendanceSerializer,
+                          ClassSerializer, ClassFeedbackSerializer, ConfigSerializer, EventSerializer,
+                          HobbySerializer, JoinRequestSerializer, MarkAttendanceSerializer,
+                          NotificationFeedSerializer, NotificationSerializer,
+                          SkillSerializer, StudentFeedbackSerializer, StudentProfileSerializer,
                           SubjectSerializer, SyllabusSerializer,
                           UserHobbySerializer, UserNotificationSerializer,
                           UserProfileSerializer, UserSerializer,
                           UserSkillSerializer, VolunteerSubjectSerializer, )
+from .throttling import JoinRequestDomainThrottle, JoinRequestIPThrottle
 
 DEFAULT_REJECTION_MSG = 'Sorry, we can\'t take you in our team.'
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
 
-class ClassViewSet(viewsets.ModelViewSet):
+class ClassViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                   viewsets.ModelViewSet):
     queryset = Class.objects.all()
     serializer_class = ClassSerializer
+    cache_models = (Class, StudentProfile, User, VolunteerClass, Attendance, )
 
+    @list_route(methods=['get'])
+    def dashboard(self, request):
+        """
+        Response: list of classes with `num_active_students`, `num_inactive_students`,
+                  `volunteers` and `last_attendance_date`
+        """
+
+        return self.get_cached_response(request, lambda: Response(get_class_dashboard()))
 
-class VolunteerProfileViewSet(viewsets.ModelViewSet):
+
+class VolunteerProfileViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
+    cache_models = (User, UserHobby, Hobby, UserSkill, Skill, Attendance, )
     lookup_field = 'user__id'
     permission_classes = (IsAuthenticated, IsOwner, )
     filter_backends = (filters.DjangoFilterBackend, )
@@ -66,10 +94,19 @@ class VolunteerProfileViewSet(viewsets.ModelViewSet):
             'detail': 'You do not have permission to perform this action.'
         })
 
+    @list_route(methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Response: streamed CSV of all volunteer profiles
+        """
+
+        return export_volunteers()
 
-class StudentProfileViewSet(viewsets.ModelViewSet):
+
+class StudentProfileViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = StudentProfile.objects.all()
     serializer_class = StudentProfileSerializer
+    cache_models = (User, Class, StudentProfile, Attendance, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('_class', 'user__is_active', )
     lookup_field = 'user__id'
@@ -138,10 +175,60 @@ class StudentProfileViewSet(viewsets.ModelViewSet):
                 'message': 'Required fields - first_name/class_num not present.'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    @list_route(methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Query Params:
+          - `class_id` (integer, optional)
+        Response: streamed CSV roster of the students with their attendance summary
+        """
+
+        class_id = request.query_params.get('class_id', None)
+
+        if class_id is not None and not class_id.isdigit():
+            return Response({
+                'success': False,
+                'detail': 'Invalid class_id.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return export_students(class_id)
+
+    @list_route(methods=['post'], permission_classes=[IsAdminUser])
+    def import_csv(self, request):
+        """
+        :desc: Creates students in bulk from an uploaded CSV file. Valid rows are
+               imported, invalid rows are listed with their errors.
+        :body: `file` CSV with the `first_name`, `class_num`, `last_name` and student
+               profile columns
+               `dry_run` (boolean, optional) only validates the rows
+        """
+
+        csv_file = request.FILES.get('file')
+
+        if csv_file is None:
+            return Response({
+                'success': False,
+                'detail': 'Missing required file.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        report = import_students(csv_file, dry_run=dry_run)
+        report['success'] = not report['errors']
+
+        if report['created']:
+            response_status = status.HTTP_201_CREATED
+        elif report['errors']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+
+        return Response(report, status=response_status)
 
-class AttendaceViewSet(viewsets.ModelViewSet):
+
+class AttendaceViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
+    cache_models = (User, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('class_date', )
 
@@ -165,6 +252,51 @@ class AttendaceViewSet(viewsets.ModelViewSet):
         return attendance_objs, errors
 
 
+    @list_route(methods=['post'])
+    def mark(self, request):
+        """
+        :desc: Marks attendance of a class on a date in one batch. Attendance which
+               is already stored is skipped, so a submission can be safely retried.
+        :body: `class_id` (integer, optional) students must belong to this class
+               `class_date` (date, defaults to today)
+               `user_ids` list of user IDs present in the class
+               `extra_user_ids` list of user IDs present in the extra class
+        """
+
+        serializer = MarkAttendanceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        attendance_objs = record_attendance(
+            data['class_date'],
+            data['user_ids'],
+            data['extra_user_ids']
+        )
+        num_requested = len(set(data['user_ids'])) + len(set(data['extra_user_ids']))
+
+        return Response({
+            'success': True,
+            'class_date': data['class_date'],
+            'created': len(attendance_objs),
+            'existing': num_requested - len(attendance_objs)
+        }, status=status.HTTP_201_CREATED if attendance_objs else status.HTTP_200_OK)
+
+    @list_route(methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Query Params:
+          - `start` (date, defaults to 180 days before `end`)
+          - `end` (date, defaults to today)
+          - `class_id` (integer, optional)
+        Response: streamed CSV register, one row per attendance ordered by date
+        """
+
+        serializer = AttendanceReportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        return export_attendance(data['start'], data['end'], data.get('class_id'))
+
     @list_route(methods=['get'])
     def class_dates(self, request):
         """
@@ -182,8 +314,8 @@ class AttendaceViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         attendance_dates = Attendance.objects.filter(
-            _class=class_id
-        ).values_list('class_date', flat=True).distinct()
+            user__student_profile___class=class_id
+        ).order_by('class_date').values_list('class_date', flat=True).distinct()
 
         return Response({
             'success': True,
@@ -191,6 +323,82 @@ class AttendaceViewSet(viewsets.ModelViewSet):
         })
 
 
+class AttendanceReportViewSet(CachedResponseMixin, viewsets.ViewSet):
+    """
+    Read-only attendance analytics computed by `main.analytics`.
+
+    Query Params (all routes):
+      - `start` (date, defaults to 180 days before `end`)
+      - `end` (date, defaults to today)
+      - `class_id` (integer, optional)
+    """
+
+    cache_models = (Attendance, StudentProfile, User, )
+
+    def list(self, request):
+        """
+        Response: names of the available reports
+        """
+
+        return Response({'success': True, 'reports': ['students', 'classes', 'at_risk']})
+
+    def get_metrics(self, request, include_inactive=False):
+        serializer = AttendanceReportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        self.params = serializer.validated_data
+
+        matrix = load_attendance(self.params['start'], self.params['end'], self.params.get('class_id'),
+                                 include_inactive)
+        return matrix, compute_metrics(matrix)
+
+    def get_report(self, request, build_report, include_inactive=False):
+        def get_response():
+            matrix, metrics = self.get_metrics(request, include_inactive)
+            return Response({
+                'success': True,
+                'start': self.params['start'],
+                'end': self.params['end'],
+                'results': build_report(matrix, metrics)
+            })
+
+        return self.get_cached_response(request, get_response)
+
+    @list_route(methods=['get'])
+    def students(self, request):
+        """
+        Response: per-student `percentage`, `days_present`, `num_class_days`, `extra_days`,
+                  `longest_streak`, `current_streak` and `current_absences`
+        """
+
+        return self.get_report(request, get_student_report)
+
+    @list_route(methods=['get'])
+    def classes(self, request):
+        """
+        Response: per-class `num_students`, `num_class_days`, `percentage` and `monthly`
+                  percentages
+        """
+
+        return self.get_report(request, lambda matrix, metrics: get_class_report(metrics))
+
+    @list_route(methods=['get'])
+    def at_risk(self, request):
+        """
+        Query Params:
+          - `min_percentage` (number, default 60)
+          - `max_absences` (integer, default 3)
+        Response: students below `min_percentage` or absent from the last `max_absences`
+                  classes, lowest percentage first. Includes the students deactivated for
+                  not attending (`is_active` false).
+        """
+
+        return self.get_report(request, lambda matrix, metrics: get_student_report(
+            matrix,
+            metrics,
+            get_at_risk_indices(metrics, self.params['min_percentage'], self.params['max_absences'])
+        ), include_inactive=True)
+
+
 class EventFilterSet(filters.FilterSet):
     created_at__gt = filters.IsoDateTimeFilter(name='created_at', lookup_expr='gt')
 
@@ -199,69 +407,106 @@ class EventFilterSet(filters.FilterSet):
         fields = ('created_at__gt', )
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
+    cursor_ordering = ('-created_at', '-id')
     filter_backends = (filters.DjangoFilterBackend, )
     filter_class = EventFilterSet
 
 
-class UserHobbyViewSet(viewsets.ModelViewSet):
+class HobbyViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                   viewsets.ModelViewSet):
+    queryset = Hobby.objects.all()
+    serializer_class = HobbySerializer
+    cache_models = (Hobby, )
+
+
+class SkillViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                   viewsets.ModelViewSet):
+    queryset = Skill.objects.all()
+    serializer_class = SkillSerializer
+    cache_models = (Skill, )
+
+
+class UserHobbyViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = UserHobby.objects.all()
     serializer_class = UserHobbySerializer
+    cache_models = (User, Hobby, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('user', 'hobby', )
 
 
-class UserSkillViewSet(viewsets.ModelViewSet):
+class UserSkillViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = UserSkill.objects.all()
     serializer_class = UserSkillSerializer
+    cache_models = (User, Skill, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('user', 'skill', )
 
 
-class SyllabusViewSet(viewsets.ModelViewSet):
+class SyllabusViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                      viewsets.ModelViewSet):
     queryset = Syllabus.objects.all()
     serializer_class = SyllabusSerializer
+    cache_models = (Syllabus, Class, StudentProfile, Subject, User, VolunteerSubject, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('_class', )
 
 
-class ClassFeedbackViewSet(viewsets.ModelViewSet):
+class ClassFeedbackViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = ClassFeedback.objects.all().order_by('-created_at')
     serializer_class = ClassFeedbackSerializer
+    cache_models = (Class, StudentProfile, Subject, User, VolunteerSubject, )
+    cursor_ordering = ('-created_at', '-id')
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('_class', )
     lookup_field = '_class__id'
 
 
-class StudentFeedbackViewSet(viewsets.ModelViewSet):
+class StudentFeedbackViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = StudentFeedback.objects.all()
     serializer_class = StudentFeedbackSerializer
+    cache_models = (User, )
 
 
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                     viewsets.ModelViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    cache_models = (Subject, VolunteerSubject, )
 
 
-class VolunteerSubjectViewSet(viewsets.ModelViewSet):
+class VolunteerSubjectViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                              viewsets.ModelViewSet):
     queryset = VolunteerSubject.objects.all()
     serializer_class = VolunteerSubjectSerializer
+    cache_models = (VolunteerSubject, User, Subject, UserProfile, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('subject', 'volunteer', )
 
+    @list_route(methods=['get'])
+    def directory(self, request):
+        """
+        Response: list of subjects with `num_volunteers` and their `volunteers`, each
+                  with `discipline` and `display_picture`
+        """
+
+        return self.get_cached_response(request, lambda: Response(get_department_directory()))
 
-class JoinRequestViewSet(viewsets.ModelViewSet):
+
+class JoinRequestViewSet(ConditionalGetMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = JoinRequest.objects.all()
     serializer_class = JoinRequestSerializer
+    cursor_ordering = ('-created_at', '-id')
     permission_classes = (IsAnonymousUserForPOST, )
+    throttle_classes = (JoinRequestIPThrottle, JoinRequestDomainThrottle, )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('status', )
 
     def create(self, request, *args, **kwargs):
         email = request.data.get('email')
-        if email in User.objects.all().values_list('username', flat=True):
+        if user_exists(email, request):
             return Response({
                 'success': False,
                 'detail': 'A user already exists with this email id.'
@@ -270,6 +515,7 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
     @detail_route(methods=['put'])
+    @transaction.atomic
     def process(self, request, pk):
         """
         :desc: Processes the join request for approval/rejection
@@ -281,7 +527,7 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
 
         if process_type:
             try:
-                join_req_obj = JoinRequest.objects.get(id=pk)
+                join_req_obj = JoinRequest.objects.select_for_update().get(id=pk)
             except JoinRequest.DoesNotExist:
                 return Response({
                     'success': False,
@@ -293,7 +539,7 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
 
             if join_req_obj.status == 'PENDING':
                 if process_type == 'A':
-                    if email in User.objects.all().values_list('username', flat=True):
+                    if username_exists(email):
                         return Response({
                             'success': False,
                             'detail': 'User with email already exists.'
@@ -315,13 +561,7 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
                                Password: {password}'.format(username=email, password=password)
                     from_email = 'support@jagrati.com'
                     to_email = [email]
-                    send_mail(
-                        subject,
-                        message,
-                        from_email,
-                        to_email,
-                        fail_silently=False
-                    )
+                    queue_mail(subject, message, from_email, to_email)
 
                     join_req_obj.status = 'APPROVED'
                     join_req_obj.save()
@@ -331,13 +571,7 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
                     message = request.data.get('message') or DEFAULT_REJECTION_MSG
                     from_email = 'support@jagrati.com'
                     to_email = [email]
-                    send_mail(
-                        subject,
-                        message,
-                        from_email,
-                        to_email,
-                        fail_silently=False
-                    )
+                    queue_mail(subject, message, from_email, to_email)
 
                     join_req_obj.status = 'REJECTED'
                     join_req_obj.save()
@@ -369,9 +603,10 @@ class JoinRequestViewSet(viewsets.ModelViewSet):
         )
 
 
-class UserNotificationViewSet(viewsets.ModelViewSet):
+class UserNotificationViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = UserNotification.objects.all()
     serializer_class = UserNotificationSerializer
+    cursor_ordering = ('-id', )
     filter_backends = (filters.DjangoFilterBackend, )
     filter_fields = ('is_seen', )
 
@@ -379,13 +614,94 @@ class UserNotificationViewSet(viewsets.ModelViewSet):
         return UserNotification.objects.filter(user=self.request.user)
 
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        queryset = self.get_queryset()
-        queryset.update(is_seen=True)
-        return response
+        """
+        :desc: Lists a page of notifications and marks only that page as seen.
+        """
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        user_notifications = page if page is not None else list(queryset)
+        data = self.get_serializer(user_notifications, many=True).data
+
+        unseen_ids = [user_notification.id for user_notification in user_notifications
+                      if not user_notification.is_seen]
+        if unseen_ids:
+            UserNotification.objects.filter(id__in=unseen_ids).update(is_seen=True)
 
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
-class ConfigViewSet(viewsets.ModelViewSet):
+    @list_route(methods=['get'])
+    def unread_count(self, request):
+        return Response({
+            'success': True,
+            'unread_count': get_unread_count(request.user)
+        })
+
+
+class NotificationViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Notification feed of the requesting user when `NOTIFICATION_FANOUT` is `pull`.
+    """
+
+    queryset = Notification.objects.all()
+    serializer_class = NotificationFeedSerializer
+    cursor_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        return get_feed(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['last_seen_id'], context['seen_ids'] = get_read_position(self.request.user)
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """
+        :desc: Lists a page of the feed and marks that page only as seen.
+        """
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        notifications = page if page is not None else list(queryset)
+        serializer = self.get_serializer(notifications, many=True)
+        data = serializer.data
+
+        mark_page_seen(request.user, notifications, serializer.context['last_seen_id'],
+                       serializer.context['seen_ids'])
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @list_route(methods=['get'])
+    def unread_count(self, request):
+        return Response({
+            'success': True,
+            'unread_count': get_unread_count(request.user)
+        })
+
+
+class ConfigViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin,
+                    viewsets.ModelViewSet):
     queryset = Config.objects.all()
     serializer_class = ConfigSerializer
+    cache_models = (Config, )
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    Counters of the database connection pools and the mail workers of the process
+    answering the request, since it started.
+    """
+
+    permission_classes = (IsAdminUser, )
 
+    def list(self, request):
+        return Response({
+            'success': True,
+            'pid': os.getpid(),
+            'db_pool': db_pool.get_metrics(),
+            'mail': mailer.get_metrics(),
+        })
@@ -0,0 +1,19 @@
+"""
+ASGI config for jagrati project.
+
+It exposes the ASGI application of Channels as a module-level variable named
+``application``, served by daphne:
+
+    daphne -b 0.0.0.0 -p 8000 server.asgi:application
+"""
+
+import os
+
+import django
+from channels.routing import get_default_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+
+django.setup()
+
+application = get_default_application()
@@ -1,15 +1,22 @@
+from rest_framework_jwt.settings import api_settings
+
+
 def jwt_response_payload_handler(token, user=None, request=None):
     """
-    :desc: Overriden handler to add extra data in response
+    :desc: Overriden handler to add extra data in response: the claims the token
+           is authenticated with (`main.authentication`) and when it expires
     """
 
     if user is not None:
-        is_admin = user.is_superuser
+        is_admin, is_staff, user_id, username = user.is_superuser, user.is_staff, user.id, user.username
     else:
-        is_admin = False
+        is_admin, is_staff, user_id, username = False, False, None, None
 
     return {
         'token': token,
         'is_admin': is_admin,
-        'user_id': user.id
-    }
\ No newline at end of file
+        'is_staff': is_staff,
+        'user_id': user_id,
+        'username': username,
+        'expires_at': api_settings.JWT_DECODE_HANDLER(token).get('exp')
+    }
@@ -0,0 +1,17 @@
+from channels.routing import ProtocolTypeRouter, URLRouter
+from django.conf.urls import url
+
+from main.consumers import (ClassFeedConsumer, DjangoConsumer, EventFeedConsumer,
+                            NotificationFeedConsumer, )
+
+# The most polled lists answer long polls, every other request goes through the
+# Django handler as under WSGI, both in the bounded thread pool of main.consumers
+application = ProtocolTypeRouter({
+    'http': URLRouter([
+        url(r'^notifications/$', NotificationFeedConsumer),
+        url(r'^user_notifications/$', NotificationFeedConsumer),
+        url(r'^events/$', EventFeedConsumer),
+        url(r'^classes/$', ClassFeedConsumer),
+        url(r'', DjangoConsumer),
+    ]),
+})
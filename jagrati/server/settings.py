@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 import environ
 import datetime
 import os
+import sys
 
 from corsheaders.defaults import default_headers
 
@@ -30,10 +31,21 @@ env = environ.Env()
 env.read_env(os.path.join(BASE_DIR, '.env'))
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = env('DEBUG')
+DEBUG = env.bool('DEBUG', default=False)
 
 MEDIA_URL = '/uploads/'
 MEDIA_ROOT = os.path.join(BASE_DIR, '')
+DEFAULT_FILE_STORAGE = 'main.storage.HashedFileSystemStorage'
+
+# Media is served by main.media.MediaView after its permission check. MEDIA_SENDFILE hands
+# the transfer to the web server: 'nginx' (X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an
+# `internal` location aliased to MEDIA_ROOT) or 'apache' (X-Sendfile, mod_xsendfile)
+MEDIA_SENDFILE = env('MEDIA_SENDFILE', default='')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+# Signed media URLs expire after MEDIA_SIGNATURE_MAX_AGE seconds; a URL is reused for half
+# of it, so responses holding URLs are cached and validated for that window only
+MEDIA_SIGNATURE_MAX_AGE = 60 * 60 * 24 * 2
 
 ALLOWED_HOSTS = ['*']
 
@@ -51,11 +63,13 @@ INSTALLED_APPS = [
     'corsheaders',
     'django_filters',
     'django_crontab',
+    'channels',
     'main',
 ]
 
 CRONJOBS = [
     ('58 23 * * *', 'main.crons.update_inactive_students'),
+    ('*/5 * * * *', 'main.mailer.drain'),
 ]
 
 MIDDLEWARE = [
@@ -67,8 +81,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main.middleware.NPlusOneGuardMiddleware',
+    'main.middleware.ReplicaPinningMiddleware',
 ]
 
+TESTING = sys.argv[1:2] == ['test']
+
+# Logs requests running the same SQL statement more than NPLUSONE_THRESHOLD times in
+# development, main.tests.QueryCountTests catches the list endpoints that scale with rows
+NPLUSONE_GUARD = DEBUG
+NPLUSONE_THRESHOLD = 10
+
 # Enable CORS
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
@@ -78,27 +101,95 @@ CORS_ORIGIN_WHITELIST = (
 CORS_ALLOW_HEADERS = default_headers + (
     'enctype',
 )
+CORS_EXPOSE_HEADERS = (
+    'X-Feed-Version',
+)
 
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 465
 EMAIL_HOST_USER=env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD=env('EMAIL_HOST_PASSWORD')
 EMAIL_USE_SSL = True
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_mails')
+
+# Outbox (main.mailer): mails are queued in the database and sent after commit by a
+# per-process pool of MAIL_WORKERS threads, 0 sends synchronously after commit
+MAIL_WORKERS = env.int('MAIL_WORKERS', default=2)
+MAIL_BATCH_SIZE = 50
+MAIL_POLL_INTERVAL = 60
+MAIL_MAX_ATTEMPTS = 5
+MAIL_RETRY_BACKOFF = 30
+MAIL_CLAIM_TIMEOUT = 300
+
+# Model versions, cached responses, replica pins and token revocations (main.cache,
+# main.routers, main.authentication) must be seen by every worker, so the default cache is
+# shared by the processes of a host through files under CACHE_DIR. The file cache lists
+# its directory on every write and has no atomic incr, so production should set CACHE_URL
+# to memcached or redis, e.g. memcache://127.0.0.1:11211, which workers on several hosts
+# can share too
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+CACHES = {
+    'default': env.cache('CACHE_URL', default='filecache://{}?max_entries=5000'.format(CACHE_DIR)),
+}
+# the test suite runs in one process on a cache of its own
+if TESTING:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+# entries without a timeout of their own, model versions included, never expire. Backends
+# without a native incr, like the file cache, write the key again with this timeout
+CACHES['default']['TIMEOUT'] = None
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Thumbnails and compressed copies of uploaded pictures (main.images) are rendered
+# after commit by IMAGE_WORKERS threads per process, 0 renders them synchronously
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', default=2)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'main.authentication.CachedJSONWebTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.KeysetCursorPagination',
+    'DEFAULT_THROTTLE_RATES': {
+        'join_request_ip': env('JOIN_REQUEST_IP_RATE', default='5/hour'),
+        'join_request_domain': env('JOIN_REQUEST_DOMAIN_RATE', default='60/hour'),
+    },
+    # clients are told apart by REMOTE_ADDR, behind nginx set NUM_PROXIES=1 to take the
+    # address it appends to X-Forwarded-For, never the part a client can write
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0),
 }
+# Join requests from these shared webmail domains are only throttled per IP, one client
+# posting with a made-up address of them must not shut out their real users
+JOIN_REQUEST_WEBMAIL_DOMAINS = ('gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.co.in', 'outlook.com',
+                                'hotmail.com', 'live.com', 'icloud.com', 'rediffmail.com',
+                                'protonmail.com', )
+
+# Token buckets of main.throttling, shared by the workers of a host through this mapped file
+# (THROTTLE_SLOTS buckets of 24 bytes) under CACHE_DIR, or point it to a tmpfs such as /dev/shm
+THROTTLE_FILE = env('THROTTLE_FILE', default=os.path.join(CACHE_DIR, 'throttle'))
+THROTTLE_SLOTS = 65536
+
+# Verified token claims are kept in a per-process LRU (main.authentication) of AUTH_CACHE_SIZE
+# tokens for AUTH_CACHE_TTL seconds, user changes revoke them through CACHES
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TTL = 60 * 5
+
+# Seconds between rebuilds of the in-process username filter (main.identity) after users change
+IDENTITY_FILTER_REBUILD_INTERVAL = 60
 
 JWT_AUTH = {
     'JWT_EXPIRATION_DELTA': datetime.timedelta(days=180),
     'JWT_RESPONSE_PAYLOAD_HANDLER': 'server.jwt_utils.jwt_response_payload_handler'
 }
 
+# 'bulk' inserts one UserNotification per recipient in batches, 'pull' stores only the
+# Notification and each user reads the /notifications feed by audience with a read cursor
+NOTIFICATION_FANOUT = env('NOTIFICATION_FANOUT', default='bulk')
+
 ROOT_URLCONF = 'server.urls'
 
 TEMPLATES = [
@@ -119,21 +210,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'server.wsgi.application'
 
+# ASGI deployment (daphne server.asgi:application): requests run in a per-process pool
+# of ASGI_THREADS threads, keep DB_POOL_SIZE at least as large. Long polls of the feeds
+# wait up to LONG_POLL_MAX_WAIT seconds, versions are checked every LONG_POLL_INTERVAL
+ASGI_APPLICATION = 'server.routing.application'
+ASGI_THREADS = env.int('ASGI_THREADS', default=8)
+LONG_POLL_MAX_WAIT = 60
+LONG_POLL_INTERVAL = 1
+
 
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
+DB_POOL_SIZE = env.int('DB_POOL_SIZE', default=10)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'main.mysql_pool',
         'NAME': env('DB_NAME'),
         'USER': env('DB_USER'),
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
-        'PORT': '3306'
+        'PORT': '3306',
+        # per-process pool of main.db_pool, DB_POOL_SIZE=0 opens a connection per request
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'MAX_LIFETIME': 60 * 30,
+            'TIMEOUT': 10,
+        } if DB_POOL_SIZE else None,
     }
 }
 
+# Read replicas of `default` (comma separated hosts in DB_REPLICA_HOSTS) answer the queries
+# of safe requests, a client which wrote reads from the primary for REPLICA_PIN_SECONDS
+DATABASE_REPLICAS = []
+for index, host in enumerate(env.list('DB_REPLICA_HOSTS', default=[])):
+    alias = 'replica{}'.format(index + 1)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+# The test suite runs on two local SQLite databases standing in for primary and replica
+if TESTING:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'test_primary.sqlite3'),
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'test_replica.sqlite3'),
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'SECURITY_DEFINITIONS': {
@@ -16,17 +16,19 @@ Including another URLconf
 """
 from django.conf import settings
 from django.conf.urls import url, include
-from django.conf.urls.static import static
 from django.contrib import admin
 from rest_framework_jwt.views import obtain_jwt_token
 from rest_framework_swagger.views import get_swagger_view
 
+from main.media import MediaView
+
 schema_view = get_swagger_view(title="Jagrati API")
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^$', schema_view),
     url(r'^login/$', obtain_jwt_token),
+    url(r'^{}(?P<path>.+)$'.format(settings.MEDIA_URL.lstrip('/')), MediaView.as_view(), name='media'),
     url(r'^', include('main.urls'))
 ]
 
@@ -35,4 +37,4 @@ if settings.DEBUG:
 
     urlpatterns += [
         url(r'^__debug__/', include(debug_toolbar.urls)),
-    ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    ]